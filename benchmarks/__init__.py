@@ -0,0 +1,4 @@
+"""Benchmark suite for workflow, agent, tool and scorer hot paths.
+
+Run as `python -m benchmarks` or `pytest benchmarks`; see benchmarks/README.md.
+"""
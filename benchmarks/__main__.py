@@ -0,0 +1,40 @@
+"""Run the benchmark suite: python -m benchmarks [-k PATTERN ...] [-o results.json]"""
+
+import argparse
+
+from benchmarks import cases  # noqa: F401  (registers the benchmarks)
+from benchmarks.harness import format_table, quiet_logging, run_case, select, write_json
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark workflow, agent, tool and scorer hot paths.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("-k", "--filter", action="append", default=None,
+                        help="Only run benchmarks whose id contains this string. Repeatable.")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Write results as JSON to this file.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every benchmark's iteration count.")
+    parser.add_argument("--list", action="store_true", help="List benchmark ids and exit.")
+    args = parser.parse_args()
+
+    selected = select(args.filter)
+    if args.list:
+        print("\n".join(case.id for case in selected))
+        return
+
+    quiet_logging()
+    results = []
+    for case in selected:
+        results.append(run_case(case, scale=args.scale))
+        print(format_table(results[-1:]).splitlines()[-1], flush=True)
+
+    print()
+    print(format_table(results))
+    if args.output:
+        write_json(results, args.output)
+        print(f"\nResults written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
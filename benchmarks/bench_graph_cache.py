@@ -0,0 +1,50 @@
+"""Microbenchmark: per-request workflow setup overhead with and without the graph cache.
+
+`cli.evaluate` builds a new workflow instance per dataset row. Before the cache,
+each instance paid for build_workflow() + compile(); now new instances reuse the
+process-wide compiled graph.
+
+Usage:
+    python benchmarks/bench_graph_cache.py [--iterations N]
+"""
+
+import argparse
+import logging
+import time
+
+from ensemble_phase_2_poc.cli import WORKFLOW_REGISTRY
+
+
+def _per_call_ms(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    # Building a workflow logs at INFO, which would dominate the measurement
+    logging.disable(logging.INFO)
+
+    for name, workflow_class in WORKFLOW_REGISTRY.items():
+        workflow_class.clear_graph_cache()
+
+        # Before: every new instance built and compiled its own graph
+        uncached = _per_call_ms(
+            lambda cls=workflow_class: cls().build_workflow().compile(), args.iterations
+        )
+        # After: new instances resolve the shared compiled graph
+        cached = _per_call_ms(lambda cls=workflow_class: cls().agent, args.iterations)
+
+        print(
+            f"{name:<12} uncached {uncached:8.3f} ms/request | "
+            f"cached {cached:8.4f} ms/request | {uncached / cached:8.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
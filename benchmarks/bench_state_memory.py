@@ -0,0 +1,162 @@
+"""Microbenchmark: workflow state memory per in-flight account, by prompt retention.
+
+Nodes used to return `{**state["node_outputs"], node_id: ...}`, copying every
+upstream entry, and each entry kept its full rendered prompt until the account
+finished. Nodes now return only their own entry (merged by the node_outputs
+reducer), and ENSEMBLE_PROMPT_RETENTION can drop or externalize prompts.
+
+Runs a batch of accounts through a chain of no-op nodes whose prompts embed
+account data and every upstream output, with all accounts in flight at once.
+Reports the size of each account's state as its last node runs, and the
+traced peak memory of the batch per account (which also counts transient
+copies and framework overhead, so it is noisier).
+
+Usage:
+    python benchmarks/bench_state_memory.py [--accounts N] [--nodes K] [--prompt-chars P]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from mlflow.types.responses import ResponsesAgentRequest
+
+from ensemble_phase_2_poc.agents.base_agent import BaseAgent
+from ensemble_phase_2_poc.prompt_retention import PROMPT_RETENTION_ENV_VAR
+from ensemble_phase_2_poc.state import NodeExecution, get_node_output
+from ensemble_phase_2_poc.workflow import DAGWorkflow
+
+
+def _deep_size(value, seen: set[int] | None = None) -> int:
+    """Bytes held by `value` and everything it references, counting shared objects once"""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(key, seen) + _deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(item, seen) for item in value)
+    return size
+
+
+def _chain(nodes: int, prompt_chars: int, output_chars: int, state_sizes: list[int]) -> list[BaseAgent]:
+    """`nodes` agents, each depending on all before it. The last records its state size."""
+
+    class ChainAgent(BaseAgent):
+        def __init__(self, index: int):
+            self.index = index
+
+        @property
+        def node_id(self) -> str:
+            return f"node_{self.index}"
+
+        @property
+        def depends_on(self) -> list[str]:
+            return [f"node_{i}" for i in range(self.index)]
+
+        def validate_prompt(self) -> None:
+            pass
+
+        def render_prompt(self, state) -> str:
+            account = (state["account_number"] * prompt_chars)[:prompt_chars]
+            upstream = "\n".join(get_node_output(state, dep) for dep in self.depends_on)
+            return f"{account}\n{upstream}"
+
+        def build_executor(self):
+            return self.build_agent()
+
+        def execute(self, prompt: str, state) -> str:
+            if self.index == nodes - 1:
+                state_sizes.append(_deep_size(state))
+            # Long enough for every account in the batch to be in flight together
+            time.sleep(0.2)
+            return (f"{state['account_number']}:{self.node_id}:" * output_chars)[:output_chars]
+
+    return [ChainAgent(index) for index in range(nodes)]
+
+
+def _copying_update(self, state, prompt, output, usage):
+    """The previous BaseAgent._build_update: copies upstream entries, keeps the prompt"""
+    return {
+        "node_outputs": {
+            **state["node_outputs"],
+            self.node_id: NodeExecution(node_id=self.node_id, input=prompt, output=output, metadata=usage.as_metadata()),
+        },
+        "execution_path": [self.node_id],
+    }
+
+
+def _peak_per_account(workflow: DAGWorkflow, accounts: int) -> float:
+    requests = [
+        ResponsesAgentRequest(
+            input=[],
+            custom_inputs={"account_number": f"ACC-{i:06d}", "client_name": "Acme", "facility_prefix": "FAC", "lob": "Acute"},
+        )
+        for i in range(accounts)
+    ]
+    # Warm the compiled graph outside the measurement
+    workflow.predict(requests[0])
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    result = workflow.predict_batch(requests, max_concurrency=accounts)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert result.num_failed == 0, result.responses[0].error
+    return (peak - baseline) / accounts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=64)
+    parser.add_argument("--nodes", type=int, default=8)
+    parser.add_argument("--prompt-chars", type=int, default=8000)
+    parser.add_argument("--output-chars", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    state_sizes: list[int] = []
+    nodes = _chain(args.nodes, args.prompt_chars, args.output_chars, state_sizes)
+
+    class ChainWorkflow(DAGWorkflow):
+        def nodes(self):
+            return nodes
+
+    workflow = ChainWorkflow()
+    with tempfile.TemporaryDirectory() as directory:
+        variants = [
+            ("copy + keep (before)", "keep", True),
+            ("reducer + keep", "keep", False),
+            ("reducer + drop", "drop", False),
+            ("reducer + externalize", directory, False),
+        ]
+        baseline = None
+        for label, retention, copying in variants:
+            os.environ[PROMPT_RETENTION_ENV_VAR] = retention
+            state_sizes.clear()
+            if copying:
+                with patch.object(BaseAgent, "_build_update", _copying_update):
+                    peak = _peak_per_account(workflow, args.accounts)
+            else:
+                peak = _peak_per_account(workflow, args.accounts)
+            state = statistics.median(state_sizes)
+            baseline = baseline or state
+            print(
+                f"{label:<24} state {state / 1024:8.1f} KiB/account ({state / baseline:4.2f}x) | "
+                f"traced peak {peak / 1024:8.1f} KiB/account"
+            )
+    os.environ.pop(PROMPT_RETENTION_ENV_VAR, None)
+
+
+if __name__ == "__main__":
+    main()
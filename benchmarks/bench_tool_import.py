@@ -0,0 +1,77 @@
+"""Microbenchmark: tool description lookup and `ensemble_phase_2_poc.tools` import time.
+
+Before the description registry, every Tool subclass re-opened and re-parsed
+descriptions.yaml at class definition time (and on every later lookup). Now
+each file is parsed once per process and served from a read-only mapping.
+
+Usage:
+    python benchmarks/bench_tool_import.py [--iterations N] [--imports N]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+import yaml
+
+from ensemble_phase_2_poc.tools.base_tool import FILE_PATH, Tool, _load_tool_descriptions
+
+
+IMPORT_SNIPPET = (
+    "import time, sys; start = time.perf_counter(); "
+    "import ensemble_phase_2_poc.tools; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def _uncached_lookup(name: str) -> str:
+    """The previous get_tool_description: open and parse the file per call"""
+    with open(FILE_PATH, "r") as file:
+        return yaml.safe_load(file)[name]
+
+
+def _per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn("post_account_note")
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _import_seconds(runs: int) -> float:
+    """Median cold import time of the tools package, each run in a fresh interpreter"""
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--imports", type=int, default=5)
+    args = parser.parse_args()
+
+    uncached = _per_call_us(_uncached_lookup, args.iterations)
+    cached = _per_call_us(Tool.get_tool_description, args.iterations)
+    # One uncached parse through the registry's loader, as paid once at import
+    single_parse = _per_call_us(lambda _: _load_tool_descriptions.__wrapped__(FILE_PATH), args.iterations)
+    tool_count = len(Tool.registered_tools)
+
+    print(
+        f"description lookup  uncached {uncached:9.2f} us | cached {cached:7.2f} us | "
+        f"{uncached / cached:6.0f}x"
+    )
+    print(
+        f"parse cost at import  before {uncached * tool_count / 1e3:7.3f} ms ({tool_count} tools) | "
+        f"after {single_parse / 1e3:7.3f} ms (one parse)"
+    )
+    print(f"cold import of ensemble_phase_2_poc.tools (median of {args.imports}): {_import_seconds(args.imports):.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Benchmark definitions. LLM calls go to the simulated provider with zero latency,
+so the numbers measure this repo's own overhead rather than the provider."""
+
+import os
+import subprocess
+import sys
+from typing import Any, Callable
+
+from mlflow.entities import SpanStatusCode, SpanType
+from mlflow.types.responses import ResponsesAgentRequest
+
+from benchmarks.harness import benchmark
+
+
+# Zero-latency, failure-free simulated provider for every get_model() call
+OFFLINE_PROFILE = '{"latency_distribution": "fixed", "latency_mean_ms": 0, "triage_agent_ratio": 1.0}'
+
+ACCOUNT = {
+    "account_number": "ACC-12345",
+    "client_name": "Acme Healthcare",
+    "facility_prefix": "FAC",
+    "lob": "Acute",
+}
+
+TRACE_SIZES = [{"spans": 10}, {"spans": 100}, {"spans": 1000}]
+
+
+def _offline() -> None:
+    os.environ["ENSEMBLE_SIMULATE_LLM"] = OFFLINE_PROFILE
+    os.environ.setdefault("COHERE_API_KEY", "simulated")
+
+
+def _workflow_class(workflow: str):
+    from ensemble_phase_2_poc.cli import WORKFLOW_REGISTRY
+    return WORKFLOW_REGISTRY[workflow]
+
+
+def _state(outputs: int = 1, output_chars: int = 1000) -> dict[str, Any]:
+    """Workflow state with `outputs` upstream node outputs of `output_chars` each"""
+    from ensemble_phase_2_poc.agents import AccountResearchAgent, ResolutionAgent
+    from ensemble_phase_2_poc.state import NodeExecution
+
+    node_ids = [AccountResearchAgent.node_id, ResolutionAgent.node_id] + [f"node_{i}" for i in range(outputs)]
+    node_ids = node_ids[:max(outputs, 2)]
+    return {
+        "node_outputs": {
+            node_id: NodeExecution(node_id=node_id, input="x" * output_chars, output="y" * output_chars, metadata={})
+            for node_id in node_ids
+        },
+        "execution_path": node_ids,
+        **ACCOUNT,
+    }
+
+
+# Workflows
+
+@benchmark(group="workflow", iterations=20, name="workflow.predict", params=[{"workflow": "sequential"}, {"workflow": "branching"}])
+def predict(workflow: str) -> Callable[[], Any]:
+    """End-to-end predict() with a warm compiled graph and offline model"""
+    _offline()
+    instance = _workflow_class(workflow)()
+    request = ResponsesAgentRequest(input=[], custom_inputs=ACCOUNT)
+    return lambda: instance.predict(request)
+
+
+@benchmark(group="workflow", iterations=50, name="workflow.compile", params=[{"workflow": "sequential"}, {"workflow": "branching"}])
+def compile_graph(workflow: str) -> Callable[[], Any]:
+    """Graph construction and compilation, bypassing the compiled graph cache"""
+    workflow_class = _workflow_class(workflow)
+    return lambda: workflow_class().build_workflow().compile()
+
+
+# Agents
+
+@benchmark(group="agent", iterations=2000, name="agent.call_overhead", params=[{"outputs": 2}, {"outputs": 10}, {"outputs": 100}])
+def agent_call_overhead(outputs: int) -> Callable[[], Any]:
+    """BaseAgent.__call__ around a no-op execute(): metadata, logging and the state update"""
+    from ensemble_phase_2_poc.agents.base_agent import BaseAgent
+
+    class NoopAgent(BaseAgent):
+        node_id = "noop_agent"
+
+        def render_prompt(self, state):
+            return "prompt"
+
+        def build_executor(self):
+            return self.build_agent()
+
+        def execute(self, prompt, state):
+            return "output"
+
+    agent = NoopAgent()
+    state = _state(outputs)
+    return lambda: agent(state)
+
+
+@benchmark(
+    group="agent",
+    iterations=2000,
+    name="agent.render_prompt",
+    params=[{"agent": name} for name in ("AccountResearchAgent", "TriageAgent", "ResolutionAgent", "AccountNoteAgent")],
+)
+def render_prompt(agent: str) -> Callable[[], Any]:
+    """Template lookup and formatting with upstream outputs in state"""
+    import ensemble_phase_2_poc.agents as agents
+
+    instance = getattr(agents, agent)()
+    state = _state(outputs=3)
+    return lambda: instance.render_prompt(state)
+
+
+# Tools
+
+_TOOL_ARGS = {
+    "GetAccountData": {},
+    "PostContractualAdjustment": {"transaction_id": "1300"},
+    "PostAccountNote": {"description": "Posted a contractual adjustment."},
+}
+
+
+@benchmark(group="tool", iterations=2000, name="tool.construct", params=[{"tool": name} for name in _TOOL_ARGS])
+def construct_tool(tool: str) -> Callable[[], Any]:
+    """Tool instantiation, as done when an executor is built"""
+    import ensemble_phase_2_poc.tools as tools
+
+    tool_class = getattr(tools, tool)
+    return lambda: tool_class(**ACCOUNT)
+
+
+@benchmark(group="tool", iterations=2000, name="tool.run", params=[{"tool": name} for name in _TOOL_ARGS])
+def run_tool(tool: str) -> Callable[[], Any]:
+    """Tool._run: span tagging, context binding and _execute"""
+    import ensemble_phase_2_poc.tools as tools
+
+    instance = getattr(tools, tool)(**ACCOUNT)
+    args = _TOOL_ARGS[tool]
+    return lambda: instance._run(**args)
+
+
+# Metrics
+
+@benchmark(group="metrics", iterations=20000, name="metrics.record", params=[{"metric": "counter"}, {"metric": "histogram"}, {"metric": "track"}])
+def record_metric(metric: str) -> Callable[[], Any]:
+    """Hot-path cost of recording one metric sample"""
+    from ensemble_phase_2_poc import metrics
+
+    if metric == "counter":
+        return lambda: metrics.LLM_CALLS.labels("cohere", "command-a-03-2025").inc()
+    if metric == "histogram":
+        return lambda: metrics.NODE_DURATION.labels("resolution_agent").observe(0.42)
+
+    def _track() -> None:
+        with metrics.track(metrics.TOOL_DURATION, metrics.TOOLS_IN_FLIGHT, metrics.TOOL_FAILURES, "GetAccountData"):
+            pass
+
+    return _track
+
+
+# Import time
+
+@benchmark(group="import", iterations=3, name="package.import")
+def package_import() -> Callable[[], Any]:
+    """Cold import of the package in a fresh interpreter"""
+    command = [sys.executable, "-c", "import ensemble_phase_2_poc"]
+    return lambda: subprocess.run(command, check=True, capture_output=True)
+
+
+# Scorers
+
+class _Status:
+    def __init__(self, status_code: str):
+        self.status_code = status_code
+
+
+class SyntheticSpan:
+    """Just enough of mlflow.entities.Span for the scorers, without mock overhead"""
+
+    def __init__(self, name: str, span_type: str, inputs: dict | None = None, attributes: dict | None = None, error: bool = False):
+        self.name = name
+        self.span_type = span_type
+        self.inputs = inputs or {}
+        self.status = _Status(SpanStatusCode.ERROR if error else SpanStatusCode.OK)
+        self._attributes = attributes or {}
+
+    def get_attribute(self, key: str) -> Any:
+        return self._attributes.get(key)
+
+
+class SyntheticTrace:
+    """Trace with `spans` tool spans (every tenth errored) and one chat model span"""
+
+    def __init__(self, spans: int):
+        self.spans = [
+            SyntheticSpan(
+                name="post_contractual_adjustment" if i % 2 else "get_account_data",
+                span_type=SpanType.TOOL,
+                inputs={"transaction_id": "1300"} if i % 2 else {},
+                attributes={"include_in_scorer_check": bool(i % 2)},
+                error=i % 10 == 0,
+            )
+            for i in range(spans)
+        ]
+        self.spans.append(
+            SyntheticSpan(
+                name="ChatCohere",
+                span_type=SpanType.CHAT_MODEL,
+                attributes={"metadata": {"ls_provider": "cohere", "ls_model_name": "command-a-03-2025"}},
+            )
+        )
+        self.info = type("TraceInfo", (), {"token_usage": {"input_tokens": 1000 * spans, "output_tokens": 100 * spans}})()
+
+    def search_spans(self, span_type: str | None = None) -> list[SyntheticSpan]:
+        return [span for span in self.spans if span_type is None or span.span_type == span_type]
+
+
+EXPECTATIONS = {"in_scope": True, "tool_calls": {"post_contractual_adjustment": {"transaction_id": "1300"}}}
+
+
+def _scorer_case(scorer_name: str, with_expectations: bool) -> Callable:
+    def setup(spans: int) -> Callable[[], Any]:
+        from ensemble_phase_2_poc import scorers
+
+        scorer = getattr(scorers, scorer_name)
+        trace = SyntheticTrace(spans)
+        if with_expectations:
+            return lambda: scorer(trace=trace, expectations=EXPECTATIONS)
+        return lambda: scorer(trace=trace)
+
+    setup.__doc__ = f"scorers.{scorer_name} over a synthetic trace"
+    return setup
+
+
+for _scorer_name, _with_expectations in [
+    ("tool_error", False),
+    ("token_cost", False),
+    ("tool_match", True),
+    ("param_match", True),
+    ("precision", True),
+]:
+    benchmark(group="scorer", iterations=200, name=f"scorer.{_scorer_name}", params=TRACE_SIZES)(
+        _scorer_case(_scorer_name, _with_expectations)
+    )
@@ -0,0 +1,32 @@
+import pytest
+
+from benchmarks.harness import format_table, quiet_logging, write_json
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup("benchmarks")
+    group.addoption("--benchmark-json", default=None, help="Write benchmark results as JSON to this file.")
+    group.addoption("--benchmark-scale", type=float, default=1.0, help="Multiply every benchmark's iteration count.")
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config._benchmark_results = []
+
+
+@pytest.fixture(scope="session")
+def benchmark_results(request: pytest.FixtureRequest) -> list:
+    quiet_logging()
+    return request.config._benchmark_results
+
+
+def pytest_terminal_summary(terminalreporter, config: pytest.Config) -> None:
+    results = config._benchmark_results
+    if not results:
+        return
+    terminalreporter.write_sep("-", "benchmark results")
+    terminalreporter.write_line(format_table(results))
+
+    path = config.getoption("--benchmark-json")
+    if path:
+        write_json(results, path)
+        terminalreporter.write_line(f"Results written to: {path}")
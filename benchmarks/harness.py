@@ -0,0 +1,142 @@
+"""Minimal benchmark registry, timer and JSON writer shared by the CLI and pytest entry points."""
+
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+
+@dataclass
+class BenchmarkCase:
+    """One benchmark: `setup(**params)` returns the zero-argument callable to time"""
+
+    name: str
+    group: str
+    setup: Callable[..., Callable[[], Any]]
+    iterations: int
+    params: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def id(self) -> str:
+        if not self.params:
+            return self.name
+        return f"{self.name}[{','.join(f'{k}={v}' for k, v in self.params.items())}]"
+
+
+# Benchmark id -> case, populated by @benchmark in benchmarks/cases.py
+BENCHMARKS: dict[str, BenchmarkCase] = {}
+
+
+def benchmark(
+    group: str,
+    iterations: int = 100,
+    name: str | None = None,
+    params: list[dict[str, Any]] | None = None,
+) -> Callable:
+    """Register a setup function, once per entry in `params`"""
+
+    def decorator(setup: Callable[..., Callable[[], Any]]) -> Callable[..., Callable[[], Any]]:
+        for case_params in params or [{}]:
+            case = BenchmarkCase(
+                name=name or setup.__name__,
+                group=group,
+                setup=setup,
+                iterations=iterations,
+                params=case_params,
+            )
+            if case.id in BENCHMARKS:
+                raise ValueError(f"Duplicate benchmark id: {case.id}")
+            BENCHMARKS[case.id] = case
+        return setup
+
+    return decorator
+
+
+def run_case(case: BenchmarkCase, scale: float = 1.0, warmup: int = 2) -> dict[str, Any]:
+    """Time one case and return its summary statistics in milliseconds"""
+    fn = case.setup(**case.params)
+    iterations = max(1, round(case.iterations * scale))
+
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e3)
+
+    timings.sort()
+    mean = statistics.fmean(timings)
+    return {
+        "id": case.id,
+        "name": case.name,
+        "group": case.group,
+        "params": case.params,
+        "iterations": iterations,
+        "mean_ms": mean,
+        "median_ms": statistics.median(timings),
+        "min_ms": timings[0],
+        "max_ms": timings[-1],
+        "p95_ms": timings[min(len(timings) - 1, round(0.95 * len(timings)) - 1)],
+        "stdev_ms": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "ops_per_sec": 1e3 / mean if mean > 0 else float("inf"),
+    }
+
+
+def select(patterns: list[str] | None = None) -> list[BenchmarkCase]:
+    """Cases whose id contains any of `patterns` (all cases when empty)"""
+    return [
+        case for case in BENCHMARKS.values()
+        if not patterns or any(pattern in case.id for pattern in patterns)
+    ]
+
+
+def quiet_logging() -> None:
+    """Workflow and agent INFO logs would dominate the measurements"""
+    logging.disable(logging.INFO)
+
+
+def environment_metadata() -> dict[str, Any]:
+    """Context needed to compare result files across runs and machines"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_json(results: list[dict[str, Any]], path: str | Path) -> None:
+    """Write results with environment metadata as a single JSON document"""
+    with open(path, "w") as file:
+        json.dump({"metadata": environment_metadata(), "benchmarks": results}, file, indent=2)
+
+
+def format_table(results: list[dict[str, Any]]) -> str:
+    """Human-readable summary of results"""
+    width = max([len(result["id"]) for result in results] + [9])
+    lines = [f"{'benchmark':<{width}}  {'iters':>6}  {'median ms':>10}  {'p95 ms':>10}  {'ops/s':>10}"]
+    for result in results:
+        lines.append(
+            f"{result['id']:<{width}}  {result['iterations']:>6}  {result['median_ms']:>10.4f}  "
+            f"{result['p95_ms']:>10.4f}  {result['ops_per_sec']:>10.1f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,13 @@
+"""pytest entry point for the benchmark suite: pytest benchmarks [--benchmark-json results.json]"""
+
+import pytest
+
+from benchmarks import cases  # noqa: F401  (registers the benchmarks)
+from benchmarks.harness import BENCHMARKS, run_case
+
+
+@pytest.mark.parametrize("case", list(BENCHMARKS.values()), ids=list(BENCHMARKS))
+def test_benchmark(case, benchmark_results, request):
+    result = run_case(case, scale=request.config.getoption("--benchmark-scale"))
+    benchmark_results.append(result)
+    assert result["iterations"] > 0
@@ -1,4 +1,5 @@
-import os
+from langgraph.graph.state import CompiledStateGraph
+
 from ensemble_phase_2_poc.state import WorkflowState, get_node_output
 from ensemble_phase_2_poc.agents.base_agent import BaseAgent
 from ensemble_phase_2_poc.agents.resolution_agent import ResolutionAgent
@@ -10,6 +11,7 @@ class AccountNoteAgent(BaseAgent):
 
     node_id = "account_note_agent"
     depends_on = [ResolutionAgent.node_id]
+    prompt_variables = BaseAgent.prompt_variables + ("resolution_agent_output",)
 
     def render_prompt(self, state: WorkflowState) -> str:
         """Build prompt using global parameters and resolution output."""
@@ -25,27 +27,10 @@ class AccountNoteAgent(BaseAgent):
             resolution_agent_output=resolution_agent_output,
         )
 
-    def execute(self, prompt: str, state: WorkflowState) -> str:
-        """Run the post account note agent."""
-        self.logger.info(f"Posting account note for account: {state['account_number']}")
-        post_account_note = PostAccountNote(
-            account_number=state["account_number"],
-            client_name=state["client_name"],
-            facility_prefix=state["facility_prefix"],
-            lob=state["lob"],
-        )
-
-        agent = self.build_agent(
+    def build_executor(self) -> CompiledStateGraph:
+        """Build the account note agent once; account values arrive via runtime context"""
+        return self.build_agent(
             name=self.node_id,
-            model_provider="cohere",
-            model_name="command-a-03-2025",
-            api_key=os.environ["COHERE_API_KEY"],
-            tools=[post_account_note],
+            tier="large",
+            tools=[PostAccountNote()],
         )
-
-        result = agent.invoke(
-            input={"messages": [{"role": "user", "content": prompt}]},
-        )
-
-        self.logger.info("Account note posted successfully")
-        return result["messages"][-1].content
@@ -1,4 +1,4 @@
-import os
+from langgraph.graph.state import CompiledStateGraph
 
 from ensemble_phase_2_poc.state import WorkflowState
 from ensemble_phase_2_poc.agents.base_agent import BaseAgent
@@ -22,27 +22,10 @@ class AccountResearchAgent(BaseAgent):
             lob=state["lob"],
         )
 
-    def execute(self, prompt: str, state: WorkflowState) -> str:
-        """Run the research agent"""
-        self.logger.info(f"Executing research agent for client: {state['client_name']}")
-        get_account_data = GetAccountData(
-            account_number=state["account_number"],
-            client_name=state["client_name"],
-            facility_prefix=state["facility_prefix"],
-            lob=state["lob"],
-        )
-
-        agent = self.build_agent(
+    def build_executor(self) -> CompiledStateGraph:
+        """Build the research agent once; account values arrive via runtime context"""
+        return self.build_agent(
             name=self.node_id,
-            model_provider="cohere",
-            model_name="command-a-03-2025",
-            api_key=os.environ["COHERE_API_KEY"],
-            tools=[get_account_data],
-        )
-
-        result = agent.invoke(
-            input={"messages": [{"role": "user", "content": prompt}]},
+            tier="large",
+            tools=[GetAccountData()],
         )
-
-        self.logger.debug(f"Research agent completed with {len(result['messages'])} messages")
-        return result["messages"][-1].content
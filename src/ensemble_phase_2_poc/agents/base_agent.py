@@ -5,19 +5,37 @@
 # - Prompt rendering with dependency injection
 # - State read/write boilerplate
 # - Execution lifecycle hooks
+# - A reusable inner agent (executor) built once per node
+# - Per-node timing and LLM usage in the node's metadata
 
+import asyncio
+import threading
 from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import Any, Callable, Sequence
 from logging import Logger
 
+from langchain_core.runnables import Runnable, RunnableLambda
 from langchain_core.tools import BaseTool
 from langchain.agents import create_agent
 from langgraph.graph.state import CompiledStateGraph
 
-from ensemble_phase_2_poc.state import WorkflowState, NodeExecution, get_node_output
+from ensemble_phase_2_poc.state import (
+    AccountContext,
+    WorkflowState,
+    NodeExecution,
+    get_account_context,
+    get_node_output,
+)
+from ensemble_phase_2_poc.agents.prompt_registry import PromptRegistry
 from ensemble_phase_2_poc.inference.router import ChatFactory
 from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.prompt_retention import get_prompt_retention
+from ensemble_phase_2_poc.telemetry import NodeUsageHandler, track_node_usage
+
+
+# Guards lazy executor construction; only contended on a node's first call
+_EXECUTOR_LOCK = threading.Lock()
 
 
 class BaseAgent(ABC):
@@ -25,6 +43,12 @@ class BaseAgent(ABC):
 
     PROMPT_DIR = Path(__file__).parent / "prompts"
 
+    # Placeholders this node supplies to its prompt template. Checked against the
+    # template when the node is added to a graph (see validate_prompt()).
+    prompt_variables: tuple[str, ...] = ("account_number", "client_name", "facility_prefix", "lob")
+
+    _executor: CompiledStateGraph | None = None
+
     @property
     @abstractmethod
     def node_id(self) -> str:
@@ -45,24 +69,79 @@ class BaseAgent(ABC):
             )
         return self._logger
 
+    @classmethod
+    def prompt_registry(cls) -> PromptRegistry:
+        """Registry holding every template in PROMPT_DIR in memory"""
+        return PromptRegistry.for_directory(cls.PROMPT_DIR)
+
     @classmethod
     def get_prompt(cls, name: str) -> str:
-        """Get prompt template from the prompts directory"""
-        prompt_path = cls.PROMPT_DIR / f"{name}.md"
-        with open(prompt_path, "r") as file:
-            template = file.read()
-        return template
+        """Get prompt template from the in-memory prompt registry"""
+        return cls.prompt_registry().get(name)
+
+    def validate_prompt(self) -> None:
+        """Check that this node's template exists and uses exactly prompt_variables.
+
+        Raises PromptTemplateError, so a broken prompt fails at graph build time
+        rather than midway through a batch.
+        """
+        self.prompt_registry().validate(self.node_id, self.prompt_variables)
 
     @abstractmethod
     def render_prompt(self, state: WorkflowState) -> str:
         """Build the prompt for this node"""
         ...
 
-    @abstractmethod
     def execute(self, prompt: str, state: WorkflowState) -> str:
-        """Execute the agent/LLM logic"""
+        """Execute the agent/LLM logic: run the executor on the prompt and read its output"""
+        self.logger.info(f"Executing {self.node_id} for account: {state['account_number']}")
+        return self.read_output(self.invoke_executor(prompt, state))
+
+    async def aexecute(self, prompt: str, state: WorkflowState) -> str:
+        """Async twin of execute(). A subclass that overrides only execute() has it run in a worker thread"""
+        if type(self).execute is not BaseAgent.execute:
+            return await asyncio.to_thread(self.execute, prompt, state)
+        self.logger.info(f"Executing {self.node_id} for account: {state['account_number']}")
+        return self.read_output(await self.ainvoke_executor(prompt, state))
+
+    def read_output(self, result: dict[str, Any]) -> str:
+        """This node's output from the executor's final state: its last message"""
+        self.logger.debug(f"{self.node_id} completed with {len(result['messages'])} messages")
+        return result["messages"][-1].content
+
+    @property
+    def executor(self) -> CompiledStateGraph:
+        """This node's inner agent, built on first use and reused for every account"""
+        if self._executor is None:
+            with _EXECUTOR_LOCK:
+                if self._executor is None:
+                    self.logger.info(f"Building executor for node: {self.node_id}")
+                    self._executor = self.build_executor()
+        return self._executor
+
+    @abstractmethod
+    def build_executor(self) -> CompiledStateGraph:
+        """Build this node's inner agent, typically via build_agent().
+
+        Called once per node instance. Anything account-specific must come from
+        the AccountContext passed at invocation time, not be baked in here.
+        """
         ...
 
+    def invoke_executor(self, prompt: str, state: WorkflowState) -> dict[str, Any]:
+        """Run the shared executor on a prompt with this account's runtime context"""
+        return self.executor.invoke(
+            input={"messages": [{"role": "user", "content": prompt}]},
+            context=get_account_context(state),
+        )
+
+    async def ainvoke_executor(self, prompt: str, state: WorkflowState) -> dict[str, Any]:
+        """Async twin of invoke_executor()"""
+        return await self.executor.ainvoke(
+            input={"messages": [{"role": "user", "content": prompt}]},
+            context=get_account_context(state),
+        )
+
     def build_metadata(self, state: WorkflowState) -> dict[str, Any]:
         """Override to add custom metadata to the node execution record"""
         return {}
@@ -81,24 +160,39 @@ class BaseAgent(ABC):
         # Validate dependencies are met
         self.validate_dependencies(state)
 
-        # Build the prompt (node uses get_node_output() to access prior outputs)
-        prompt = self.render_prompt(state)
+        with track_node_usage(self.node_id) as usage:
+            # Build the prompt (node uses get_node_output() to access prior outputs)
+            prompt = self.render_prompt(state)
+
+            # Execute the agent logic
+            output = self.execute(prompt, state)
 
-        # Execute the agent logic
-        output = self.execute(prompt, state)
+        return self._build_update(state, prompt, output, usage)
 
-        # Build metadata
-        metadata = self.build_metadata(state)
+    async def __acall__(self, state: WorkflowState) -> dict:
+        """Async LangGraph-compatible callable, used when the graph runs via ainvoke()"""
+        self.validate_dependencies(state)
+        with track_node_usage(self.node_id) as usage:
+            prompt = self.render_prompt(state)
+            output = await self.aexecute(prompt, state)
+        return self._build_update(state, prompt, output, usage)
+
+    def _build_update(self, state: WorkflowState, prompt: str, output: str, usage: NodeUsageHandler) -> dict:
+        """Build the state update returned by both the sync and async callables"""
+        # The prompt is no longer needed; keep, drop or externalize it per the retention mode
+        stored_prompt, retention_metadata = get_prompt_retention().retain(prompt)
+
+        # Build metadata: timing and LLM usage first, so build_metadata() can override
+        metadata = {**usage.as_metadata(), **retention_metadata, **self.build_metadata(state)}
         if self.depends_on:
             metadata["depends_on"] = self.depends_on
 
-        # Return state updates
+        # Return state updates: only this node's entry, merged by the node_outputs reducer
         return {
             "node_outputs": {
-                **state["node_outputs"],
                 self.node_id: NodeExecution(
                     node_id=self.node_id,
-                    input=prompt,
+                    input=stored_prompt,
                     output=output,
                     metadata=metadata,
                 ),
@@ -106,29 +200,37 @@ class BaseAgent(ABC):
             "execution_path": [self.node_id],
         }
 
-    def as_node(self) -> tuple[str, Callable[[WorkflowState], dict]]:
-        """Utuility for extracting (node_id, callable) tuple for use with graph.add_node()
+    def as_node(self) -> tuple[str, Runnable]:
+        """Utuility for extracting (node_id, runnable) tuple for use with graph.add_node()
 
-        we need this to setup the state graph using Langgraph
+        we need this to setup the state graph using Langgraph. The runnable dispatches
+        to __call__ under invoke() and to __acall__ under ainvoke(). The node's prompt
+        template is validated here, i.e. at workflow build time.
         """
-        return (self.node_id, self)
+        self.validate_prompt()
+        return (self.node_id, RunnableLambda(self, afunc=self.__acall__, name=self.node_id))
 
     def build_agent(
         self,
-        model_provider: str,
-        model_name: str,
-        api_key: str,
+        tier: str = "large",
         tools: Sequence[BaseTool | Callable[..., Any] | dict[str, Any]] | None = None,
         system_prompt: str | None = None,
         name: str | None = None,
         **kwargs: Any,
     ) -> CompiledStateGraph:
-        """Agent constructor"""
+        """Agent constructor. Agents take an AccountContext as runtime context by default.
+
+        The model is resolved by ChatFactory's router from the capability `tier`
+        ("small" or "large") and any per-node override in the routing config.
+        """
+        kwargs.setdefault("context_schema", AccountContext)
+        model, middleware = ChatFactory.route(self.node_id, tier)
 
         return create_agent(
-            model=ChatFactory.get_model(model_provider, model_name, api_key), # TODO: use the router method
+            model=model,
             tools=tools or [],
             name=name or self.node_id,
             system_prompt=system_prompt,
+            middleware=[*middleware, *kwargs.pop("middleware", ())],
             **kwargs,
-        )
\ No newline at end of file
+        )
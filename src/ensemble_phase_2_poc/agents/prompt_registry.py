@@ -0,0 +1,146 @@
+# In-memory registry of prompt templates.
+#
+# Every `<name>.md` template in a prompt directory is read and parsed once, on
+# first use. Each template's placeholders are extracted at load time so agents
+# can check, while the workflow is being built, that the values they supply
+# match the template exactly.
+
+import os
+import string
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+from ensemble_phase_2_poc.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# Set to "1" to re-read templates whose file mtime changed (development only)
+HOT_RELOAD_ENV_VAR = "ENSEMBLE_PROMPT_HOT_RELOAD"
+
+
+class PromptTemplateError(ValueError):
+    """A prompt template is missing, malformed, or doesn't match its agent"""
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """A parsed prompt template"""
+
+    name: str
+    text: str
+    fields: frozenset[str]
+    mtime: float
+
+
+class PromptRegistry:
+    """Loads all templates in a directory once and serves them from memory"""
+
+    _registries: dict[Path, "PromptRegistry"] = {}
+    _registries_lock = threading.Lock()
+
+    def __init__(self, prompt_dir: Path, hot_reload: bool | None = None):
+        self.prompt_dir = Path(prompt_dir)
+        if hot_reload is None:
+            hot_reload = os.environ.get(HOT_RELOAD_ENV_VAR, "") == "1"
+        self.hot_reload = hot_reload
+        self._templates: dict[str, PromptTemplate] | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_directory(cls, prompt_dir: Path) -> "PromptRegistry":
+        """Process-wide registry for a prompt directory"""
+        key = Path(prompt_dir).resolve()
+        with cls._registries_lock:
+            if key not in cls._registries:
+                cls._registries[key] = cls(key)
+            return cls._registries[key]
+
+    @property
+    def templates(self) -> dict[str, PromptTemplate]:
+        if self._templates is None:
+            with self._lock:
+                if self._templates is None:
+                    self._templates = self._load_all()
+        return self._templates
+
+    def get(self, name: str) -> str:
+        """Template text for `name`"""
+        return self._get_template(name).text
+
+    def fields(self, name: str) -> frozenset[str]:
+        """Placeholder names used by template `name`"""
+        return self._get_template(name).fields
+
+    def validate(self, name: str, supplied: Iterable[str]) -> None:
+        """Raise PromptTemplateError unless template `name` uses exactly the `supplied` placeholders"""
+        supplied = frozenset(supplied)
+        fields = self.fields(name)
+        if fields == supplied:
+            return
+
+        details = []
+        if missing := fields - supplied:
+            details.append(f"placeholders not supplied by the agent: {sorted(missing)}")
+        if unused := supplied - fields:
+            details.append(f"values supplied but not used by the template: {sorted(unused)}")
+        raise PromptTemplateError(f"Prompt '{name}' does not match its agent: {'; '.join(details)}")
+
+    def _get_template(self, name: str) -> PromptTemplate:
+        template = self.templates.get(name)
+        if template is None:
+            raise PromptTemplateError(
+                f"Prompt '{name}' not found in {self.prompt_dir}, expected a '{name}.md' template"
+            )
+        if self.hot_reload:
+            template = self._reload_if_changed(template)
+        return template
+
+    def _reload_if_changed(self, template: PromptTemplate) -> PromptTemplate:
+        path = self.prompt_dir / f"{template.name}.md"
+        if path.stat().st_mtime == template.mtime:
+            return template
+
+        with self._lock:
+            reloaded = _parse_template(path)
+            self._templates[template.name] = reloaded
+        logger.info(f"Reloaded prompt template: {path}")
+        return reloaded
+
+    def _load_all(self) -> dict[str, PromptTemplate]:
+        if not self.prompt_dir.is_dir():
+            raise PromptTemplateError(f"Prompt directory not found: {self.prompt_dir}")
+
+        templates = {path.stem: _parse_template(path) for path in sorted(self.prompt_dir.glob("*.md"))}
+        logger.info(f"Loaded {len(templates)} prompt templates from {self.prompt_dir}")
+        return templates
+
+
+def _parse_template(path: Path) -> PromptTemplate:
+    """Read a template and extract its named placeholders"""
+    text = path.read_text()
+    fields = set()
+    try:
+        for _, field_name, _, _ in string.Formatter().parse(text):
+            if field_name is None:
+                continue
+            # "{a.b}" and "{a[0]}" both read the value supplied as "a"
+            root = field_name.split(".", 1)[0].split("[", 1)[0]
+            if not root or root.isdigit():
+                raise PromptTemplateError(
+                    f"Prompt template {path} uses a positional placeholder; use named placeholders only"
+                )
+            fields.add(root)
+    except ValueError as e:
+        if isinstance(e, PromptTemplateError):
+            raise
+        raise PromptTemplateError(f"Prompt template {path} is malformed: {e}") from e
+
+    return PromptTemplate(
+        name=path.stem,
+        text=text,
+        fields=frozenset(fields),
+        mtime=path.stat().st_mtime,
+    )
@@ -1,4 +1,4 @@
-import os
+from langgraph.graph.state import CompiledStateGraph
 
 from ensemble_phase_2_poc.state import WorkflowState, get_node_output
 from ensemble_phase_2_poc.agents.base_agent import BaseAgent
@@ -11,6 +11,7 @@ class ResolutionAgent(BaseAgent):
 
     node_id = "resolution_agent"
     depends_on = [AccountResearchAgent.node_id]
+    prompt_variables = BaseAgent.prompt_variables + ("research_agent_output",)
 
     def render_prompt(self, state: WorkflowState) -> str:
         """Build resolution prompt using global params and acount data output"""
@@ -28,27 +29,10 @@ class ResolutionAgent(BaseAgent):
             research_agent_output=research_agent_output,
         )
 
-    def execute(self, prompt: str, state: WorkflowState) -> str:
-        """Run the resolution agent."""
-        self.logger.info(f"Executing resolution actions for account: {state['account_number']}")
-        post_contractual_adjustment = PostContractualAdjustment(
-            account_number=state["account_number"],
-            client_name=state["client_name"],
-            facility_prefix=state["facility_prefix"],
-            lob=state["lob"],
-        )
-
-        agent = self.build_agent(
+    def build_executor(self) -> CompiledStateGraph:
+        """Build the resolution agent once; account values arrive via runtime context"""
+        return self.build_agent(
             name=self.node_id,
-            model_provider="cohere",
-            model_name="command-a-03-2025",
-            api_key=os.environ["COHERE_API_KEY"],
-            tools=[post_contractual_adjustment],
-        )
-
-        result = agent.invoke(
-            input={"messages": [{"role": "user", "content": prompt}]},
+            tier="large",
+            tools=[PostContractualAdjustment()],
         )
-
-        self.logger.info("Resolution agent completed successfully")
-        return result["messages"][-1].content
@@ -1,4 +1,7 @@
-import os
+from typing import Any
+
+from langgraph.graph.state import CompiledStateGraph
+
 from ensemble_phase_2_poc.state import WorkflowState, get_node_output
 from ensemble_phase_2_poc.agents.base_agent import BaseAgent
 from ensemble_phase_2_poc.agents.account_research_agent import AccountResearchAgent
@@ -9,6 +12,7 @@ class TriageAgent(BaseAgent):
 
     node_id = "triage_agent"
     depends_on = [AccountResearchAgent.node_id]
+    prompt_variables = BaseAgent.prompt_variables + ("research_agent_output",)
 
     def render_prompt(self, state: WorkflowState) -> str:
         """Build triage prompt using global params and acount data output"""
@@ -26,20 +30,15 @@ class TriageAgent(BaseAgent):
             research_agent_output=research_agent_output,
         )
 
-    def execute(self, prompt: str, state: WorkflowState) -> str:
-        """Run triage agent"""
-        self.logger.info("Starting triage decision for account routing")
-        agent = self.build_agent(
+    def build_executor(self) -> CompiledStateGraph:
+        """Build the tool-less triage agent once"""
+        return self.build_agent(
             name=self.node_id,
-            model_provider="cohere",
-            model_name="command-a-03-2025",
-            api_key=os.environ["COHERE_API_KEY"],
-        )
-
-        result = agent.invoke(
-            input={"messages": [{"role": "user", "content": prompt}]}
+            tier="small",
         )
 
-        triage_decision = result["messages"][-1].content
+    def read_output(self, result: dict[str, Any]) -> str:
+        """The triage decision, logged for routing"""
+        triage_decision = super().read_output(result)
         self.logger.info(f"Triage decision: {triage_decision}")
         return triage_decision
@@ -0,0 +1,401 @@
+# Streaming batch runner behind the `batch` CLI subcommand.
+#
+# Records are read lazily from a JSONL or CSV file, sharded across worker
+# processes that each hold one warmed workflow instance, and written to a JSONL
+# file as they finish. At most `max_in_flight` records are held in memory at
+# any time, so memory stays flat regardless of input size. Workers take records
+# one at a time from a shared task queue, on as many threads each as their
+# share of the concurrency limit, and put each result on a result queue as
+# soon as it finishes, so a finished slot is refilled right away. With
+# `adaptive`, an AIMDController sets how many records run at once, from the
+# provider feedback each worker sends back with its result; the limit can
+# exceed the number of processes. With `prescreen`, records are screened
+# a block at a time in the parent and matching ones are written without ever
+# reaching a worker. Speculation outcomes reported by the workflow (see
+# speculation.py) are summed into the run's hit rate and wasted work. Workers
+# send snapshots of their metrics back with their results, at most once per
+# METRICS_SNAPSHOT_INTERVAL and once more when they stop, and the parent
+# exports them with its own.
+
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, TextIO
+
+from mlflow.types.responses import ResponsesAgentRequest
+
+from ensemble_phase_2_poc.concurrency import AIMDController, AIMDPolicy
+from ensemble_phase_2_poc.inference.feedback import ProviderFeedback, collect_feedback
+from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.prescreen import AccountColumns, PrescreenReport, PrescreenRules, evaluate
+from ensemble_phase_2_poc.metrics import REGISTRY, Snapshot
+from ensemble_phase_2_poc.speculation import SpeculationReport
+from ensemble_phase_2_poc.workflow import LangGraphResponsesAgent
+
+
+logger = get_logger(__name__)
+
+# Account fields copied from each input record into the request's custom_inputs
+ACCOUNT_FIELDS = ("account_number", "client_name", "facility_prefix", "lob")
+
+# Records evaluated by the pre-screen at a time
+PRESCREEN_BLOCK_SIZE = 1024
+
+# Seconds between checks that the workers are still alive while waiting for a result
+RESULT_POLL_INTERVAL = 1.0
+# Minimum seconds between the metrics snapshots a worker sends back
+METRICS_SNAPSHOT_INTERVAL = 1.0
+
+# Per-process workflow instance, record queues and thread count, populated by _init_worker()
+_WORKER_WORKFLOW: LangGraphResponsesAgent | None = None
+_WORKER_TASKS: "multiprocessing.Queue[tuple[int, dict[str, Any]] | None] | None" = None
+_WORKER_RESULTS: "multiprocessing.Queue[dict[str, Any]] | None" = None
+_WORKER_THREAD_COUNT = 1
+_WORKER_SNAPSHOT_LOCK = threading.Lock()
+_WORKER_SNAPSHOT_AT = 0.0
+
+
+def read_records(path: str | Path) -> Iterator[dict[str, Any]]:
+    """Lazily yield account records from a .jsonl or .csv file"""
+    path = Path(path)
+    suffix = path.suffix.lower()
+
+    with open(path, "r", newline="") as file:
+        if suffix in (".jsonl", ".ndjson"):
+            for line_number, line in enumerate(file, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{line_number} is not valid JSON: {e}") from e
+        elif suffix == ".csv":
+            yield from csv.DictReader(file)
+        else:
+            raise ValueError(f"Unsupported input format '{suffix}', expected .jsonl or .csv")
+
+
+def record_to_request(record: dict[str, Any]) -> ResponsesAgentRequest:
+    """Build the ResponsesAgentRequest for one input record"""
+    return ResponsesAgentRequest(
+        input=[],
+        custom_inputs={field: str(record.get(field, "")) for field in ACCOUNT_FIELDS},
+    )
+
+
+class LatencyTracker:
+    """Throughput and latency percentiles over a bounded sliding window"""
+
+    def __init__(self, window: int = 10_000):
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._start = time.perf_counter()
+        self.completed = 0
+        self.failed = 0
+        self.screened = 0
+
+    def record(self, latency: float, failed: bool = False) -> None:
+        self._latencies.append(latency)
+        self.completed += 1
+        if failed:
+            self.failed += 1
+
+    def record_screened(self) -> None:
+        """Count an account the pre-screen answered; it has no latency worth tracking"""
+        self.completed += 1
+        self.screened += 1
+
+    def percentile(self, q: float) -> float:
+        """Nearest-rank percentile (0-100) of the latencies in the window"""
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+        return ordered[rank]
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    @property
+    def throughput(self) -> float:
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.completed} accounts ({self.failed} failed, {self.screened} screened) | "
+            f"{self.throughput:.2f} accounts/s | "
+            f"p50 {self.percentile(50):.2f}s | p95 {self.percentile(95):.2f}s"
+        )
+
+
+@dataclass
+class BatchRunStats:
+    """Final statistics for a run_batch() call"""
+
+    completed: int
+    failed: int
+    elapsed_seconds: float
+    throughput: float
+    p50_latency: float
+    p95_latency: float
+    # Accounts routed to human by the pre-screen and LLM calls saved, when enabled
+    prescreen: dict[str, Any] | None = None
+    # Speculation hit rate and wasted work, when the workflow speculated
+    speculation: dict[str, Any] | None = None
+    # Adaptive concurrency limit at the end of the run, when enabled
+    concurrency_limit: int | None = None
+
+
+def _init_worker(
+    workflow_class: type[LangGraphResponsesAgent],
+    tasks: "multiprocessing.Queue[tuple[int, dict[str, Any]] | None]",
+    results: "multiprocessing.Queue[dict[str, Any]]",
+    threads: int = 1,
+) -> None:
+    """Process pool initializer: build and compile one workflow per worker"""
+    global _WORKER_WORKFLOW, _WORKER_TASKS, _WORKER_RESULTS, _WORKER_THREAD_COUNT
+    _WORKER_WORKFLOW = workflow_class()
+    _ = _WORKER_WORKFLOW.agent
+    _WORKER_TASKS, _WORKER_RESULTS, _WORKER_THREAD_COUNT = tasks, results, threads
+
+
+def _process_record(index: int, record: dict[str, Any]) -> dict[str, Any]:
+    """Run one record through the worker's workflow. Never raises."""
+    request = record_to_request(record)
+    start = time.perf_counter()
+    with collect_feedback() as feedback:
+        response = _WORKER_WORKFLOW._predict_or_error(request)
+    latency = time.perf_counter() - start
+
+    return {
+        "index": index,
+        "account_number": request.custom_inputs["account_number"],
+        "latency_seconds": latency,
+        "error": response.error.model_dump() if response.error is not None else None,
+        "custom_outputs": response.custom_outputs,
+        "provider_feedback": feedback.as_dict(),
+    }
+
+
+def _metrics_snapshot() -> tuple[int, Snapshot] | None:
+    """This worker's metrics, keyed by pid, unless a snapshot was sent in the last interval"""
+    global _WORKER_SNAPSHOT_AT
+    with _WORKER_SNAPSHOT_LOCK:
+        now = time.monotonic()
+        if now - _WORKER_SNAPSHOT_AT < METRICS_SNAPSHOT_INTERVAL:
+            return None
+        _WORKER_SNAPSHOT_AT = now
+    return os.getpid(), REGISTRY.snapshot()
+
+
+def _consume_records() -> None:
+    """Run records from the task queue, sending each result back as it finishes, until a None"""
+    while (item := _WORKER_TASKS.get()) is not None:
+        result = _process_record(*item)
+        result["metrics"] = _metrics_snapshot()
+        _WORKER_RESULTS.put(result)
+
+
+def _serve_records() -> tuple[int, Snapshot]:
+    """
+    Pool task each worker runs for the whole batch: consume records on all of
+    its threads, then return its final metrics
+    """
+    threads = [
+        threading.Thread(target=_consume_records, name=f"batch-worker-{n}") for n in range(_WORKER_THREAD_COUNT)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return os.getpid(), REGISTRY.snapshot()
+
+
+def _prescreened(
+    records: Iterator[dict[str, Any]],
+    rules: PrescreenRules,
+    report: PrescreenReport,
+) -> Iterator[tuple[int, dict[str, Any], str]]:
+    """(index, record, matching rule or "") for every record, screening a block at a time"""
+    for start in itertools.count(0, PRESCREEN_BLOCK_SIZE):
+        block = list(itertools.islice(records, PRESCREEN_BLOCK_SIZE))
+        if not block:
+            return
+        matched = evaluate(AccountColumns.from_records(block), rules)
+        report.record_screened(matched)
+        for offset, (record, rule) in enumerate(zip(block, matched)):
+            yield start + offset, record, str(rule)
+
+
+def _screened_result(workflow: LangGraphResponsesAgent, index: int, record: dict[str, Any], rule: str) -> dict[str, Any]:
+    """Output line for a record the pre-screen routed to human"""
+    request = record_to_request(record)
+    return {
+        "index": index,
+        "account_number": request.custom_inputs["account_number"],
+        "latency_seconds": 0.0,
+        "error": None,
+        "custom_outputs": workflow.screened_response(request, rule).custom_outputs,
+    }
+
+
+def _write_result(output: TextIO, result: dict[str, Any], tracker: LatencyTracker) -> None:
+    output.write(json.dumps(result, default=str) + "\n")
+    tracker.record(result["latency_seconds"], failed=result["error"] is not None)
+
+
+def run_batch(
+    input_path: str | Path,
+    output_path: str | Path,
+    workflow_class: type[LangGraphResponsesAgent],
+    workers: int = 4,
+    max_in_flight: int | None = None,
+    progress_interval: float = 5.0,
+    progress_stream: TextIO = sys.stderr,
+    adaptive: AIMDPolicy | None = None,
+    prescreen: PrescreenRules | None = None,
+) -> BatchRunStats:
+    """Stream records from input_path through a process pool into output_path.
+
+    Results are written in completion order; each line carries the input
+    `index` so callers can restore input order if they need it. With
+    `adaptive`, records in flight are bounded by an AIMD limit that starts at
+    the policy's initial limit and never exceeds `max_in_flight` (by default
+    the policy's max_limit). Each worker runs up to its share of the limit
+    at once, and results come back one record at a time.
+    With `prescreen`, records its rules match are written as routed to human
+    without running the workflow.
+    """
+    if workers < 1:
+        raise ValueError(f"workers must be >= 1, got {workers}")
+
+    controller = None
+    threads = 1
+    if adaptive is not None:
+        max_in_flight = max_in_flight or adaptive.max_limit
+        controller = AIMDController(adaptive.capped(max_in_flight), name="batch")
+        threads = math.ceil(controller.policy.max_limit / workers)
+    max_in_flight = max_in_flight or workers * 2
+
+    report = PrescreenReport() if prescreen is not None else None
+    # Builds screened responses in the parent; the graph itself is never compiled here
+    screener = workflow_class() if prescreen is not None else None
+
+    speculation = SpeculationReport()
+    tracker = LatencyTracker()
+    last_report = time.perf_counter()
+    in_flight = 0
+
+    logger.info(
+        f"Starting batch run: input={input_path}, workers={workers}, max_in_flight={max_in_flight}, "
+        f"adaptive={controller is not None}"
+    )
+
+    # spawn avoids forking the parent's threads (mlflow, HTTP clients) into workers
+    context = multiprocessing.get_context("spawn")
+    tasks = context.Queue()
+    results = context.Queue()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(workflow_class, tasks, results, threads),
+    ) as pool, open(output_path, "w") as output:
+        servers: list[Future] = [pool.submit(_serve_records) for _ in range(workers)]
+
+        def _full() -> bool:
+            if in_flight >= max_in_flight:
+                return True
+            return controller is not None and not controller.has_capacity(in_flight)
+
+        def _next_result() -> dict[str, Any]:
+            """Wait for a result, failing if a worker died and can't send its records back"""
+            while True:
+                try:
+                    return results.get(timeout=RESULT_POLL_INTERVAL)
+                except queue.Empty:
+                    for server in servers:
+                        if server.done():
+                            server.result()
+                            raise RuntimeError("A batch worker stopped with records in flight")
+
+        def _drain() -> None:
+            nonlocal in_flight, last_report
+            result = _next_result()
+            while result is not None:
+                in_flight -= 1
+                if (metrics := result.pop("metrics")) is not None:
+                    REGISTRY.merge(*metrics)
+                feedback = result.pop("provider_feedback")
+                if controller is not None:
+                    controller.on_result(ProviderFeedback(**feedback))
+                if report is not None:
+                    report.observe(result["custom_outputs"])
+                speculation.observe(result["custom_outputs"])
+                _write_result(output, result, tracker)
+                try:
+                    result = results.get_nowait()
+                except queue.Empty:
+                    result = None
+            output.flush()
+
+            if time.perf_counter() - last_report >= progress_interval:
+                limit = f" | concurrency {controller.limit}" if controller is not None else ""
+                print(tracker.summary() + limit, file=progress_stream, flush=True)
+                last_report = time.perf_counter()
+
+        records = read_records(input_path)
+        if prescreen is not None:
+            screened = _prescreened(records, prescreen, report)
+        else:
+            screened = ((index, record, "") for index, record in enumerate(records))
+
+        try:
+            for index, record, rule in screened:
+                if rule:
+                    output.write(json.dumps(_screened_result(screener, index, record, rule), default=str) + "\n")
+                    tracker.record_screened()
+                    continue
+                tasks.put((index, record))
+                in_flight += 1
+                while _full():
+                    _drain()
+
+            while in_flight:
+                _drain()
+        finally:
+            # One stop marker per worker thread; workers finish what they hold first
+            for _ in range(workers * threads):
+                tasks.put(None)
+        for server in servers:
+            REGISTRY.merge(*server.result())
+
+    if report is not None:
+        report.finish()
+    print(tracker.summary(), file=progress_stream, flush=True)
+    logger.info(f"Batch run complete: {tracker.summary()}")
+
+    return BatchRunStats(
+        completed=tracker.completed,
+        failed=tracker.failed,
+        elapsed_seconds=tracker.elapsed,
+        throughput=tracker.throughput,
+        p50_latency=tracker.percentile(50),
+        p95_latency=tracker.percentile(95),
+        prescreen=report.as_dict() if report is not None else None,
+        speculation=speculation.as_dict() if speculation.speculated else None,
+        concurrency_limit=controller.limit if controller is not None else None,
+    )
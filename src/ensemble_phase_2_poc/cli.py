@@ -1,4 +1,12 @@
+# Command line entry point: run, evaluate, batch and seed-cassette.
+#
+# configure_llm() and configure_workflow() pass options on through environment
+# variables rather than module state, so the spawned worker processes of `batch`
+# inherit them and configure themselves the same way as this process.
+
 import argparse
+import os
+import tempfile
 from datetime import datetime
 from typing import Dict, Any
 
@@ -18,8 +26,8 @@ WORKFLOW_REGISTRY = {
 }
 
 
-def _add_common_args(parser: argparse.ArgumentParser) -> None:
-    """Add common MLflow arguments to a parser."""
+def _add_workflow_arg(parser: argparse.ArgumentParser) -> None:
+    """Add the workflow selection argument to a parser."""
     parser.add_argument(
         "-w",
         "--workflow",
@@ -28,6 +36,137 @@ def _add_common_args(parser: argparse.ArgumentParser) -> None:
         default="branching",
         help="The workflow type to run.",
     )
+    parser.add_argument(
+        "--speculative",
+        action="store_true",
+        help="Branching workflow only: start resolution alongside triage, holding its side-effecting tools "
+        "until triage routes the account to the agent, and discard it otherwise.",
+    )
+    parser.add_argument(
+        "--prompt-retention",
+        type=str,
+        default=None,
+        help="What finished nodes keep of their prompt in workflow state: 'keep', 'drop', or a directory "
+        "to write prompts to (state keeps the file path). Defaults to keep.",
+    )
+    parser.add_argument(
+        "--compact-tool-outputs",
+        type=str,
+        nargs="?",
+        const="1",
+        default=None,
+        help="Send tool outputs to each node with only the fields it needs, minified and tabulated, within a "
+        "token budget. Optionally pass encodings as inline JSON or a JSON file path. See tools/README.md.",
+    )
+
+
+def _add_llm_args(parser: argparse.ArgumentParser) -> None:
+    """Add LLM response cache, record/replay and simulation arguments to a parser."""
+    parser.add_argument(
+        "--llm-cache",
+        type=str,
+        default=None,
+        help="SQLite file for the LLM response cache. Caching is off unless set.",
+    )
+    parser.add_argument(
+        "--llm-cache-ttl",
+        type=float,
+        default=None,
+        help="Seconds before a cached LLM response expires. Never expires by default.",
+    )
+    parser.add_argument(
+        "--cassette",
+        type=str,
+        default=None,
+        help="JSONL cassette to record LLM calls to or replay them from.",
+    )
+    parser.add_argument(
+        "--cassette-mode",
+        type=str,
+        choices=["record", "replay"],
+        default="replay",
+        help="Record calls to the cassette, or replay them with no network access.",
+    )
+    parser.add_argument(
+        "--simulate",
+        type=str,
+        nargs="?",
+        const="1",
+        default=None,
+        help="Replace every LLM with the offline simulated provider. Optionally pass a "
+        "profile as inline JSON or a JSON file path, e.g. '{\"latency_mean_ms\": 800}'.",
+    )
+    parser.add_argument(
+        "--hedge",
+        type=str,
+        nargs="?",
+        const="1",
+        default=None,
+        help="Race a duplicate request against LLM calls slower than recent p95 latency. Optionally "
+        "pass a policy as inline JSON or a JSON file path, e.g. '{\"percentile\": 0.9, \"max_hedge_ratio\": 0.1}'.",
+    )
+    parser.add_argument(
+        "--retry-policy",
+        type=str,
+        default=None,
+        help="LLM retry policy and circuit breaker settings as inline JSON or a JSON file path, "
+        "e.g. '{\"max_tries\": 3, \"failure_threshold\": 10}'. See inference/retry.py.",
+    )
+    parser.add_argument(
+        "--routes",
+        type=str,
+        default=None,
+        help="Per-node model routing as inline JSON or a JSON file path, e.g. "
+        "'{\"tiers\": {\"small\": [\"cohere/command-r7b-12-2024\"]}}'. See inference/README.md.",
+    )
+    parser.add_argument(
+        "--rate-limits",
+        type=str,
+        default=None,
+        help="Client-side LLM rate limits keyed by provider or provider/model, as inline JSON or a JSON "
+        "file path, e.g. '{\"cohere\": {\"requests_per_minute\": 500, \"tokens_per_minute\": 200000}}'.",
+    )
+    parser.add_argument(
+        "--rate-limit-store",
+        type=str,
+        default=None,
+        help="SQLite file holding the rate limit buckets, shared by every process that uses it "
+        "(default: per process, or a temporary file shared by batch workers).",
+    )
+
+
+def _add_metrics_args(parser: argparse.ArgumentParser) -> None:
+    """Add Prometheus metrics export arguments to a parser."""
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics over HTTP on this port. Off unless set.",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        type=str,
+        default=None,
+        help="Interface to serve metrics on (default: 127.0.0.1). Use 0.0.0.0 to allow remote scrapes.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        default=None,
+        help="Periodically write Prometheus metrics to this file. '{pid}' in the path is "
+        "replaced by the process id. Batch runs write worker metrics into the parent's file.",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=15.0,
+        help="Seconds between metrics file writes.",
+    )
+
+
+def _add_common_args(parser: argparse.ArgumentParser) -> None:
+    """Add common MLflow arguments to a parser."""
+    _add_workflow_arg(parser)
     parser.add_argument(
         "-e",
         "--experiment",
@@ -42,6 +181,8 @@ def _add_common_args(parser: argparse.ArgumentParser) -> None:
         default="http://localhost:5001",
         help="The MLflow tracking server URI.",
     )
+    _add_llm_args(parser)
+    _add_metrics_args(parser)
 
 
 def parse_args() -> argparse.Namespace:
@@ -74,6 +215,104 @@ def parse_args() -> argparse.Namespace:
     )
     _add_common_args(eval_parser)
 
+    # Batch subcommand
+    batch_parser = subparsers.add_parser(
+        "batch",
+        help="Stream accounts from a JSONL/CSV file through a pool of worker processes.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    _add_workflow_arg(batch_parser)
+    batch_parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        required=True,
+        help="Input .jsonl or .csv file with one account per record.",
+    )
+    batch_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        required=True,
+        help="Output .jsonl file. Results are appended as they finish.",
+    )
+    batch_parser.add_argument(
+        "-n",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes.",
+    )
+    batch_parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=None,
+        help="Maximum records submitted but not yet written. Defaults to 2x workers, or the AIMD "
+        "max_limit with --adaptive-concurrency.",
+    )
+    batch_parser.add_argument(
+        "--adaptive-concurrency",
+        type=str,
+        nargs="?",
+        const="1",
+        default=None,
+        help="Adjust how many accounts run at once (up to --max-in-flight, several per worker) from provider throttling, timeouts "
+        "and latency. Optionally pass an AIMD policy as inline JSON or a JSON file path, "
+        "e.g. '{\"initial_limit\": 8, \"decrease\": 0.7}'.",
+    )
+    batch_parser.add_argument(
+        "--prescreen",
+        type=str,
+        nargs="?",
+        const="1",
+        default=None,
+        help="Route accounts whose records settle the outcome (zero total_outstanding, no notes, excluded lob) "
+        "to human without calling the LLM. Optionally pass rules as inline JSON or a JSON file path, "
+        "e.g. '{\"excluded_lobs\": [\"Behavioral\"]}'.",
+    )
+    batch_parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between progress lines.",
+    )
+    _add_llm_args(batch_parser)
+    _add_metrics_args(batch_parser)
+
+    # Seed-cassette subcommand
+    seed_parser = subparsers.add_parser(
+        "seed-cassette",
+        help="Build a replay cassette from the chat model calls in existing MLflow traces.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    seed_parser.add_argument(
+        "-e",
+        "--experiment",
+        type=str,
+        default="test-workflow",
+        help="The MLflow experiment name to read traces from.",
+    )
+    seed_parser.add_argument(
+        "-t",
+        "--tracking-uri",
+        type=str,
+        default="http://localhost:5001",
+        help="The MLflow tracking server URI.",
+    )
+    seed_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        required=True,
+        help="Cassette file to append to.",
+    )
+    seed_parser.add_argument(
+        "--max-traces",
+        type=int,
+        default=1000,
+        help="Maximum number of traces to read.",
+    )
+
     return parser.parse_args()
 
 
@@ -183,10 +422,160 @@ def evaluate(args: argparse.Namespace) -> None:
     print(f"Results: {results}")
 
 
+def batch(args: argparse.Namespace) -> None:
+    """Run the selected workflow over every account in an input file."""
+    from ensemble_phase_2_poc.batch import run_batch
+    from ensemble_phase_2_poc.concurrency import parse_aimd_policy
+    from ensemble_phase_2_poc.prescreen import parse_prescreen_rules
+
+    stats = run_batch(
+        input_path=args.input,
+        output_path=args.output,
+        workflow_class=WORKFLOW_REGISTRY[args.workflow],
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        progress_interval=args.progress_interval,
+        adaptive=parse_aimd_policy(args.adaptive_concurrency) if args.adaptive_concurrency else None,
+        prescreen=parse_prescreen_rules(args.prescreen) if args.prescreen else None,
+    )
+
+    print("\nBatch complete.")
+    print(f"Results written to: {args.output}")
+    print(f"Failed accounts: {stats.failed} / {stats.completed}")
+    if stats.prescreen is not None:
+        print(
+            f"Pre-screened accounts: {stats.prescreen['screened']} "
+            f"(~{stats.prescreen['llm_calls_saved']} LLM calls saved)"
+        )
+    if stats.speculation is not None:
+        print(
+            f"Speculative resolution: {stats.speculation['hit_rate']:.0%} hit rate over "
+            f"{stats.speculation['speculated']} accounts, {stats.speculation['wasted_llm_calls']} LLM calls "
+            f"(~${stats.speculation['wasted_cost']:.4f}) wasted"
+        )
+
+
+def seed_cassette(args: argparse.Namespace) -> None:
+    """Write the chat model calls from an experiment's traces to a cassette."""
+    from ensemble_phase_2_poc.inference.cassette import seed_cassette_from_traces
+
+    mlflow.set_tracking_uri(args.tracking_uri)
+    experiment = mlflow.get_experiment_by_name(args.experiment)
+    if experiment is None:
+        raise ValueError(f"MLflow experiment '{args.experiment}' not found")
+
+    traces = mlflow.search_traces(
+        locations=[experiment.experiment_id],
+        max_results=args.max_traces,
+        return_type="list",
+    )
+    count = seed_cassette_from_traces(traces, args.output)
+
+    print(f"\nSeeded {count} LLM calls from {len(traces)} traces into: {args.output}")
+
+
+def configure_llm(args: argparse.Namespace) -> None:
+    """Enable the LLM response cache, record/replay cassette, simulated provider, retry policy, hedging, model routing and/or rate limits if requested."""
+    from ensemble_phase_2_poc.inference.router import (
+        CASSETTE_ENV_VAR,
+        CASSETTE_MODE_ENV_VAR,
+        LLM_CACHE_ENV_VAR,
+        LLM_CACHE_TTL_ENV_VAR,
+        ROUTES_ENV_VAR,
+        SIMULATE_ENV_VAR,
+        parse_router_config,
+    )
+    from ensemble_phase_2_poc.inference.hedging import HEDGING_ENV_VAR, parse_hedging_policy
+    from ensemble_phase_2_poc.inference.rate_limit import RATE_LIMIT_STORE_ENV_VAR, RATE_LIMITS_ENV_VAR, parse_rate_limits
+    from ensemble_phase_2_poc.inference.retry import RETRY_POLICY_ENV_VAR, parse_retry_policy
+
+    if getattr(args, "llm_cache", None):
+        os.environ[LLM_CACHE_ENV_VAR] = args.llm_cache
+        if args.llm_cache_ttl is not None:
+            os.environ[LLM_CACHE_TTL_ENV_VAR] = str(args.llm_cache_ttl)
+
+    if getattr(args, "cassette", None):
+        os.environ[CASSETTE_ENV_VAR] = args.cassette
+        os.environ[CASSETTE_MODE_ENV_VAR] = args.cassette_mode
+        if args.cassette_mode == "replay":
+            # Agents read the key when building their model; replay never uses it
+            os.environ.setdefault("COHERE_API_KEY", "cassette-replay")
+
+    if getattr(args, "simulate", None):
+        os.environ[SIMULATE_ENV_VAR] = args.simulate
+        os.environ.setdefault("COHERE_API_KEY", "simulated")
+
+    if getattr(args, "retry_policy", None):
+        # Parse once here so a bad policy fails before any worker starts
+        parse_retry_policy(args.retry_policy)
+        os.environ[RETRY_POLICY_ENV_VAR] = args.retry_policy
+
+    if getattr(args, "hedge", None):
+        parse_hedging_policy(args.hedge)
+        os.environ[HEDGING_ENV_VAR] = args.hedge
+
+    if getattr(args, "routes", None):
+        parse_router_config(args.routes)
+        os.environ[ROUTES_ENV_VAR] = args.routes
+
+    if getattr(args, "rate_limits", None):
+        parse_rate_limits(args.rate_limits)
+        os.environ[RATE_LIMITS_ENV_VAR] = args.rate_limits
+        store = args.rate_limit_store
+        if store is None and getattr(args, "workers", None):
+            # Batch workers are separate processes; give them one set of buckets
+            store = os.path.join(tempfile.mkdtemp(prefix="ensemble-rate-limits-"), "buckets.db")
+        if store is not None:
+            os.environ[RATE_LIMIT_STORE_ENV_VAR] = store
+
+
+def configure_workflow(args: argparse.Namespace) -> None:
+    """Enable speculative resolution, prompt retention and/or compact tool outputs if requested."""
+    from ensemble_phase_2_poc.prompt_retention import PROMPT_RETENTION_ENV_VAR, parse_prompt_retention
+    from ensemble_phase_2_poc.tools.encoding import TOOL_OUTPUT_ENCODING_ENV_VAR, parse_output_encodings
+    from ensemble_phase_2_poc.workflow.branching_workflow import SPECULATIVE_ENV_VAR
+
+    if getattr(args, "speculative", False):
+        os.environ[SPECULATIVE_ENV_VAR] = "1"
+    if getattr(args, "prompt_retention", None):
+        parse_prompt_retention(args.prompt_retention)
+        os.environ[PROMPT_RETENTION_ENV_VAR] = args.prompt_retention
+    if getattr(args, "compact_tool_outputs", None):
+        parse_output_encodings(args.compact_tool_outputs)
+        os.environ[TOOL_OUTPUT_ENCODING_ENV_VAR] = args.compact_tool_outputs
+
+
+def configure_metrics(args: argparse.Namespace) -> None:
+    """Start the Prometheus metrics exporters if requested."""
+    from ensemble_phase_2_poc.metrics import (
+        METRICS_FILE_ENV_VAR,
+        METRICS_HOST_ENV_VAR,
+        METRICS_INTERVAL_ENV_VAR,
+        METRICS_PORT_ENV_VAR,
+        configure_from_env,
+    )
+
+    if getattr(args, "metrics_port", None) is not None:
+        os.environ[METRICS_PORT_ENV_VAR] = str(args.metrics_port)
+    if getattr(args, "metrics_host", None):
+        os.environ[METRICS_HOST_ENV_VAR] = args.metrics_host
+    if getattr(args, "metrics_file", None):
+        os.environ[METRICS_FILE_ENV_VAR] = args.metrics_file
+        os.environ[METRICS_INTERVAL_ENV_VAR] = str(args.metrics_interval)
+    configure_from_env()
+
+
 def main() -> None:
     args = parse_args()
+    configure_llm(args)
+    configure_workflow(args)
+    configure_metrics(args)
 
     if args.command == "run":
         run(args)
     elif args.command == "evaluate":
         evaluate(args)
+    elif args.command == "batch":
+        batch(args)
+    elif args.command == "seed-cassette":
+        seed_cassette(args)
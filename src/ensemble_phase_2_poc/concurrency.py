@@ -0,0 +1,195 @@
+# Adaptive concurrency for workflow execution.
+#
+# AIMDController sets how many accounts may run at once from the provider
+# feedback of the accounts that finish (inference/feedback.py):
+#   - an account whose LLM calls were throttled (429/529) or timed out cuts
+#     the limit multiplicatively
+#   - so does LLM latency drifting well above its running baseline, the
+#     usual sign of a provider queueing our requests
+#   - otherwise, while the error rate stays low, the limit grows additively,
+#     by about one per `limit` healthy accounts
+# After a cut, further cuts wait for a cool-down, so the burst of failures
+# already in flight when the provider pushed back counts once.
+#
+# run_batch(), predict_batch() and apredict_batch() take an AIMDPolicy; other
+# callers wrap each workflow run in `with controller.slot():`, or
+# `async with controller.aslot():` on an event loop.
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, Iterator
+
+from ensemble_phase_2_poc.config import parse_config
+from ensemble_phase_2_poc.inference.feedback import ProviderFeedback, collect_feedback
+from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.metrics import REGISTRY
+
+
+logger = get_logger(__name__)
+
+CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "ensemble_concurrency_limit", "Accounts allowed to run at once by the adaptive controller", ("controller",)
+)
+CONCURRENCY_ADJUSTMENTS = REGISTRY.counter(
+    "ensemble_concurrency_adjustments",
+    "Adaptive concurrency limit changes by direction and cause",
+    ("controller", "direction", "reason"),
+)
+
+# Weight of each new account in the latency baseline
+_BASELINE_ALPHA = 0.05
+
+
+@dataclass(frozen=True)
+class AIMDPolicy:
+    """Bounds and step sizes of the adaptive concurrency limit"""
+
+    initial_limit: int = 4
+    min_limit: int = 1
+    max_limit: int = 64
+    # Added to the limit per `limit` healthy accounts
+    increase: float = 1.0
+    # Limit multiplier on throttling, timeouts or high latency
+    decrease: float = 0.5
+    # Mean LLM latency above this multiple of the baseline counts as overload
+    latency_tolerance: float = 2.0
+    # Growth pauses while more than this fraction of an account's LLM calls fail
+    max_error_rate: float = 0.1
+    # Seconds after a cut before the limit can be cut again
+    cooldown: float = 5.0
+
+    def __post_init__(self) -> None:
+        if not 1 <= self.min_limit <= self.initial_limit <= self.max_limit:
+            raise ValueError("Limits must satisfy 1 <= min_limit <= initial_limit <= max_limit")
+        if not 0 < self.decrease < 1:
+            raise ValueError(f"decrease must be between 0 and 1, got {self.decrease}")
+        if self.latency_tolerance <= 1:
+            raise ValueError(f"latency_tolerance must be > 1, got {self.latency_tolerance}")
+
+    def capped(self, ceiling: int) -> "AIMDPolicy":
+        """This policy with its limits lowered to at most `ceiling`, e.g. the threads available"""
+        max_limit = min(self.max_limit, ceiling)
+        return replace(
+            self,
+            max_limit=max_limit,
+            min_limit=min(self.min_limit, max_limit),
+            initial_limit=min(self.initial_limit, max_limit),
+        )
+
+
+def parse_aimd_policy(value: str) -> AIMDPolicy:
+    """AIMDPolicy from "1", a JSON object or a path to a JSON file"""
+    return parse_config(value, AIMDPolicy, "Adaptive concurrency policy")
+
+
+class AIMDController:
+    """Additive-increase/multiplicative-decrease limit on concurrently running accounts"""
+
+    def __init__(self, policy: AIMDPolicy | None = None, name: str = "default"):
+        self.policy = policy or AIMDPolicy()
+        self.name = name
+        self._condition = threading.Condition()
+        # Created by the first aslot(), on the event loop it runs on
+        self._async_condition: asyncio.Condition | None = None
+        self._limit = float(self.policy.initial_limit)
+        self._in_flight = 0
+        self._baseline: float | None = None
+        self._last_decrease = float("-inf")
+        CONCURRENCY_LIMIT.labels(name).set(self.limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def on_result(self, feedback: ProviderFeedback) -> None:
+        """Adjust the limit from the provider feedback of one finished account"""
+        with self._condition:
+            reason = self._overload(feedback)
+            if reason is not None:
+                self._decrease(reason)
+            elif feedback.calls and feedback.errors / feedback.calls <= self.policy.max_error_rate:
+                self._increase()
+            self._condition.notify_all()
+
+    def _overload(self, feedback: ProviderFeedback) -> str | None:
+        """Why the account's feedback calls for a cut, if it does. Updates the latency baseline."""
+        if feedback.throttled:
+            return "throttled"
+        if feedback.timeouts:
+            return "timeout"
+        latency = feedback.mean_latency
+        if latency is None:
+            return None
+        if self._baseline is None:
+            self._baseline = latency
+            return None
+        overloaded = latency > self._baseline * self.policy.latency_tolerance
+        self._baseline += _BASELINE_ALPHA * (latency - self._baseline)
+        return "latency" if overloaded else None
+
+    def _increase(self) -> None:
+        before = self.limit
+        self._limit = min(float(self.policy.max_limit), self._limit + self.policy.increase / max(self.limit, 1))
+        if self.limit != before:
+            CONCURRENCY_ADJUSTMENTS.labels(self.name, "increase", "healthy").inc()
+            CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.policy.cooldown:
+            return
+        self._last_decrease = now
+        before = self.limit
+        self._limit = max(float(self.policy.min_limit), self._limit * self.policy.decrease)
+        if self.limit != before:
+            logger.info(f"Concurrency limit {before} -> {self.limit} ({reason})")
+            CONCURRENCY_ADJUSTMENTS.labels(self.name, "decrease", reason).inc()
+            CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+
+    def has_capacity(self, in_flight: int) -> bool:
+        """Whether another account may start while `in_flight` are running"""
+        return in_flight < self.limit
+
+    @contextmanager
+    def slot(self) -> Iterator[ProviderFeedback]:
+        """Wait for room under the limit, then run the block and learn from its provider feedback"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.has_capacity(self._in_flight))
+            self._in_flight += 1
+        try:
+            with collect_feedback() as feedback:
+                yield feedback
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+            self.on_result(feedback)
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[ProviderFeedback]:
+        """
+        Async twin of slot() that waits without blocking the event loop. Use a
+        controller either from threads with slot() or from the coroutines of
+        one event loop with aslot(), not both.
+        """
+        if self._async_condition is None:
+            self._async_condition = asyncio.Condition()
+        async with self._async_condition:
+            await self._async_condition.wait_for(lambda: self.has_capacity(self._in_flight))
+            with self._condition:
+                self._in_flight += 1
+        try:
+            with collect_feedback() as feedback:
+                yield feedback
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+            self.on_result(feedback)
+            async with self._async_condition:
+                self._async_condition.notify_all()
@@ -0,0 +1,114 @@
+# Settings for optional features, shared by the CLI, the environment and
+# batch workers.
+#
+# Features such as the retry policy, hedging, rate limits, model routing and
+# the pre-screen take their settings as one string: "1" (or "true") for the
+# defaults, an inline JSON object, or the path of a JSON file.
+#   - load_json_config() reads such a value into a dict
+#   - parse_config() builds a frozen config dataclass from it, rejecting
+#     fields the dataclass doesn't have; build_config() does the same for a
+#     nested object, e.g. one entry of a mapping
+#   - ConfiguredFromEnv configures a process-wide setting from its env var
+#     the first time it is used, unless it was configured explicitly first,
+#     so worker processes follow the CLI without being passed anything
+#   - env_setting() is for settings read on every use, cached per value of
+#     their env var so changing the variable takes effect immediately
+
+import dataclasses
+import json
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Callable, TypeVar
+
+
+T = TypeVar("T")
+
+# Values that mean "on, with the defaults"
+DEFAULT_VALUES = ("1", "true")
+
+
+def load_json_config(value: str, what: str) -> dict[str, Any]:
+    """
+    The JSON object in `value`, given inline or as the path of a file holding it.
+    "1", "true" and "" are an empty object, i.e. all defaults. `what` names
+    the setting in errors.
+    """
+    value = value.strip()
+    if not value or value.lower() in DEFAULT_VALUES:
+        return {}
+    if not value.startswith(("{", "[")):
+        with open(value, "r") as file:
+            value = file.read()
+    try:
+        config = json.loads(value)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{what} is not valid JSON: {e}") from None
+    if not isinstance(config, dict):
+        raise ValueError(f"{what} must be a JSON object")
+    return config
+
+
+def parse_config(value: str, cls: type[T], what: str, /, **converters: Callable[[Any], Any]) -> T:
+    """
+    Dataclass `cls` from a value load_json_config() accepts. `converters` turn
+    JSON values into field types, e.g. `retry_statuses=tuple`.
+    """
+    return build_config(load_json_config(value, what), cls, what, **converters)
+
+
+def build_config(config: Any, cls: type[T], what: str, /, **converters: Callable[[Any], Any]) -> T:
+    """Dataclass `cls` from an already-loaded JSON object, as parse_config()"""
+    if not isinstance(config, dict):
+        raise ValueError(f"{what} must be a JSON object")
+    if unknown := set(config) - {field.name for field in dataclasses.fields(cls)}:
+        raise ValueError(f"Unknown {what} fields: {sorted(unknown)}")
+    return cls(**{name: converters[name](value) if name in converters else value for name, value in config.items()})
+
+
+class ConfiguredFromEnv:
+    """
+    Once-per-process guard for a module's global setting. The first ensure()
+    calls `configure` with the env var's value (None when unset), unless the
+    module was configured explicitly first and called mark_configured().
+    """
+
+    def __init__(self, env_var: str, configure: Callable[[str | None], Any]):
+        self.env_var = env_var
+        self._configure = configure
+        # Reentrant: `configure` usually ends in the module's own configure
+        # function, which calls mark_configured()
+        self._lock = threading.RLock()
+        self._configured = False
+
+    def ensure(self) -> None:
+        if self._configured:
+            return
+        with self._lock:
+            if not self._configured:
+                self._configure(os.environ.get(self.env_var, "").strip() or None)
+                self._configured = True
+
+    def mark_configured(self) -> None:
+        self._configured = True
+
+    def reset(self) -> None:
+        """Read the environment again on the next ensure()"""
+        with self._lock:
+            self._configured = False
+
+
+def env_setting(env_var: str, parse: Callable[[str], T], default: T) -> Callable[[], T]:
+    """
+    Getter for a setting read from `env_var` on every call. Each distinct value
+    is parsed once; `default` is used while the variable is unset or empty.
+    """
+
+    @lru_cache(maxsize=8)
+    def _parse(value: str) -> T:
+        return parse(value) if value else default
+
+    def get() -> T:
+        return _parse(os.environ.get(env_var, "").strip())
+
+    return get
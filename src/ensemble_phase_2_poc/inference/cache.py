@@ -0,0 +1,279 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from ensemble_phase_2_poc.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# Message fields that differ between otherwise identical conversations
+_VOLATILE_FIELDS = ("response_metadata", "usage_metadata")
+# Fields holding provider-generated tool call ids, which are random per run
+_TOOL_CALL_ID_FIELDS = ("id", "tool_call_id")
+
+_PRUNE_EVERY = 100
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Canonical form of a serialized message list, so replays of the same
+    conversation hit the cache. Tool call ids are renumbered in order of
+    appearance (keeping calls and their results linked) and per-response
+    metadata such as token usage is dropped.
+    """
+    try:
+        messages = json.loads(prompt)
+    except json.JSONDecodeError:
+        return prompt
+
+    tool_call_ids: dict[str, str] = {}
+
+    def _normalize(value: Any) -> Any:
+        if isinstance(value, dict):
+            normalized = {}
+            for key, item in value.items():
+                if key in _VOLATILE_FIELDS:
+                    continue
+                if key in _TOOL_CALL_ID_FIELDS and isinstance(item, str):
+                    item = tool_call_ids.setdefault(item, f"call_{len(tool_call_ids)}")
+                normalized[key] = _normalize(item)
+            return normalized
+        if isinstance(value, list):
+            return [_normalize(item) for item in value]
+        return value
+
+    return json.dumps(_normalize(messages), sort_keys=True)
+
+
+def serialize_generations(generations: RETURN_VAL_TYPE) -> str:
+    """JSON form of a chat model response, including tool calls and usage metadata"""
+    return json.dumps(
+        [
+            {"message": message_to_dict(generation.message)}
+            if isinstance(generation, ChatGeneration)
+            else {"text": generation.text}
+            for generation in generations
+        ]
+    )
+
+
+def deserialize_generations(value: str) -> RETURN_VAL_TYPE:
+    """
+    Inverse of serialize_generations. Messages are tagged with
+    `response_metadata["cache_hit"]` so usage accounting can tell served
+    responses from billed ones.
+    """
+    generations: RETURN_VAL_TYPE = []
+    for item in json.loads(value):
+        if "message" in item:
+            message = messages_from_dict([item["message"]])[0]
+            message.response_metadata = {**message.response_metadata, "cache_hit": True}
+            generations.append(ChatGeneration(message=message))
+        else:
+            generations.append(Generation(text=item["text"]))
+    return generations
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Content address for a request: normalized messages + model, params and tool schemas"""
+    digest = hashlib.sha256()
+    digest.update(normalize_prompt(prompt).encode())
+    digest.update(b"\0")
+    digest.update(llm_string.encode())
+    return digest.hexdigest()
+
+
+class ResponseCache(BaseCache):
+    """
+    Content-addressed LLM response cache: an in-memory LRU over an optional
+    SQLite file shared across processes.
+
+    Plugged into chat models through LangChain's `cache` field, so lookups
+    happen inside `BaseChatModel._generate_with_cache` and cover tool-calling
+    responses as well as plain text. Entries older than `ttl_seconds` are
+    treated as misses; the disk tier is pruned to `max_disk_entries`, least
+    recently used first.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        max_memory_entries: int = 1024,
+        max_disk_entries: int = 100_000,
+        ttl_seconds: float | None = None,
+    ):
+        self.path = Path(path) if path is not None else None
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_prune = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connection() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+                )
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[1], now):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return deserialize_generations(entry[0])
+            if entry is not None:
+                del self._memory[key]
+
+        entry = self._disk_get(key, now)
+        if entry is not None:
+            with self._lock:
+                self.disk_hits += 1
+                self._memory_put(key, entry)
+            return deserialize_generations(entry[0])
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = cache_key(prompt, llm_string)
+        entry = (serialize_generations(return_val), time.time())
+
+        with self._lock:
+            self.writes += 1
+            self._memory_put(key, entry)
+        self._disk_put(key, entry)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.path is not None:
+            with self._connection() as connection:
+                connection.execute("DELETE FROM responses")
+
+    def stats(self) -> dict[str, Any]:
+        """Hit/miss counts per tier"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "path": str(self.path) if self.path is not None else None,
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _memory_put(self, key: str, entry: tuple[str, float]) -> None:
+        """Insert into the LRU tier. Caller must hold the lock."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _connection(self) -> sqlite3.Connection:
+        """One SQLite connection per thread; WAL lets worker processes share the file"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _disk_get(self, key: str, now: float) -> tuple[str, float] | None:
+        if self.path is None:
+            return None
+
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1], now):
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0], row[1]
+
+    def _disk_put(self, key: str, entry: tuple[str, float]) -> None:
+        if self.path is None:
+            return
+
+        value, created_at = entry
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, created_at, created_at),
+            )
+
+        with self._lock:
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= _PRUNE_EVERY
+            if should_prune:
+                self._writes_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """Drop expired entries and trim the disk tier to max_disk_entries. Returns rows removed."""
+        if self.path is None:
+            return 0
+
+        removed = 0
+        with self._connection() as connection:
+            if self.ttl_seconds is not None:
+                removed += connection.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                ).rowcount
+            (count,) = connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_disk_entries:
+                removed += connection.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_disk_entries,),
+                ).rowcount
+
+        if removed:
+            with self._lock:
+                self.evictions += removed
+            logger.debug(f"Pruned {removed} entries from response cache {self.path}")
+        return removed
+
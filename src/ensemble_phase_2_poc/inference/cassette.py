@@ -0,0 +1,285 @@
+# Record/replay of LLM calls.
+#
+# A cassette is a JSONL file of request/response pairs. In record mode every
+# call goes to the provider and is appended to the cassette; in replay mode
+# responses are served from the cassette and nothing reaches the network.
+# Cassettes can also be seeded from chat model spans in existing MLflow traces.
+
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Iterable, Literal
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from mlflow.entities import SpanType
+from mlflow.tracing.constant import SpanAttributeKey
+from langchain_core.messages import AIMessage, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+from ensemble_phase_2_poc.inference.cache import deserialize_generations, serialize_generations
+from ensemble_phase_2_poc.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+CassetteMode = Literal["record", "replay"]
+CASSETTE_MODES: tuple[str, ...] = ("record", "replay")
+
+# LangChain message classes -> chat roles, as recorded by MLflow traces
+_ROLES = {
+    "SystemMessage": "system",
+    "HumanMessage": "user",
+    "AIMessage": "assistant",
+    "AIMessageChunk": "assistant",
+    "ToolMessage": "tool",
+}
+
+
+class CassetteMissError(LookupError):
+    """A replayed request has no recorded response"""
+
+
+def _content_text(content: Any) -> str:
+    """Flatten string or content-block message content to text"""
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block if isinstance(block, str) else str(block.get("text", ""))
+        for block in content
+    )
+
+
+def _canonical_messages(messages: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Provider-neutral form of a conversation: role, text and tool calls.
+    Tool call ids are renumbered in order of appearance so recordings match
+    replays whose provider-generated ids differ.
+    """
+    tool_call_ids: dict[str, str] = {}
+
+    def _call_id(call_id: str | None) -> str | None:
+        if not call_id:
+            return None
+        return tool_call_ids.setdefault(call_id, f"call_{len(tool_call_ids)}")
+
+    canonical = []
+    for message in messages:
+        entry: dict[str, Any] = {"role": message["role"], "content": _content_text(message.get("content"))}
+        if message.get("tool_calls"):
+            entry["tool_calls"] = [
+                {"id": _call_id(call.get("id")), "name": call["name"], "args": call["args"]}
+                for call in message["tool_calls"]
+            ]
+        if message.get("tool_call_id"):
+            entry["tool_call_id"] = _call_id(message["tool_call_id"])
+        canonical.append(entry)
+    return canonical
+
+
+def messages_from_prompt(prompt: str) -> list[dict[str, Any]]:
+    """Chat messages from the serialized prompt LangChain passes to caches"""
+    messages = []
+    for item in json.loads(prompt):
+        kwargs = item.get("kwargs", {})
+        messages.append(
+            {
+                "role": _ROLES.get(item["id"][-1], item["id"][-1]),
+                "content": kwargs.get("content"),
+                "tool_calls": kwargs.get("tool_calls"),
+                "tool_call_id": kwargs.get("tool_call_id"),
+            }
+        )
+    return messages
+
+
+def messages_from_trace_inputs(inputs: dict[str, Any]) -> list[dict[str, Any]]:
+    """Chat messages from a CHAT_MODEL span's inputs, as recorded by mlflow.langchain.autolog"""
+    messages = []
+    for message in inputs["messages"]:
+        tool_calls = [
+            {
+                "id": call.get("id"),
+                "name": call["function"]["name"],
+                "args": json.loads(call["function"].get("arguments") or "{}"),
+            }
+            for call in message.get("tool_calls") or []
+        ]
+        messages.append(
+            {
+                "role": message["role"],
+                "content": message.get("content"),
+                "tool_calls": tool_calls or None,
+                "tool_call_id": message.get("tool_call_id"),
+            }
+        )
+    return messages
+
+
+def generations_from_trace_outputs(
+    outputs: dict[str, Any],
+    usage: dict[str, int] | None = None,
+) -> RETURN_VAL_TYPE:
+    """
+    Response generations from a CHAT_MODEL span's outputs, either the chat
+    completion form ({"choices": [...]}) or a serialized LLMResult
+    ({"generations": [[...]]}). `usage` is the span's recorded token usage.
+    """
+    if "choices" in outputs:
+        message = outputs["choices"][0]["message"]
+        tool_calls = [
+            {
+                "id": call.get("id"),
+                "name": call["function"]["name"],
+                "args": json.loads(call["function"].get("arguments") or "{}"),
+            }
+            for call in message.get("tool_calls") or []
+        ]
+        response = AIMessage(content=_content_text(message.get("content")), tool_calls=tool_calls)
+    else:
+        generation = outputs["generations"][0][0]
+        message = generation.get("message")
+        if isinstance(message, dict) and "kwargs" in message:
+            # LangChain constructor form: {"lc": 1, "type": "constructor", "kwargs": {...}}
+            message = message["kwargs"]
+        if isinstance(message, dict):
+            data = {key: value for key, value in message.items() if key != "type"}
+            response = messages_from_dict([{"type": "ai", "data": data}])[0]
+        else:
+            response = AIMessage(content=generation.get("text", ""))
+
+    if usage and not response.usage_metadata:
+        response.usage_metadata = {
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+        }
+    return [ChatGeneration(message=response)]
+
+
+def conversation_key(messages: Iterable[dict[str, Any]]) -> str:
+    """Cassette key for a conversation"""
+    canonical = json.dumps(_canonical_messages(messages), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class Cassette(BaseCache):
+    """
+    Record/replay layer for chat models, plugged in through LangChain's
+    `cache` field like ResponseCache.
+
+    Requests are matched on conversation content (roles, text and tool calls),
+    not on model configuration, so cassettes seeded from traces replay against
+    the current agents. A request recorded several times replays its responses
+    in recorded order, cycling if it is asked for more often.
+    """
+
+    def __init__(self, path: str | Path, mode: CassetteMode = "replay"):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unsupported cassette mode '{mode}', expected one of {CASSETTE_MODES}")
+
+        self.path = Path(path)
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries: dict[str, list[str]] = defaultdict(list)
+        self._positions: dict[str, int] = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+        if self.mode == "replay":
+            if not self.path.exists():
+                raise ValueError(f"Cassette not found: {self.path}")
+            self._load()
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _load(self) -> None:
+        with open(self.path, "r") as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry["response"])
+        logger.info(f"Loaded {sum(map(len, self._entries.values()))} recorded responses from {self.path}")
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        if self.mode == "record":
+            return None
+
+        messages = messages_from_prompt(prompt)
+        key = conversation_key(messages)
+        with self._lock:
+            responses = self._entries.get(key)
+            if not responses:
+                self.misses += 1
+                last = _content_text(messages[-1]["content"])[:200] if messages else ""
+                raise CassetteMissError(
+                    f"No recorded response in {self.path} for a {len(messages)}-message "
+                    f"conversation ending with: {last!r}"
+                )
+            position = self._positions[key]
+            self._positions[key] = position + 1
+            self.hits += 1
+            return deserialize_generations(responses[position % len(responses)])
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.mode != "record":
+            return
+        self.append(messages_from_prompt(prompt), return_val)
+
+    def append(self, messages: list[dict[str, Any]], return_val: RETURN_VAL_TYPE) -> None:
+        """Append one request/response pair to the cassette file"""
+        line = json.dumps(
+            {
+                "key": conversation_key(messages),
+                "messages": _canonical_messages(messages),
+                "response": serialize_generations(return_val),
+            },
+            default=str,
+        )
+        # One write per line in append mode, so worker processes can share a cassette
+        with self._lock, open(self.path, "a") as file:
+            file.write(line + "\n")
+            self.recorded += 1
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._positions.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "path": str(self.path),
+                "mode": self.mode,
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+            }
+
+
+def seed_cassette_from_traces(traces: Iterable[Any], path: str | Path) -> int:
+    """
+    Append every chat model call found in `traces` (mlflow.entities.Trace) to
+    the cassette at `path`. Returns the number of calls written.
+    """
+    cassette = Cassette(path, mode="record")
+    for trace in traces:
+        for span in trace.search_spans(span_type=SpanType.CHAT_MODEL):
+            if not span.inputs or not span.outputs:
+                continue
+            try:
+                messages = messages_from_trace_inputs(span.inputs)
+                generations = generations_from_trace_outputs(
+                    span.outputs, usage=span.get_attribute(SpanAttributeKey.CHAT_USAGE)
+                )
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping chat model span {span.span_id}: {e}")
+                continue
+            cassette.append(messages, generations)
+
+    logger.info(f"Seeded {cassette.recorded} responses into {path}")
+    return cassette.recorded
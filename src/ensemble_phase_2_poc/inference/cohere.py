@@ -1,13 +1,43 @@
-import backoff
+import cohere
 from langchain_cohere import ChatCohere
-from typing import Any
+from pydantic import Field, model_validator
+from typing import Any, ClassVar, Self
 
+from ensemble_phase_2_poc.inference.hedging import HedgingChatModel
+from ensemble_phase_2_poc.inference.rate_limit import RateLimitedChatModel
+from ensemble_phase_2_poc.inference.retry import RetryingChatModel
 
-class CustomChatCohere(ChatCohere):
-    @backoff.on_exception(backoff.expo, Exception, max_tries=5, jitter=backoff.full_jitter)
-    def invoke(self, *args: Any, **kwargs: Any):
-        return super().invoke(*args, **kwargs)
 
-    @backoff.on_exception(backoff.expo, Exception, max_tries=5, jitter=backoff.full_jitter)
-    async def ainvoke(self, *args: Any, **kwargs: Any):
-        return await super().ainvoke(*args, **kwargs)
+class CustomChatCohere(RetryingChatModel, HedgingChatModel, RateLimitedChatModel, ChatCohere):
+    retry_provider: ClassVar[str] = "cohere"
+    api_key_field: ClassVar[str | None] = "cohere_api_key"
+
+    # Optional shared httpx clients (see inference/pool.py). When set, the Cohere
+    # SDK clients are rebuilt on top of them so connections are pooled.
+    httpx_client: Any = Field(default=None, exclude=True)
+    httpx_async_client: Any = Field(default=None, exclude=True)
+
+    @model_validator(mode="after")
+    def use_shared_http_clients(self) -> Self:
+        """Rebuild the Cohere SDK clients on the shared httpx clients, if provided"""
+        if self.httpx_client is None and self.httpx_async_client is None:
+            return self
+
+        api_key = self.cohere_api_key.get_secret_value() if self.cohere_api_key else None
+        if self.httpx_client is not None:
+            self.client = cohere.Client(
+                api_key=api_key,
+                timeout=self.timeout_seconds,
+                client_name=self.user_agent,
+                base_url=self.base_url,
+                httpx_client=self.httpx_client,
+            )
+        if self.httpx_async_client is not None:
+            self.async_client = cohere.AsyncClient(
+                api_key=api_key,
+                timeout=self.timeout_seconds,
+                client_name=self.user_agent,
+                base_url=self.base_url,
+                httpx_client=self.httpx_async_client,
+            )
+        return self
@@ -0,0 +1,98 @@
+# Provider feedback for load control.
+#
+# Every attempt made through the retry wrappers (inference/retry.py) reports
+# how the provider answered: in time, throttled (429/529), timed out, or with
+# another error. Code that wants these signals, like the adaptive concurrency
+# controller, collects them for the calls made inside a block of work:
+#
+#     with collect_feedback() as feedback:
+#         workflow.predict(request)
+#     feedback.throttled, feedback.mean_latency
+#
+# Collection follows the context, so calls made from hedging threads, tool
+# threads and async tasks started inside the block are included.
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, fields
+from typing import Any, Iterator, Literal
+
+import httpx
+import openai
+
+
+Outcome = Literal["ok", "throttled", "timeout", "error"]
+
+# Statuses a provider uses to say it is overloaded or we are over quota
+THROTTLE_STATUSES = (429, 529)
+
+_COLLECTORS: ContextVar[tuple["ProviderFeedback", ...]] = ContextVar("provider_feedback", default=())
+
+
+def classify(error: BaseException | None) -> Outcome:
+    """Outcome of one provider attempt from the error it raised, if any"""
+    if error is None:
+        return "ok"
+    if getattr(error, "status_code", None) in THROTTLE_STATUSES:
+        return "throttled"
+    if isinstance(error, (TimeoutError, httpx.TimeoutException, openai.APITimeoutError)):
+        return "timeout"
+    return "error"
+
+
+@dataclass
+class ProviderFeedback:
+    """Outcome counts and latency of the provider attempts made in a block of work"""
+
+    calls: int = 0
+    throttled: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    # Summed over successful attempts only
+    latency_seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, outcome: Outcome, latency: float) -> None:
+        with self._lock:
+            self.calls += 1
+            if outcome == "ok":
+                self.latency_seconds += latency
+            elif outcome == "throttled":
+                self.throttled += 1
+            elif outcome == "timeout":
+                self.timeouts += 1
+            else:
+                self.errors += 1
+
+    @property
+    def succeeded(self) -> int:
+        return self.calls - self.throttled - self.timeouts - self.errors
+
+    @property
+    def mean_latency(self) -> float | None:
+        return self.latency_seconds / self.succeeded if self.succeeded else None
+
+    def as_dict(self) -> dict[str, Any]:
+        """Plain counts, to send back from a worker process"""
+        return {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith("_")}
+
+
+@contextmanager
+def collect_feedback() -> Iterator[ProviderFeedback]:
+    """Collect the outcome of every provider attempt made inside the block"""
+    feedback = ProviderFeedback()
+    token = _COLLECTORS.set((*_COLLECTORS.get(), feedback))
+    try:
+        yield feedback
+    finally:
+        _COLLECTORS.reset(token)
+
+
+def report(error: BaseException | None, latency: float) -> None:
+    """Record one provider attempt with every active collector"""
+    collectors = _COLLECTORS.get()
+    if collectors:
+        outcome = classify(error)
+        for feedback in collectors:
+            feedback.record(outcome, latency)
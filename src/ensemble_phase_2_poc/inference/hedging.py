@@ -0,0 +1,300 @@
+# Hedged LLM requests.
+#
+# With hedging enabled, a chat model call that hasn't returned within the
+# configured percentile of recent latency for its (provider, model) gets a
+# duplicate request. Whichever finishes first wins; the other is cancelled
+# (async) or abandoned and its result discarded (sync, where a running
+# request can't be interrupted). Hedges are capped at a fraction of calls, so
+# the extra spend is bounded.
+#
+# The race runs inside the model's _generate(), under the single callback run
+# LangChain opens for the call, so latency, token usage and per-node totals
+# are recorded once, for the answer that was used.
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, TypeVar
+
+from ensemble_phase_2_poc.config import ConfiguredFromEnv, parse_config
+from ensemble_phase_2_poc.inference.retry import RetryBudget
+from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.metrics import REGISTRY
+
+
+logger = get_logger(__name__)
+
+# "1" for the default HedgingPolicy, or its fields as JSON (inline or a file path)
+HEDGING_ENV_VAR = "ENSEMBLE_LLM_HEDGING"
+
+HEDGES_FIRED = REGISTRY.counter("ensemble_llm_hedges", "Duplicate chat model requests fired", ("provider", "model"))
+HEDGES_WON = REGISTRY.counter(
+    "ensemble_llm_hedges_won", "Hedged calls answered by the duplicate request", ("provider", "model")
+)
+HEDGES_SKIPPED = REGISTRY.counter(
+    "ensemble_llm_hedges_skipped", "Slow calls not hedged because the hedge budget was spent", ("provider", "model")
+)
+
+# Recompute a window's percentile after this many new samples rather than on every call
+_RECOMPUTE_EVERY = 16
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class HedgingPolicy:
+    """When to fire a duplicate request, and how many extra requests are allowed"""
+
+    # Hedge once a call has run longer than this percentile of recent latency...
+    percentile: float = 0.95
+    # ...but never sooner than this many seconds
+    min_delay: float = 0.25
+    # Latency samples kept per (provider, model), and needed before hedging starts
+    sample_window: int = 1000
+    min_samples: int = 20
+    # Hedges per call allowed over budget_window seconds
+    max_hedge_ratio: float = 0.05
+    budget_window: float = 60.0
+
+    def __post_init__(self) -> None:
+        if not 0 < self.percentile < 1:
+            raise ValueError(f"percentile must be between 0 and 1, got {self.percentile}")
+        if not 0 <= self.max_hedge_ratio <= 1:
+            raise ValueError(f"max_hedge_ratio must be between 0 and 1, got {self.max_hedge_ratio}")
+        if self.min_samples < 1 or self.sample_window < self.min_samples:
+            raise ValueError("sample_window must be >= min_samples >= 1")
+
+
+def parse_hedging_policy(value: str) -> HedgingPolicy:
+    """HedgingPolicy from "1", a JSON object or a path to a JSON file"""
+    return parse_config(value, HedgingPolicy, "Hedging policy")
+
+
+class LatencyWindow:
+    """Recent successful call latencies for one (provider, model)"""
+
+    def __init__(self, size: int):
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=size)
+        self._since_recompute = 0
+        self._percentiles: dict[float, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append(latency)
+            self._since_recompute += 1
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            if q not in self._percentiles or self._since_recompute >= _RECOMPUTE_EVERY:
+                ordered = sorted(self._samples)
+                self._percentiles = {}
+                self._since_recompute = 0
+                if not ordered:
+                    return 0.0
+                self._percentiles[q] = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            return self._percentiles[q]
+
+
+def _configure_from_env(value: str | None) -> None:
+    if value:
+        configure_hedging(parse_hedging_policy(value))
+
+
+class _HedgingState:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.from_env = ConfiguredFromEnv(HEDGING_ENV_VAR, _configure_from_env)
+        self.policy: HedgingPolicy | None = None
+        self.budget: RetryBudget | None = None
+        self.windows: dict[tuple[str, str], LatencyWindow] = {}
+        self.executor: ThreadPoolExecutor | None = None
+
+
+_STATE = _HedgingState()
+
+
+def configure_hedging(policy: HedgingPolicy | None = None) -> HedgingPolicy:
+    """Enable hedging with `policy` (defaults when None), resetting latency history and budget"""
+    policy = policy or HedgingPolicy()
+    with _STATE.lock:
+        _STATE.from_env.mark_configured()
+        _STATE.policy = policy
+        _STATE.budget = RetryBudget(policy.max_hedge_ratio, 0, policy.budget_window)
+        _STATE.windows = {}
+    return policy
+
+
+def disable_hedging() -> None:
+    with _STATE.lock:
+        _STATE.from_env.mark_configured()
+        _STATE.policy = None
+
+
+def get_hedging_policy() -> HedgingPolicy | None:
+    """The active policy, or None when hedging is off. Configured from the environment on first use."""
+    _STATE.from_env.ensure()
+    return _STATE.policy
+
+
+
+def latency_window(provider: str, model: str) -> LatencyWindow:
+    key = (provider, model)
+    window = _STATE.windows.get(key)
+    if window is None:
+        with _STATE.lock:
+            window = _STATE.windows.setdefault(key, LatencyWindow(_STATE.policy.sample_window))
+    return window
+
+
+def _hedge_delay(policy: HedgingPolicy, window: LatencyWindow) -> float | None:
+    """Seconds to wait before hedging, or None while there is too little history"""
+    if len(window) < policy.min_samples:
+        return None
+    return max(policy.min_delay, window.percentile(policy.percentile))
+
+
+def _executor() -> ThreadPoolExecutor:
+    """Threads for sync calls, which must run off the caller's thread to be raced"""
+    if _STATE.executor is None:
+        with _STATE.lock:
+            if _STATE.executor is None:
+                _STATE.executor = ThreadPoolExecutor(max_workers=256, thread_name_prefix="llm-hedge")
+    return _STATE.executor
+
+
+def _timed(window: LatencyWindow, call: Callable[[], T]) -> T:
+    start = time.perf_counter()
+    result = call()
+    window.record(time.perf_counter() - start)
+    return result
+
+
+async def _atimed(window: LatencyWindow, call: Callable[[], Awaitable[T]]) -> T:
+    start = time.perf_counter()
+    result = await call()
+    window.record(time.perf_counter() - start)
+    return result
+
+
+def hedged_call(provider: str, model: str, call: Callable[[], T]) -> T:
+    """Run `call`, racing a duplicate against it if it is slow and hedging is enabled"""
+    policy = get_hedging_policy()
+    if policy is None:
+        return call()
+
+    window = latency_window(provider, model)
+    _STATE.budget.record_call()
+    delay = _hedge_delay(policy, window)
+    if delay is None:
+        return _timed(window, call)
+
+    # Each attempt runs in a copy of the caller's context, so callbacks and
+    # per-node usage tracking still see it
+    executor = _executor()
+    primary = executor.submit(contextvars.copy_context().run, _timed, window, call)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+    if not _STATE.budget.try_spend():
+        HEDGES_SKIPPED.labels(provider, model).inc()
+        return primary.result()
+
+    HEDGES_FIRED.labels(provider, model).inc()
+    logger.debug(f"Hedging {provider}/{model} call after {delay:.2f}s")
+    hedge = executor.submit(contextvars.copy_context().run, _timed, window, call)
+
+    pending: set[Future] = {primary, hedge}
+    error: BaseException | None = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    HEDGES_WON.labels(provider, model).inc()
+                # A request already running can't be interrupted; its result is dropped
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            error = error or future.exception()
+    raise error
+
+
+async def ahedged_call(provider: str, model: str, call: Callable[[], Awaitable[T]]) -> T:
+    """Async twin of hedged_call(); the losing request is cancelled"""
+    policy = get_hedging_policy()
+    if policy is None:
+        return await call()
+
+    window = latency_window(provider, model)
+    _STATE.budget.record_call()
+    delay = _hedge_delay(policy, window)
+    if delay is None:
+        return await _atimed(window, call)
+
+    primary = asyncio.ensure_future(_atimed(window, call))
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return primary.result()
+        if not _STATE.budget.try_spend():
+            HEDGES_SKIPPED.labels(provider, model).inc()
+            return await primary
+
+        HEDGES_FIRED.labels(provider, model).inc()
+        logger.debug(f"Hedging {provider}/{model} call after {delay:.2f}s")
+        hedge = asyncio.ensure_future(_atimed(window, call))
+        tasks.add(hedge)
+
+        pending = set(tasks)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        HEDGES_WON.labels(provider, model).inc()
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+class HedgingChatModel:
+    """
+    Mixin for chat models: races a duplicate request against slow provider
+    requests in _generate()/_agenerate() when hedging is enabled. List it
+    before RateLimitedChatModel, so both requests reserve capacity. Provider
+    and model names come from RetryingChatModel. Models that define their own
+    _generate() wrap it in _hedged() instead.
+    """
+
+    def _hedged(self, call: Callable[[], T]) -> T:
+        return hedged_call(self.retry_provider, self._retry_model_name, call)
+
+    async def _ahedged(self, call: Callable[[], Awaitable[T]]) -> T:
+        return await ahedged_call(self.retry_provider, self._retry_model_name, call)
+
+    def _generate(self, messages: list[Any], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any) -> Any:
+        # Only the first request reports streamed tokens to the run
+        calls = iter((run_manager, None))
+        return self._hedged(
+            lambda: super(HedgingChatModel, self)._generate(messages, stop=stop, run_manager=next(calls, None), **kwargs)
+        )
+
+    async def _agenerate(self, messages: list[Any], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any) -> Any:
+        calls = iter((run_manager, None))
+        return await self._ahedged(
+            lambda: super(HedgingChatModel, self)._agenerate(messages, stop=stop, run_manager=next(calls, None), **kwargs)
+        )
@@ -1,13 +1,12 @@
-import backoff
+from typing import ClassVar
+
 from langchain_openai import ChatOpenAI
-from typing import Any
 
+from ensemble_phase_2_poc.inference.hedging import HedgingChatModel
+from ensemble_phase_2_poc.inference.rate_limit import RateLimitedChatModel
+from ensemble_phase_2_poc.inference.retry import RetryingChatModel
 
-class CustomChatOpenAI(ChatOpenAI):
-    @backoff.on_exception(backoff.expo, Exception, max_tries=5, jitter=backoff.full_jitter)
-    def invoke(self, *args: Any, **kwargs: Any):
-        return super().invoke(*args, **kwargs)
 
-    @backoff.on_exception(backoff.expo, Exception, max_tries=5, jitter=backoff.full_jitter)
-    async def ainvoke(self, *args: Any, **kwargs: Any):
-        return await super().ainvoke(*args, **kwargs)
+class CustomChatOpenAI(RetryingChatModel, HedgingChatModel, RateLimitedChatModel, ChatOpenAI):
+    retry_provider: ClassVar[str] = "openai"
+    api_key_field: ClassVar[str | None] = "openai_api_key"
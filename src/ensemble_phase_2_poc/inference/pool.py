@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import threading
+import weakref
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Hashable
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+
+from ensemble_phase_2_poc.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class HttpPoolConfig:
+    """Connection limits for the HTTP clients shared by pooled chat models"""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    timeout: float = 300.0
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+class _LoopLocalTransport(httpx.AsyncBaseTransport):
+    """
+    Async transport with one connection pool per event loop. Connections are
+    bound to the loop that opened them, so a pooled AsyncClient shared by every
+    loop in the process (e.g. successive asyncio.run() calls) would otherwise
+    hand a later loop a connection whose loop is closed.
+    """
+
+    def __init__(self, limits: httpx.Limits, http2: bool):
+        self._limits = limits
+        self._http2 = http2
+        self._lock = threading.Lock()
+        # Dropped with their loop
+        self._transports: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = httpx.AsyncHTTPTransport(limits=self._limits, http2=self._http2)
+                self._transports[loop] = transport
+            return transport
+
+    @property
+    def transports(self) -> list[httpx.AsyncHTTPTransport]:
+        with self._lock:
+            return list(self._transports.values())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Close this loop's connections"""
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class ClientPool:
+    """
+    Thread-safe pool of chat model instances and the HTTP clients behind them.
+
+    Models are keyed by (provider, model, api_key, kwargs), so repeated
+    ChatFactory.get_model() calls return the same instance. All models for a
+    provider share one sync and one async httpx client, so keep-alive
+    connections are reused across agents and accounts. The async client keeps
+    separate connections per event loop.
+    """
+
+    def __init__(self, config: HttpPoolConfig | None = None):
+        self.config = config or HttpPoolConfig()
+        self._lock = threading.Lock()
+        self._models: dict[Hashable, BaseChatModel] = {}
+        self._http_clients: dict[str, tuple[httpx.Client, httpx.AsyncClient]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_create(
+        self,
+        provider: str,
+        model: str,
+        api_key: str,
+        kwargs: dict[str, Any],
+        factory: Callable[[httpx.Client, httpx.AsyncClient], BaseChatModel],
+    ) -> BaseChatModel:
+        """Return the pooled model for this key, building it with `factory` on a miss"""
+        key = (provider, model, _fingerprint(api_key), _freeze(kwargs))
+
+        with self._lock:
+            instance = self._models.get(key)
+            if instance is not None:
+                self.hits += 1
+                return instance
+
+            self.misses += 1
+            sync_client, async_client = self._get_http_clients(provider)
+            instance = factory(sync_client, async_client)
+            self._models[key] = instance
+            logger.debug(f"Pooled new {provider} client for model {model} ({len(self._models)} pooled)")
+            return instance
+
+    def _get_http_clients(self, provider: str) -> tuple[httpx.Client, httpx.AsyncClient]:
+        """Shared HTTP clients for a provider. Caller must hold the lock."""
+        if provider not in self._http_clients:
+            http2 = self.config.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("http2 requested but the 'h2' package is not installed, using HTTP/1.1")
+                    http2 = False
+
+            self._http_clients[provider] = (
+                httpx.Client(limits=self.config.limits, http2=http2, timeout=self.config.timeout),
+                httpx.AsyncClient(
+                    transport=_LoopLocalTransport(self.config.limits, http2), timeout=self.config.timeout
+                ),
+            )
+        return self._http_clients[provider]
+
+    def stats(self) -> dict[str, Any]:
+        """Pool statistics, for sizing limits against batch concurrency"""
+        with self._lock:
+            return {
+                "config": asdict(self.config),
+                "hits": self.hits,
+                "misses": self.misses,
+                "pooled_models": [
+                    {"provider": key[0], "model": key[1]} for key in self._models
+                ],
+                "http_clients": {
+                    provider: {
+                        "sync_connections": _connection_counts(sync_client),
+                        "async_connections": _connection_counts(async_client),
+                    }
+                    for provider, (sync_client, async_client) in self._http_clients.items()
+                },
+            }
+
+    def close(self) -> None:
+        """Close pooled HTTP clients and forget all pooled models"""
+        with self._lock:
+            for sync_client, _ in self._http_clients.values():
+                sync_client.close()
+            # AsyncClient.aclose() needs an event loop; dropping the reference
+            # lets its connections be garbage collected
+            self._http_clients.clear()
+            self._models.clear()
+
+
+def _fingerprint(secret: str) -> str:
+    """Hash API keys so they never appear in pool keys or stats"""
+    return hashlib.sha256((secret or "").encode()).hexdigest()[:16]
+
+
+def _freeze(value: Any) -> Hashable:
+    """Convert kwargs into a hashable key, falling back to identity for opaque objects"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return ("id", id(value))
+
+
+def _connection_counts(client: httpx.Client | httpx.AsyncClient) -> dict[str, int]:
+    """Open/idle connection counts from the client's transport(s), where exposed"""
+    transport = getattr(client, "_transport", None)
+    transports = transport.transports if isinstance(transport, _LoopLocalTransport) else [transport]
+    connections = [
+        connection
+        for transport in transports
+        for connection in getattr(getattr(transport, "_pool", None), "connections", [])
+    ]
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
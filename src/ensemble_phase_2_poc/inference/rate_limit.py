@@ -0,0 +1,344 @@
+# Client-side request and token rate limiting.
+#
+# Each (provider, model, API key) gets two token buckets, requests/minute and
+# tokens/minute, each refilling continuously to one minute's allowance.
+# Before a request is sent, one request and an estimated token count are
+# reserved, waiting until both buckets have room; once the response arrives
+# the estimate is reconciled against the reported usage. Buckets live in
+# memory, or in a SQLite file shared by every process on the machine, so a
+# batch's workers stay under the provider's limits together.
+#
+# The limiter hooks _generate()/_agenerate(), below the response cache, so
+# cache hits and cassette replays don't consume quota.
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, ClassVar
+
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+
+from ensemble_phase_2_poc.config import ConfiguredFromEnv, build_config, load_json_config
+from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.metrics import REGISTRY
+
+
+logger = get_logger(__name__)
+
+# {"provider" or "provider/model": {"requests_per_minute": ..., "tokens_per_minute": ...}}
+# as JSON (inline or a file path), and the SQLite file shared by worker processes
+RATE_LIMITS_ENV_VAR = "ENSEMBLE_LLM_RATE_LIMITS"
+RATE_LIMIT_STORE_ENV_VAR = "ENSEMBLE_LLM_RATE_LIMIT_STORE"
+
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    "ensemble_llm_rate_limit_wait_seconds",
+    "Time chat model requests waited for rate limit capacity",
+    ("provider", "model"),
+    buckets=(0.0, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+# bucket key -> (level, updated_at)
+_Levels = dict[str, tuple[float, float]]
+# (bucket key, capacity per minute, amount)
+_Demand = tuple[str, float, float]
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Per-minute quotas for one provider or model, applied per API key"""
+
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+
+    def __post_init__(self) -> None:
+        for name in ("requests_per_minute", "tokens_per_minute"):
+            value = getattr(self, name)
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be > 0, got {value}")
+
+
+def parse_rate_limits(value: str) -> dict[str, RateLimit]:
+    """Rate limits keyed by "provider" or "provider/model", from a JSON object or a path to a JSON file"""
+    limits = load_json_config(value, "Rate limits")
+    return {key: build_config(fields, RateLimit, f"Rate limit for {key}") for key, fields in limits.items()}
+
+
+def _refill(level: float, updated_at: float, capacity: float, now: float) -> float:
+    return min(capacity, level + max(0.0, now - updated_at) * capacity / 60.0)
+
+
+def _take(levels: _Levels, demands: list[_Demand], now: float) -> tuple[float, _Levels]:
+    """
+    Reserve every demand or none. Returns (seconds to wait, updated levels);
+    the wait is 0 when the reservation succeeded. A demand larger than a
+    bucket's capacity waits for a full bucket and leaves it in debt.
+    """
+    refilled = {
+        key: _refill(*levels.get(key, (capacity, now)), capacity, now)
+        for key, capacity, _ in demands
+    }
+    wait = 0.0
+    for key, capacity, amount in demands:
+        shortfall = min(amount, capacity) - refilled[key]
+        if shortfall > 0:
+            wait = max(wait, shortfall * 60.0 / capacity)
+    if wait > 0:
+        return wait, {}
+    return 0.0, {key: (refilled[key] - amount, now) for key, _, amount in demands}
+
+
+class _MemoryStore:
+    """Buckets shared by the threads of one process"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._levels: _Levels = {}
+
+    def transact(self, keys: list[str], update: Callable[[_Levels], tuple[Any, _Levels]]) -> Any:
+        with self._lock:
+            result, changes = update({key: self._levels[key] for key in keys if key in self._levels})
+            self._levels.update(changes)
+            return result
+
+
+class _SqliteStore:
+    """Buckets in a SQLite file, shared by every process that opens it"""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One autocommit connection per thread; transactions are opened explicitly"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def transact(self, keys: list[str], update: Callable[[_Levels], tuple[Any, _Levels]]) -> Any:
+        connection = self._connection()
+        # IMMEDIATE takes the write lock up front, so read-modify-write is atomic across processes
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                f"SELECT key, level, updated_at FROM buckets WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+            result, changes = update({key: (level, updated_at) for key, level, updated_at in rows})
+            connection.executemany(
+                "INSERT OR REPLACE INTO buckets (key, level, updated_at) VALUES (?, ?, ?)",
+                [(key, level, updated_at) for key, (level, updated_at) in changes.items()],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return result
+
+
+class RateLimiter:
+    """
+    RPM/TPM token buckets per (provider, model, API key).
+
+    `limits` is keyed by "provider/model", or by "provider" for every model of
+    a provider; requests with no matching entry are not limited.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, RateLimit],
+        path: str | Path | None = None,
+        estimated_output_tokens: int = 256,
+        chars_per_token: float = 4.0,
+    ):
+        self.limits = dict(limits)
+        self.path = Path(path) if path is not None else None
+        self.estimated_output_tokens = estimated_output_tokens
+        self.chars_per_token = chars_per_token
+        self._store = _SqliteStore(path) if path is not None else _MemoryStore()
+
+    def limit_for(self, provider: str, model: str) -> RateLimit | None:
+        return self.limits.get(f"{provider}/{model}") or self.limits.get(provider)
+
+    def estimate_tokens(self, messages: list[BaseMessage]) -> int:
+        """Prompt tokens from message length, plus the expected completion"""
+        chars = sum(len(str(message.content)) for message in messages)
+        return int(chars / self.chars_per_token) + self.estimated_output_tokens
+
+    def _demands(self, limit: RateLimit, bucket: str, requests: float, tokens: float) -> list[_Demand]:
+        demands = []
+        if limit.requests_per_minute is not None:
+            demands.append((f"{bucket}:rpm", limit.requests_per_minute, requests))
+        if limit.tokens_per_minute is not None:
+            demands.append((f"{bucket}:tpm", limit.tokens_per_minute, tokens))
+        return demands
+
+    def try_acquire(self, provider: str, model: str, key_id: str, tokens: int) -> float:
+        """Reserve one request and `tokens` if there is room. Returns 0, or seconds until there may be."""
+        limit = self.limit_for(provider, model)
+        if limit is None:
+            return 0.0
+        demands = self._demands(limit, f"{provider}/{model}/{key_id}", 1, tokens)
+        return self._store.transact(
+            [key for key, _, _ in demands], lambda levels: _take(levels, demands, time.time())
+        )
+
+    def acquire(self, provider: str, model: str, key_id: str, tokens: int) -> float:
+        """Block until the reservation succeeds. Returns seconds waited."""
+        start = time.perf_counter()
+        while (wait := self.try_acquire(provider, model, key_id, tokens)) > 0:
+            time.sleep(wait)
+        waited = time.perf_counter() - start
+        RATE_LIMIT_WAIT.labels(provider, model).observe(waited)
+        return waited
+
+    async def aacquire(self, provider: str, model: str, key_id: str, tokens: int) -> float:
+        """Async twin of acquire(). The store is used from a worker thread, as a
+        shared SQLite file can block for as long as another process holds it."""
+        start = time.perf_counter()
+        while (wait := await asyncio.to_thread(self.try_acquire, provider, model, key_id, tokens)) > 0:
+            await asyncio.sleep(wait)
+        waited = time.perf_counter() - start
+        RATE_LIMIT_WAIT.labels(provider, model).observe(waited)
+        return waited
+
+    def reconcile(self, provider: str, model: str, key_id: str, estimated: int, actual: int) -> None:
+        """Correct the token bucket once the real usage of a request is known"""
+        limit = self.limit_for(provider, model)
+        if limit is None or limit.tokens_per_minute is None or actual == estimated:
+            return
+        key, capacity = f"{provider}/{model}/{key_id}:tpm", limit.tokens_per_minute
+
+        def _update(levels: _Levels) -> tuple[None, _Levels]:
+            now = time.time()
+            level = _refill(*levels.get(key, (capacity, now)), capacity, now)
+            return None, {key: (min(capacity, level - (actual - estimated)), now)}
+
+        self._store.transact([key], _update)
+
+    async def areconcile(self, provider: str, model: str, key_id: str, estimated: int, actual: int) -> None:
+        """Async twin of reconcile(), off the event loop like aacquire()"""
+        await asyncio.to_thread(self.reconcile, provider, model, key_id, estimated, actual)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": str(self.path) if self.path is not None else None,
+            "limits": {key: asdict(limit) for key, limit in self.limits.items()},
+        }
+
+
+def _configure_from_env(value: str | None) -> None:
+    if value:
+        configure_rate_limits(parse_rate_limits(value), path=os.environ.get(RATE_LIMIT_STORE_ENV_VAR) or None)
+
+
+_LIMITER_LOCK = threading.Lock()
+_limiter: RateLimiter | None = None
+_FROM_ENV = ConfiguredFromEnv(RATE_LIMITS_ENV_VAR, _configure_from_env)
+
+
+def configure_rate_limits(
+    limits: dict[str, RateLimit],
+    path: str | Path | None = None,
+    **kwargs: Any,
+) -> RateLimiter:
+    """Limit every provider model matching `limits`; `path` shares the buckets between processes"""
+    global _limiter
+    with _LIMITER_LOCK:
+        _limiter = RateLimiter(limits, path=path, **kwargs)
+        _FROM_ENV.mark_configured()
+    return _limiter
+
+
+def disable_rate_limits() -> None:
+    global _limiter
+    with _LIMITER_LOCK:
+        _limiter = None
+        _FROM_ENV.mark_configured()
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """The active limiter, configured from the environment on first use"""
+    _FROM_ENV.ensure()
+    return _limiter
+
+
+def _fingerprint(secret: Any) -> str:
+    """Bucket id for an API key; the key itself is never stored"""
+    if secret is None:
+        return "default"
+    value = secret.get_secret_value() if hasattr(secret, "get_secret_value") else str(secret)
+    return hashlib.sha256(value.encode()).hexdigest()[:16]
+
+
+def _usage_tokens(result: ChatResult) -> int | None:
+    """Total tokens reported for a response, or None when the provider reported none"""
+    totals = [
+        usage.get("total_tokens") or usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+        for generation in result.generations
+        if (usage := getattr(generation.message, "usage_metadata", None))
+    ]
+    return sum(totals) if totals else None
+
+
+class RateLimitedChatModel:
+    """
+    Mixin for chat models: reserves rate limit capacity before each provider
+    request in _generate()/_agenerate() and reconciles it with the reported
+    usage. Provider and model names come from RetryingChatModel;
+    `api_key_field` names the field holding the provider API key. Models that
+    define their own _generate() wrap it in _rate_limited() instead.
+    """
+
+    api_key_field: ClassVar[str | None] = None
+
+    def _rate_limit_bucket(self) -> tuple[str, str, str]:
+        secret = getattr(self, self.api_key_field, None) if self.api_key_field else None
+        return self.retry_provider, self._retry_model_name, _fingerprint(secret)
+
+    def _rate_limited(self, messages: list[BaseMessage], call: Callable[[], ChatResult]) -> ChatResult:
+        limiter = get_rate_limiter()
+        if limiter is None:
+            return call()
+
+        provider, model, key_id = self._rate_limit_bucket()
+        estimated = limiter.estimate_tokens(messages)
+        limiter.acquire(provider, model, key_id, estimated)
+        result = call()
+        if (actual := _usage_tokens(result)) is not None:
+            limiter.reconcile(provider, model, key_id, estimated, actual)
+        return result
+
+    async def _arate_limited(self, messages: list[BaseMessage], call: Callable[[], Awaitable[ChatResult]]) -> ChatResult:
+        limiter = get_rate_limiter()
+        if limiter is None:
+            return await call()
+
+        provider, model, key_id = self._rate_limit_bucket()
+        estimated = limiter.estimate_tokens(messages)
+        await limiter.aacquire(provider, model, key_id, estimated)
+        result = await call()
+        if (actual := _usage_tokens(result)) is not None:
+            await limiter.areconcile(provider, model, key_id, estimated, actual)
+        return result
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        return self._rate_limited(
+            messages, lambda: super(RateLimitedChatModel, self)._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        return await self._arate_limited(
+            messages, lambda: super(RateLimitedChatModel, self)._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
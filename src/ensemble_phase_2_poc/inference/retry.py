@@ -0,0 +1,409 @@
+# Retry policy and circuit breaker for provider calls.
+#
+# Chat models mix in RetryingChatModel, which wraps invoke()/ainvoke():
+#   - errors are classified as retriable (429, 5xx, timeouts, dropped
+#     connections) or fatal (bad requests, auth, validation, replay misses),
+#     and fatal errors surface immediately
+#   - a Retry-After header from the provider sets the delay; otherwise
+#     exponential backoff with full jitter
+#   - a process-wide retry budget caps retries to a fraction of recent calls,
+#     so an outage doesn't multiply traffic by max_tries
+#   - a circuit breaker per provider fails fast while the provider is down and
+#     lets a single probe through after a cool-down
+#   - each attempt's outcome and latency is reported to inference/feedback.py
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, ClassVar, Literal, TypeVar
+
+import httpx
+import openai
+
+from ensemble_phase_2_poc.config import ConfiguredFromEnv, parse_config
+from ensemble_phase_2_poc.inference.cassette import CassetteMissError
+from ensemble_phase_2_poc.inference.feedback import report
+from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.metrics import REGISTRY, record_llm_retry
+
+
+logger = get_logger(__name__)
+
+# RetryPolicy fields as JSON (inline or a file path), read when the policy is first used
+RETRY_POLICY_ENV_VAR = "ENSEMBLE_LLM_RETRY_POLICY"
+
+CircuitState = Literal["closed", "open", "half_open"]
+_STATE_VALUES: dict[str, int] = {"closed": 0, "half_open": 1, "open": 2}
+
+CIRCUIT_STATE = REGISTRY.gauge(
+    "ensemble_circuit_breaker_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open", ("provider",)
+)
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    "ensemble_circuit_breaker_transitions", "Circuit breaker state changes", ("provider", "from_state", "to_state")
+)
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    "ensemble_circuit_breaker_rejections", "Calls failed fast by an open circuit", ("provider",)
+)
+RETRY_GIVE_UPS = REGISTRY.counter(
+    "ensemble_llm_retry_give_ups", "Retriable failures surfaced without retrying; reason is exhausted, budget or retry_after", ("provider", "reason")
+)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """A provider's circuit breaker is open, so the call was not attempted"""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"Circuit breaker for provider '{provider}' is open; retry in {retry_in:.1f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How provider calls are retried, budgeted and circuit-broken"""
+
+    max_tries: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    # HTTP statuses worth retrying; any other status is fatal
+    retry_statuses: tuple[int, ...] = (408, 409, 425, 429, 500, 502, 503, 504, 529)
+
+    # Retries allowed per window: retry_budget_min plus retry_budget_ratio x calls
+    retry_budget_ratio: float = 0.2
+    retry_budget_min: int = 10
+    retry_budget_window: float = 10.0
+
+    # Consecutive retriable failures that open a provider's circuit, and seconds before a probe
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+
+    def __post_init__(self) -> None:
+        if self.max_tries < 1:
+            raise ValueError(f"max_tries must be >= 1, got {self.max_tries}")
+        if self.failure_threshold < 1:
+            raise ValueError(f"failure_threshold must be >= 1, got {self.failure_threshold}")
+
+    def is_retriable(self, error: BaseException) -> bool:
+        """Transient provider-side failures are retriable; everything else is fatal"""
+        if isinstance(error, (CassetteMissError, CircuitOpenError)):
+            return False
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int):
+            return status in self.retry_statuses
+        return isinstance(
+            error,
+            (httpx.TransportError, openai.APIConnectionError, TimeoutError, ConnectionError),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential delay before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def parse_retry_policy(value: str) -> RetryPolicy:
+    """RetryPolicy from "1", a JSON object or a path to a JSON file"""
+    return parse_config(value, RetryPolicy, "Retry policy", retry_statuses=tuple)
+
+
+def retry_after(error: BaseException) -> float | None:
+    """Seconds the provider asked us to wait, from Retry-After(-ms) headers, if any"""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    headers = {str(key).lower(): value for key, value in dict(headers).items()}
+    if "retry-after-ms" in headers:
+        try:
+            return max(float(headers["retry-after-ms"]) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    """Sliding-window cap on retries relative to calls, shared by every provider"""
+
+    def __init__(self, ratio: float, minimum: int, window: float):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.window = window
+        self._lock = threading.Lock()
+        self._calls: deque[float] = deque()
+        self._retries: deque[float] = deque()
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window
+        for events in (self._calls, self._retries):
+            while events and events[0] < cutoff:
+                events.popleft()
+
+    def record_call(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            self._calls.append(now)
+
+    def try_spend(self) -> bool:
+        """Reserve one retry if the budget allows it"""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            if len(self._retries) >= self.minimum + self.ratio * len(self._calls):
+                return False
+            self._retries.append(now)
+            return True
+
+
+class CircuitBreaker:
+    """
+    Per-provider breaker. Opens after `failure_threshold` consecutive retriable
+    failures; after `reset_timeout` one probe call is let through (half-open),
+    and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state: CircuitState = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        CIRCUIT_STATE.labels(provider).set(0)
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    def _transition(self, state: CircuitState) -> None:
+        """Caller must hold the lock"""
+        if state == self._state:
+            return
+        CIRCUIT_TRANSITIONS.labels(self.provider, self._state, state).inc()
+        CIRCUIT_STATE.labels(self.provider).set(_STATE_VALUES[state])
+        logger.warning(f"Circuit breaker for provider '{self.provider}': {self._state} -> {state}")
+        self._state = state
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may be attempted now"""
+        with self._lock:
+            if self._state == "closed":
+                return
+            if self._state == "open":
+                retry_in = self._opened_at + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    CIRCUIT_REJECTIONS.labels(self.provider).inc()
+                    raise CircuitOpenError(self.provider, retry_in)
+                self._transition("half_open")
+            if self._probe_in_flight:
+                CIRCUIT_REJECTIONS.labels(self.provider).inc()
+                raise CircuitOpenError(self.provider, 0.0)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._transition("closed")
+
+    def release(self) -> None:
+        """Give up a call's probe slot without recording an outcome, e.g. on cancellation"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._transition("open")
+
+
+@dataclass
+class _RetryState:
+    policy: RetryPolicy | None = None
+    budget: RetryBudget | None = None
+    breakers: dict[str, CircuitBreaker] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_STATE = _RetryState()
+_FROM_ENV = ConfiguredFromEnv(
+    RETRY_POLICY_ENV_VAR, lambda value: configure_retry(parse_retry_policy(value) if value else None)
+)
+
+
+def configure_retry(policy: RetryPolicy | None = None) -> RetryPolicy:
+    """Install `policy` (defaults when None) for every provider, resetting budget and breakers"""
+    policy = policy or RetryPolicy()
+    with _STATE.lock:
+        _STATE.policy = policy
+        _STATE.budget = RetryBudget(policy.retry_budget_ratio, policy.retry_budget_min, policy.retry_budget_window)
+        _STATE.breakers = {}
+    _FROM_ENV.mark_configured()
+    logger.debug(f"Retry policy: {asdict(policy)}")
+    return policy
+
+
+def get_retry_policy() -> RetryPolicy:
+    """The active policy, configured from the environment on first use"""
+    _FROM_ENV.ensure()
+    return _STATE.policy
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    policy = get_retry_policy()
+    with _STATE.lock:
+        breaker = _STATE.breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(provider, policy.failure_threshold, policy.reset_timeout)
+            _STATE.breakers[provider] = breaker
+        return breaker
+
+
+def retry_stats() -> dict[str, Any]:
+    """Active policy and circuit state per provider"""
+    policy = get_retry_policy()
+    with _STATE.lock:
+        return {
+            "policy": asdict(policy),
+            "circuits": {provider: breaker.state for provider, breaker in _STATE.breakers.items()},
+        }
+
+
+def _next_delay(policy: RetryPolicy, provider: str, attempt: int, error: BaseException) -> float | None:
+    """Delay before the next attempt, or None to surface `error`"""
+    if not policy.is_retriable(error):
+        return None
+    if attempt >= policy.max_tries:
+        RETRY_GIVE_UPS.labels(provider, "exhausted").inc()
+        return None
+
+    delay = retry_after(error)
+    if delay is None:
+        delay = policy.backoff(attempt)
+    elif delay > policy.max_delay:
+        # Waiting longer than max_delay would stall the worker; fail instead
+        RETRY_GIVE_UPS.labels(provider, "retry_after").inc()
+        return None
+
+    if not _STATE.budget.try_spend():
+        RETRY_GIVE_UPS.labels(provider, "budget").inc()
+        logger.warning(f"Retry budget exhausted, not retrying {provider} error: {error!r}")
+        return None
+    return delay
+
+
+def _record_outcome(policy: RetryPolicy, breaker: CircuitBreaker, error: BaseException | None) -> None:
+    # Fatal errors mean the provider answered, so they don't count against it
+    if error is not None and policy.is_retriable(error):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def call_with_retry(provider: str, model: str, call: Callable[[], T]) -> T:
+    """Run `call` under the active retry policy and `provider`'s circuit breaker"""
+    policy = get_retry_policy()
+    breaker = get_circuit_breaker(provider)
+    _STATE.budget.record_call()
+
+    attempt = 1
+    while True:
+        breaker.before_call()
+        start = time.perf_counter()
+        try:
+            result = call()
+        except Exception as e:
+            report(e, time.perf_counter() - start)
+            _record_outcome(policy, breaker, e)
+            delay = _next_delay(policy, provider, attempt, e)
+            if delay is None:
+                raise
+            logger.info(f"Retrying {provider}/{model} in {delay:.2f}s after attempt {attempt} failed: {e!r}")
+            record_llm_retry(provider, model)
+            time.sleep(delay)
+            attempt += 1
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            report(None, time.perf_counter() - start)
+            _record_outcome(policy, breaker, None)
+            return result
+
+
+async def acall_with_retry(provider: str, model: str, call: Callable[[], Awaitable[T]]) -> T:
+    """Async twin of call_with_retry()"""
+    policy = get_retry_policy()
+    breaker = get_circuit_breaker(provider)
+    _STATE.budget.record_call()
+
+    attempt = 1
+    while True:
+        breaker.before_call()
+        start = time.perf_counter()
+        try:
+            result = await call()
+        except Exception as e:
+            report(e, time.perf_counter() - start)
+            _record_outcome(policy, breaker, e)
+            delay = _next_delay(policy, provider, attempt, e)
+            if delay is None:
+                raise
+            logger.info(f"Retrying {provider}/{model} in {delay:.2f}s after attempt {attempt} failed: {e!r}")
+            record_llm_retry(provider, model)
+            await asyncio.sleep(delay)
+            attempt += 1
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            report(None, time.perf_counter() - start)
+            _record_outcome(policy, breaker, None)
+            return result
+
+
+class RetryingChatModel:
+    """
+    Mixin for chat models: routes invoke()/ainvoke() through the retry policy
+    and the circuit breaker of `retry_provider`. List it before the LangChain
+    base class.
+    """
+
+    retry_provider: ClassVar[str] = "unknown"
+
+    @property
+    def _retry_model_name(self) -> str:
+        return getattr(self, "model_name", None) or getattr(self, "model", None) or "unknown"
+
+    def invoke(self, *args: Any, **kwargs: Any) -> Any:
+        return call_with_retry(
+            self.retry_provider, self._retry_model_name, lambda: super(RetryingChatModel, self).invoke(*args, **kwargs)
+        )
+
+    async def ainvoke(self, *args: Any, **kwargs: Any) -> Any:
+        return await acall_with_retry(
+            self.retry_provider, self._retry_model_name, lambda: super(RetryingChatModel, self).ainvoke(*args, **kwargs)
+        )
@@ -1,17 +1,57 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
 from dotenv import load_dotenv
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from langchain_core.caches import BaseCache
 from langchain_core.language_models import BaseChatModel
+from ensemble_phase_2_poc.config import ConfiguredFromEnv, load_json_config
+from ensemble_phase_2_poc.inference.cache import ResponseCache
+from ensemble_phase_2_poc.inference.cassette import Cassette, CassetteMode
 from ensemble_phase_2_poc.inference.cohere import CustomChatCohere
 from ensemble_phase_2_poc.inference.openai import CustomChatOpenAI
+from ensemble_phase_2_poc.inference.hedging import HedgingPolicy, configure_hedging, disable_hedging
+from ensemble_phase_2_poc.inference.pool import ClientPool, HttpPoolConfig
+from ensemble_phase_2_poc.inference.rate_limit import RateLimit, configure_rate_limits, disable_rate_limits
+from ensemble_phase_2_poc.inference.retry import RetryPolicy, configure_retry, retry_stats
+from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel, parse_profile
 
 
 load_dotenv(dotenv_path=".env", override=True)
 
+# Opt-in response cache: path of the SQLite file, and optional TTL in seconds.
+# Read when the first model is built, so worker processes inherit the setting.
+LLM_CACHE_ENV_VAR = "ENSEMBLE_LLM_CACHE"
+LLM_CACHE_TTL_ENV_VAR = "ENSEMBLE_LLM_CACHE_TTL"
+
+# Record/replay cassette: path of the JSONL file and "record" or "replay"
+CASSETTE_ENV_VAR = "ENSEMBLE_LLM_CASSETTE"
+CASSETTE_MODE_ENV_VAR = "ENSEMBLE_LLM_CASSETTE_MODE"
+
+# Model routing config as JSON (inline or a file path), see RouterConfig
+ROUTES_ENV_VAR = "ENSEMBLE_LLM_ROUTES"
+
+# Where the router finds each provider's API key; providers not listed need none
+PROVIDER_API_KEY_ENV_VARS = {
+    "cohere": "COHERE_API_KEY",
+    "openai": "OPENAI_API_KEY",
+}
+
+# Route every get_model() call to the simulated provider. The value is "1" for
+# the default profile, or SimulatedChatModel kwargs as JSON (inline or a file path).
+SIMULATE_ENV_VAR = "ENSEMBLE_SIMULATE_LLM"
+
 
 # TODO: this needs to be made more dynamic and/or better organized. Adds a dependency that requires the developers to keep this pricing table up to date.
 # Store the input / output token pricing per 1M of Cohere models
 COHERE_MODEL_PRICING = {
     "command-a-03-2025": (2.50, 10.00),
     "command-a-reasoning": (2.50, 10.00),
+    "command-r-08-2024": (0.15, 0.60),
+    "command-r7b-12-2024": (0.0375, 0.15),
 }
 
 # Store the input / output token pricing per 1M of OAI models
@@ -27,15 +67,216 @@ OPENAI_MODEL_PRICING = {
 }
 
 
-# TODO: response caching
-# TODO: error handling
+# Output tokens per input token in our workflows (long prompts, short answers),
+# used to rank models by a single blended price
+OUTPUT_TOKEN_RATIO = 0.2
+
+# Weight of each new call in a model's observed latency
+_LATENCY_ALPHA = 0.2
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """A provider and model a node can be routed to"""
+
+    provider: str
+    model: str
+
+    @classmethod
+    def parse(cls, value: str) -> "ModelRoute":
+        """ModelRoute from a "provider/model" string"""
+        provider, _, model = value.partition("/")
+        if not provider or not model:
+            raise ValueError(f"Model route must look like 'provider/model', got '{value}'")
+        return cls(provider, model)
+
+    def __str__(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+
+@dataclass(frozen=True)
+class TierConfig:
+    """Candidate models for a capability tier, in order of preference"""
+
+    models: tuple[ModelRoute, ...]
+    # Seconds per call. The cheapest candidate whose observed latency is within
+    # it is used; when none is, the fastest one.
+    max_latency: float | None = None
+
+    def __post_init__(self) -> None:
+        if not self.models:
+            raise ValueError("A tier needs at least one model")
+
+
+_SMALL = TierConfig((ModelRoute("cohere", "command-r7b-12-2024"),))
+_LARGE = TierConfig((ModelRoute("cohere", "command-a-03-2025"),))
+
+
+@dataclass(frozen=True)
+class RouterConfig:
+    """
+    Capability tiers and the nodes that use them.
+
+    Nodes name a tier ("small" for short classification calls, "large" for
+    reasoning and tool use); `nodes` can move a node to another tier or pin it
+    to a "provider/model". By default both tiers are Cohere models, so one
+    API key covers them.
+    """
+
+    tiers: dict[str, TierConfig] = field(default_factory=lambda: {"small": _SMALL, "large": _LARGE})
+    nodes: dict[str, str] = field(default_factory=dict)
+
+
+def parse_router_config(value: str) -> RouterConfig:
+    """
+    RouterConfig from a JSON object or a path to a JSON file, e.g.
+
+        {"tiers": {"small": ["cohere/command-r7b-12-2024"],
+                   "large": {"models": ["cohere/command-a-03-2025", "openai/gpt-4.1"], "max_latency": 8}},
+         "nodes": {"account_note_agent": "small"}}
+
+    Tiers not listed keep their defaults.
+    """
+    fields = load_json_config(value, "Router config")
+    if unknown := set(fields) - {"tiers", "nodes"}:
+        raise ValueError(f"Unknown Router config fields: {sorted(unknown)}")
+
+    tiers = dict(RouterConfig().tiers)
+    for name, tier in fields.get("tiers", {}).items():
+        if isinstance(tier, list):
+            tier = {"models": tier}
+        tiers[name] = TierConfig(
+            models=tuple(ModelRoute.parse(model) for model in tier["models"]),
+            max_latency=tier.get("max_latency"),
+        )
+    return RouterConfig(tiers=tiers, nodes=dict(fields.get("nodes", {})))
+
+
+class ModelRouter:
+    """Resolves the model for each node from a RouterConfig, pricing and observed latency"""
+
+    def __init__(self, config: RouterConfig | None = None):
+        self.config = config or RouterConfig()
+        self._lock = threading.Lock()
+        self._latency: dict[ModelRoute, float] = {}
+
+    def tier_for(self, node_id: str, tier: str) -> TierConfig:
+        """The tier a node runs on: its override if configured, else the tier it asked for"""
+        target = self.config.nodes.get(node_id, tier)
+        if "/" in target:
+            return TierConfig((ModelRoute.parse(target),))
+        if target not in self.config.tiers:
+            raise ValueError(f"Unknown tier '{target}' for node '{node_id}'. Tiers: {list(self.config.tiers)}")
+        return self.config.tiers[target]
+
+    def candidates(self, node_id: str, tier: str) -> tuple[TierConfig, list[ModelRoute]]:
+        """The node's tier and those of its models we have API keys for"""
+        config = self.tier_for(node_id, tier)
+        if os.environ.get(SIMULATE_ENV_VAR):
+            # Every model is simulated, so none needs a key
+            return config, list(config.models)
+        available = [
+            route for route in config.models
+            if route.provider not in PROVIDER_API_KEY_ENV_VARS or os.environ.get(PROVIDER_API_KEY_ENV_VARS[route.provider])
+        ]
+        if not available:
+            missing = sorted({PROVIDER_API_KEY_ENV_VARS[route.provider] for route in config.models})
+            raise ValueError(f"No model available for node '{node_id}': set one of {missing}")
+        return config, available
+
+    @staticmethod
+    def api_key(provider: str) -> str | None:
+        env_var = PROVIDER_API_KEY_ENV_VARS.get(provider)
+        return os.environ.get(env_var) if env_var else None
+
+    @staticmethod
+    def price(route: ModelRoute) -> float:
+        """Blended $ per 1M input tokens; unpriced models rank last"""
+        try:
+            input_price, output_price = ChatFactory.get_provider_pricing(route.provider, route.model)
+        except (KeyError, ValueError):
+            return float("inf")
+        return input_price + OUTPUT_TOKEN_RATIO * output_price
+
+    def latency(self, route: ModelRoute) -> float | None:
+        """Moving average of recent call latency in seconds, or None before the first call"""
+        return self._latency.get(route)
+
+    def record_latency(self, route: ModelRoute, seconds: float) -> None:
+        with self._lock:
+            previous = self._latency.get(route)
+            self._latency[route] = seconds if previous is None else previous + _LATENCY_ALPHA * (seconds - previous)
+
+    def select(self, tier: TierConfig, candidates: list[ModelRoute]) -> ModelRoute:
+        """Cheapest candidate within the tier's latency budget, else the fastest.
+
+        Models not called yet count as within budget, so they get measured.
+        """
+        if tier.max_latency is None:
+            within = candidates
+        else:
+            within = [route for route in candidates if (self.latency(route) or 0.0) <= tier.max_latency]
+        if within:
+            # min() keeps config order among equal prices
+            return min(within, key=self.price)
+        return min(candidates, key=lambda route: self.latency(route))
+
+
+class RoutingMiddleware(AgentMiddleware):
+    """Re-selects the model of a multi-candidate tier on every model call, timing each call"""
+
+    def __init__(self, router: ModelRouter, tier: TierConfig, candidates: list[ModelRoute]):
+        super().__init__()
+        self.router = router
+        self.tier = tier
+        self.candidates = candidates
+
+    def _route(self, request: ModelRequest) -> tuple[ModelRoute, ModelRequest]:
+        route = self.router.select(self.tier, self.candidates)
+        return route, request.override(model=ChatFactory.get_routed_model(route))
+
+    def wrap_model_call(self, request: ModelRequest, handler: Callable[[ModelRequest], ModelResponse]) -> ModelResponse:
+        route, request = self._route(request)
+        start = time.perf_counter()
+        response = handler(request)
+        self.router.record_latency(route, time.perf_counter() - start)
+        return response
+
+    async def awrap_model_call(
+        self, request: ModelRequest, handler: Callable[[ModelRequest], Awaitable[ModelResponse]]
+    ) -> ModelResponse:
+        route, request = self._route(request)
+        start = time.perf_counter()
+        response = await handler(request)
+        self.router.record_latency(route, time.perf_counter() - start)
+        return response
+
+
+_ROUTES_FROM_ENV = ConfiguredFromEnv(
+    ROUTES_ENV_VAR, lambda value: ChatFactory.configure_router(parse_router_config(value) if value else None)
+)
+
+
 class ChatFactory():
     # used to 1) surface available options in cli, 2) for test cases in test/test_inference.py
     PROVIDER_REGISTRY: dict = {
         "cohere": CustomChatCohere,
-        "openai": CustomChatOpenAI
+        "openai": CustomChatOpenAI,
+        "simulated": SimulatedChatModel,
     }
 
+    # Shared pool of model instances and HTTP clients, see inference/pool.py
+    _pool: ClientPool = ClientPool()
+
+    # Response cache attached to every model handed out, see inference/cache.py
+    _response_cache: BaseCache | None = None
+
+    # Record/replay cassette, takes precedence over the response cache, see inference/cassette.py
+    _cassette: Cassette | None = None
+
+    # Per-node model routing, see ModelRouter
+    _router: ModelRouter | None = None
+
     @classmethod
     def get_model(
         cls,
@@ -44,21 +285,223 @@ class ChatFactory():
         api_key: str,
         **kwargs
     ) -> BaseChatModel:
+        """Return the pooled chat model for (provider, model, api_key, kwargs).
+
+        Repeated calls with the same arguments return the same instance, and all
+        models of a provider share one set of keep-alive HTTP connections.
+        """
+        if os.environ.get(SIMULATE_ENV_VAR) and provider != "simulated":
+            # Keep the model name so pricing and traces still reflect the real model
+            provider = "simulated"
+            kwargs = {**parse_profile(os.environ[SIMULATE_ENV_VAR]), **kwargs}
+
+        llm_cache = cls.get_cassette() or cls.get_response_cache()
+        if llm_cache is not None:
+            kwargs = {"cache": llm_cache, **kwargs}
+
         if provider == "cohere":
-            return CustomChatCohere(
-                cohere_api_key=api_key,
-                model=model,
-                **kwargs
-            )
+            def factory(http_client, http_async_client) -> BaseChatModel:
+                return CustomChatCohere(
+                    cohere_api_key=api_key,
+                    model=model,
+                    httpx_client=http_client,
+                    httpx_async_client=http_async_client,
+                    **kwargs
+                )
         elif provider == "openai":
-            return CustomChatOpenAI(
-                api_key=api_key,
-                name=model,
-                **kwargs
-            )
+            def factory(http_client, http_async_client) -> BaseChatModel:
+                return CustomChatOpenAI(
+                    api_key=api_key,
+                    model=model,
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                    **kwargs
+                )
+        elif provider == "simulated":
+            # No network, so no HTTP clients; api_key is accepted and ignored
+            def factory(http_client, http_async_client) -> BaseChatModel:
+                return SimulatedChatModel(model=model, **kwargs)
         else:
             raise ValueError(f"provider not supported. Supported providers are: {cls.PROVIDER_REGISTRY.keys()}")
 
+        return cls._pool.get_or_create(provider, model, api_key, kwargs, factory)
+
+    @classmethod
+    def route(cls, node_id: str, tier: str) -> tuple[BaseChatModel, list[AgentMiddleware]]:
+        """Model for a node asking for capability `tier`, plus the agent middleware that routes it.
+
+        A tier with one usable model needs no middleware. With several, the returned
+        model is the current pick and RoutingMiddleware re-selects it on every call,
+        as prices are fixed but latency is observed.
+        """
+        router = cls.get_router()
+        tier_config, candidates = router.candidates(node_id, tier)
+        model = cls.get_routed_model(router.select(tier_config, candidates))
+        if len(candidates) == 1:
+            return model, []
+        return model, [RoutingMiddleware(router, tier_config, candidates)]
+
+    @classmethod
+    def get_routed_model(cls, route: ModelRoute) -> BaseChatModel:
+        """The pooled model for a route, with the provider's API key from the environment"""
+        return cls.get_model(route.provider, route.model, ModelRouter.api_key(route.provider))
+
+    @classmethod
+    def configure_router(cls, config: RouterConfig | None = None) -> ModelRouter:
+        """Route nodes to models by `config`. Applies to executors built from now on."""
+        cls._router = ModelRouter(config)
+        _ROUTES_FROM_ENV.mark_configured()
+        return cls._router
+
+    @classmethod
+    def get_router(cls) -> ModelRouter:
+        """The active router, configured from the environment on first use"""
+        _ROUTES_FROM_ENV.ensure()
+        return cls._router
+
+    @classmethod
+    def configure_pool(
+        cls,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+    ) -> None:
+        """Replace the client pool with one using the given connection limits.
+
+        Models handed out before this call keep their existing clients; call this
+        at startup, before workflows build their agents.
+        """
+        cls._pool = ClientPool(
+            HttpPoolConfig(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+                http2=http2,
+            )
+        )
+
+    @classmethod
+    def pool_stats(cls) -> dict[str, Any]:
+        """Hit/miss counts, pooled models and open connections per provider"""
+        return cls._pool.stats()
+
+    @classmethod
+    def configure_cache(
+        cls,
+        path: str | None = None,
+        max_memory_entries: int = 1024,
+        max_disk_entries: int = 100_000,
+        ttl_seconds: float | None = None,
+    ) -> ResponseCache:
+        """Enable response caching for models handed out from now on.
+
+        With `path`, responses persist to a SQLite file that can be shared by
+        processes and reused across runs; without it the cache is in-memory only.
+        """
+        cls._response_cache = ResponseCache(
+            path=path,
+            max_memory_entries=max_memory_entries,
+            max_disk_entries=max_disk_entries,
+            ttl_seconds=ttl_seconds,
+        )
+        return cls._response_cache
+
+    @classmethod
+    def disable_cache(cls) -> None:
+        """Stop attaching the response cache to new models"""
+        cls._response_cache = None
+
+    @classmethod
+    def get_response_cache(cls) -> BaseCache | None:
+        """The active response cache, configured from the environment on first use"""
+        if cls._response_cache is None and os.environ.get(LLM_CACHE_ENV_VAR):
+            ttl = os.environ.get(LLM_CACHE_TTL_ENV_VAR)
+            cls.configure_cache(
+                path=os.environ[LLM_CACHE_ENV_VAR],
+                ttl_seconds=float(ttl) if ttl else None,
+            )
+        return cls._response_cache
+
+    @classmethod
+    def configure_cassette(cls, path: str, mode: CassetteMode = "replay") -> Cassette:
+        """Record every LLM call to, or replay every LLM call from, the cassette at `path`"""
+        cls._cassette = Cassette(path, mode=mode)
+        return cls._cassette
+
+    @classmethod
+    def disable_cassette(cls) -> None:
+        """Stop attaching the cassette to new models"""
+        cls._cassette = None
+
+    @classmethod
+    def get_cassette(cls) -> Cassette | None:
+        """The active cassette, configured from the environment on first use"""
+        if cls._cassette is None and os.environ.get(CASSETTE_ENV_VAR):
+            cls.configure_cassette(
+                path=os.environ[CASSETTE_ENV_VAR],
+                mode=os.environ.get(CASSETTE_MODE_ENV_VAR, "replay"),
+            )
+        return cls._cassette
+
+    @classmethod
+    def cache_stats(cls) -> dict[str, Any] | None:
+        """Hit/miss counts of the active cassette or response cache, or None when both are off"""
+        stats = getattr(cls._cassette or cls._response_cache, "stats", None)
+        return stats() if stats is not None else None
+
+    @classmethod
+    def configure_retry(cls, policy: RetryPolicy | None = None, **kwargs: Any) -> RetryPolicy:
+        """Set the retry policy and circuit breaker thresholds for every provider.
+
+        Takes a RetryPolicy or its fields as keyword arguments. Applies to models
+        already handed out too, and resets retry budgets and circuit breakers.
+        """
+        return configure_retry(policy or RetryPolicy(**kwargs))
+
+    @classmethod
+    def configure_hedging(cls, policy: HedgingPolicy | None = None, **kwargs: Any) -> HedgingPolicy:
+        """Enable hedged requests for every provider.
+
+        Takes a HedgingPolicy or its fields as keyword arguments. A call slower than
+        the policy's latency percentile gets a duplicate request; the first answer wins.
+        """
+        return configure_hedging(policy or HedgingPolicy(**kwargs))
+
+    @classmethod
+    def disable_hedging(cls) -> None:
+        """Stop hedging requests"""
+        disable_hedging()
+
+    @classmethod
+    def configure_rate_limits(
+        cls,
+        limits: dict[str, RateLimit | dict[str, float]],
+        path: str | None = None,
+        **kwargs: Any,
+    ) -> None:
+        """Cap requests and tokens per minute for each provider model and API key.
+
+        `limits` is keyed by "provider/model" or "provider", with RateLimits or their
+        fields as values. With `path`, the buckets live in a SQLite file so every
+        process on the machine shares them.
+        """
+        configure_rate_limits(
+            {key: limit if isinstance(limit, RateLimit) else RateLimit(**limit) for key, limit in limits.items()},
+            path=path,
+            **kwargs,
+        )
+
+    @classmethod
+    def disable_rate_limits(cls) -> None:
+        """Stop limiting request and token rates"""
+        disable_rate_limits()
+
+    @classmethod
+    def retry_stats(cls) -> dict[str, Any]:
+        """Active retry policy and circuit breaker state per provider"""
+        return retry_stats()
+
     @staticmethod
     def get_provider_pricing(provider: str, model: str) -> tuple[float]:
         """Method to retrieve the input and output token pricing for a given model"""
@@ -67,5 +510,8 @@ class ChatFactory():
             return COHERE_MODEL_PRICING[model]
         elif provider == "openai":
             return OPENAI_MODEL_PRICING[model]
+        elif provider == "simulated":
+            # Simulated models are priced as the real model they stand in for, if known
+            return COHERE_MODEL_PRICING.get(model) or OPENAI_MODEL_PRICING.get(model, (0.0, 0.0))
         else:
             raise ValueError("Provider not supported")
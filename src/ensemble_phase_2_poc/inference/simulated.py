@@ -0,0 +1,237 @@
+# Offline chat model for load-testing the workflow machinery.
+#
+# SimulatedChatModel answers like the real agents would (call the bound tool
+# first, then summarize; answer "agent"/"human" when triaging) without any
+# network access. Latency, token counts and provider errors are drawn from
+# configurable distributions so batch, retry and concurrency features can be
+# measured on a laptop.
+
+import asyncio
+import hashlib
+import math
+import random
+import threading
+import time
+from typing import Any, ClassVar, Literal, Sequence
+
+from cohere.errors import InternalServerError, ServiceUnavailableError, TooManyRequestsError
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel, LanguageModelInput
+from langchain_core.language_models.base import LangSmithParams
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field, PrivateAttr
+
+from ensemble_phase_2_poc.config import load_json_config
+from ensemble_phase_2_poc.inference.hedging import HedgingChatModel
+from ensemble_phase_2_poc.inference.rate_limit import RateLimitedChatModel
+from ensemble_phase_2_poc.inference.retry import RetryingChatModel
+
+
+# Values used for required string tool arguments when `tool_args` doesn't name them
+DEFAULT_TOOL_ARGS = {
+    "transaction_id": "1300",
+    "description": "Posted a contractual adjustment at transaction 1300 to clear the balance.",
+}
+
+
+class SimulatedChatModel(RetryingChatModel, HedgingChatModel, RateLimitedChatModel, BaseChatModel):
+    """
+    Rule-based offline chat model with configurable latency and failures.
+
+    Responses, in order of precedence:
+      - `script`: a fixed list of responses, served round-robin
+      - tools bound and no tool result yet: call the first bound tool
+      - a tool result is present: summarize it
+      - a triage prompt: "agent" for `triage_agent_ratio` of accounts, else "human"
+      - otherwise: a short canned answer
+    Triage decisions are derived from a hash of the prompt, so the same
+    account is always routed the same way. Injected failures go through the
+    same retry policy and circuit breaker as real providers.
+    """
+
+    retry_provider: ClassVar[str] = "simulated"
+
+    model: str = "simulated"
+
+    # Latency in milliseconds, drawn per call
+    latency_distribution: Literal["fixed", "uniform", "normal", "lognormal"] = "lognormal"
+    latency_mean_ms: float = 500.0
+    latency_stddev_ms: float = 150.0
+
+    # Token usage reported per call; input tokens are estimated from prompt length
+    output_tokens_min: int = 20
+    output_tokens_max: int = 200
+    chars_per_token: float = 4.0
+
+    # Fraction of calls that fail like the provider would
+    rate_limit_rate: float = 0.0
+    server_error_rate: float = 0.0
+    retry_after_seconds: float = 1.0
+
+    triage_agent_ratio: float = 0.5
+    tool_args: dict[str, Any] = Field(default_factory=dict)
+    script: list[str] = Field(default_factory=list)
+    seed: int | None = None
+
+    _rng: random.Random = PrivateAttr()
+    _rng_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _script_position: int = PrivateAttr(default=0)
+
+    def model_post_init(self, context: Any) -> None:
+        super().model_post_init(context)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"model": self.model}
+
+    def _get_ls_params(self, stop: list[str] | None = None, **kwargs: Any) -> LangSmithParams:
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params["ls_provider"] = "simulated"
+        params["ls_model_name"] = self.model
+        return params
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Runnable[LanguageModelInput, AIMessage]:
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        def _call() -> ChatResult:
+            latency, failure = self._draw()
+            time.sleep(latency)
+            return self._respond(messages, failure, kwargs.get("tools") or [])
+
+        return self._hedged(lambda: self._rate_limited(messages, _call))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        async def _call() -> ChatResult:
+            latency, failure = self._draw()
+            await asyncio.sleep(latency)
+            return self._respond(messages, failure, kwargs.get("tools") or [])
+
+        return await self._ahedged(lambda: self._arate_limited(messages, _call))
+
+    def _draw(self) -> tuple[float, str | None]:
+        """Latency in seconds and the failure to raise, if any, for one call"""
+        with self._rng_lock:
+            mean, stddev = self.latency_mean_ms, self.latency_stddev_ms
+            if self.latency_distribution == "fixed":
+                latency = mean
+            elif self.latency_distribution == "uniform":
+                latency = self._rng.uniform(max(0.0, mean - stddev), mean + stddev)
+            elif self.latency_distribution == "normal":
+                latency = self._rng.gauss(mean, stddev)
+            else:
+                # Parameterized so the distribution has the requested mean and stddev
+                if mean > 0:
+                    sigma = math.sqrt(math.log1p((stddev / mean) ** 2))
+                    latency = self._rng.lognormvariate(math.log(mean) - sigma**2 / 2, sigma)
+                else:
+                    latency = 0.0
+
+            roll = self._rng.random()
+            if roll < self.rate_limit_rate:
+                failure = "rate_limit"
+            elif roll < self.rate_limit_rate + self.server_error_rate:
+                failure = self._rng.choice(["internal", "unavailable"])
+            else:
+                failure = None
+
+        return max(latency, 0.0) / 1000, failure
+
+    def _respond(self, messages: list[BaseMessage], failure: str | None, tools: list[dict]) -> ChatResult:
+        if failure == "rate_limit":
+            raise TooManyRequestsError(
+                body={"message": "simulated rate limit"},
+                headers={"retry-after": f"{self.retry_after_seconds:g}"},
+            )
+        if failure == "internal":
+            raise InternalServerError(body={"message": "simulated internal server error"})
+        if failure == "unavailable":
+            raise ServiceUnavailableError(body={"message": "simulated service unavailable"})
+
+        message = self._next_message(messages, tools)
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        with self._rng_lock:
+            output_tokens = self._rng.randint(self.output_tokens_min, self.output_tokens_max)
+        input_tokens = int(prompt_chars / self.chars_per_token)
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        message.response_metadata = {"model_name": self.model, "finish_reason": "COMPLETE"}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _next_message(self, messages: list[BaseMessage], tools: list[dict]) -> AIMessage:
+        if self.script:
+            with self._rng_lock:
+                content = self.script[self._script_position % len(self.script)]
+                self._script_position += 1
+            return AIMessage(content=content)
+
+        tool_results = [m for m in messages if isinstance(m, ToolMessage)]
+        if tools and not tool_results:
+            function = tools[0]["function"]
+            with self._rng_lock:
+                call_id = f"sim-{self._rng.getrandbits(32):08x}"
+            return AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": function["name"],
+                        "args": self._tool_call_args(function.get("parameters", {})),
+                        "id": call_id,
+                    }
+                ],
+            )
+        if tool_results:
+            result = tool_results[-1]
+            return AIMessage(content=f"Simulated summary of {result.name or 'tool'} output: {str(result.content)[:500]}")
+
+        prompt = "\n".join(str(m.content) for m in messages)
+        if "triage" in prompt.lower():
+            bucket = int(hashlib.sha256(prompt.encode()).hexdigest(), 16) % 10_000
+            return AIMessage(content="agent" if bucket < self.triage_agent_ratio * 10_000 else "human")
+
+        return AIMessage(content="Simulated response.")
+
+    def _tool_call_args(self, parameters: dict[str, Any]) -> dict[str, Any]:
+        """Arguments for the required parameters of a tool's JSON schema"""
+        args = {}
+        for name in parameters.get("required", []):
+            schema = parameters.get("properties", {}).get(name, {})
+            if name in self.tool_args:
+                args[name] = self.tool_args[name]
+            elif name in DEFAULT_TOOL_ARGS:
+                args[name] = DEFAULT_TOOL_ARGS[name]
+            elif schema.get("type") in ("integer", "number"):
+                args[name] = 0
+            elif schema.get("type") == "boolean":
+                args[name] = False
+            else:
+                args[name] = f"simulated-{name}"
+        return args
+
+
+def parse_profile(value: str) -> dict[str, Any]:
+    """SimulatedChatModel kwargs from a JSON object, a path to a JSON file, or "1" for defaults"""
+    return load_json_config(value, "Simulated provider profile")
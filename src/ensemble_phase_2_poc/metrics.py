@@ -0,0 +1,540 @@
+# Prometheus-style metrics for workflows, nodes, tools and LLM calls.
+#
+# A small dependency-free registry of counters, gauges and histograms,
+# recorded in-process on the hot path and exported in the Prometheus text
+# exposition format, either from a local HTTP endpoint or by periodically
+# rewriting a file (e.g. for node_exporter's textfile collector). Other
+# processes, such as batch workers, send snapshots of their registries to the
+# exporting process, which merges them into what it exports.
+#
+# Recording is a dict lookup plus an increment under a per-series lock, so it
+# is cheap enough to leave on unconditionally; exporting is opt-in.
+
+import atexit
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Hashable, Iterator, cast
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+from ensemble_phase_2_poc.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# Export settings, read by configure_from_env()
+METRICS_PORT_ENV_VAR = "ENSEMBLE_METRICS_PORT"
+# Interface the HTTP endpoint binds; 0.0.0.0 exposes it beyond this machine
+METRICS_HOST_ENV_VAR = "ENSEMBLE_METRICS_HOST"
+DEFAULT_METRICS_HOST = "127.0.0.1"
+# May contain "{pid}" so every process writes its own file
+METRICS_FILE_ENV_VAR = "ENSEMBLE_METRICS_FILE"
+METRICS_INTERVAL_ENV_VAR = "ENSEMBLE_METRICS_INTERVAL"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (sample name, label names, label values, value)
+Sample = tuple[str, tuple[str, ...], tuple[str, ...], float]
+# Metric name -> (type, documentation, samples), as sent between processes
+Snapshot = dict[str, tuple[str, str, list[Sample]]]
+
+# Seconds; spans fast tool calls through slow multi-call LLM nodes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: tuple[float, ...]) -> None:
+        self._lock = threading.Lock()
+        self._upper_bounds = upper_bounds
+        # Per-bucket (non-cumulative) counts; the last slot is +Inf
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Metric(ABC):
+    """A named metric family. Series are created on first use of a label combination."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: Any) -> Any:
+        """The series for these label values, in `labelnames` order"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"Metric '{self.name}' expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self) -> Any:
+        """A new series of this metric type"""
+
+    @abstractmethod
+    def samples(self) -> Iterator[Sample]:
+        """(sample name, label names, label values, value) for every series"""
+
+    def clear(self) -> None:
+        with self._lock:
+            self._children.clear()
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def samples(self) -> Iterator[Sample]:
+        for key, child in list(self._children.items()):
+            yield f"{self.name}_total", self.labelnames, key, child.value
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def samples(self) -> Iterator[Sample]:
+        for key, child in list(self._children.items()):
+            yield self.name, self.labelnames, key, child.value
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def samples(self) -> Iterator[Sample]:
+        names = self.labelnames + ("le",)
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", names, key + (_format_value(upper_bound),), cumulative
+            yield f"{self.name}_sum", self.labelnames, key, total
+            yield f"{self.name}_count", self.labelnames, key, cumulative
+
+
+class MetricsRegistry:
+    """Collection of metric families rendered together"""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+        # Latest snapshot from each other process, by source
+        self._remote: dict[Hashable, Snapshot] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Metric:
+        return self._metrics[name]
+
+    def snapshot(self) -> Snapshot:
+        """This process's samples, picklable, for another process's registry to merge()"""
+        return {
+            name: (metric.type_name, metric.documentation, list(metric.samples()))
+            for name, metric in list(self._metrics.items())
+        }
+
+    def merge(self, source: Hashable, snapshot: Snapshot) -> None:
+        """Export `snapshot` from another process along with this one's, replacing source's previous one"""
+        with self._lock:
+            self._remote[source] = snapshot
+
+    def render(self) -> str:
+        """All metrics, summed with the merged snapshots, in the Prometheus text exposition format"""
+        families = self.snapshot()
+        with self._lock:
+            remote = list(self._remote.values())
+        for snapshot in remote:
+            for name, (type_name, documentation, samples) in snapshot.items():
+                families.setdefault(name, (type_name, documentation, []))[2].extend(samples)
+
+        lines = []
+        for name, (type_name, documentation, samples) in families.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_name}")
+            totals: dict[tuple[str, tuple[str, ...], tuple[str, ...]], float] = {}
+            for sample_name, names, values, value in samples:
+                key = (sample_name, names, values)
+                totals[key] = totals.get(key, 0.0) + value
+            for (sample_name, names, values), value in totals.items():
+                lines.append(f"{sample_name}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        """Drop every recorded series and merged snapshot, keeping the metric definitions"""
+        for metric in list(self._metrics.values()):
+            metric.clear()
+        with self._lock:
+            self._remote.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+WORKFLOW_DURATION = REGISTRY.histogram(
+    "ensemble_workflow_duration_seconds", "End-to-end workflow latency per request", ("workflow",)
+)
+WORKFLOW_FAILURES = REGISTRY.counter(
+    "ensemble_workflow_failures", "Workflow requests that raised", ("workflow",)
+)
+WORKFLOWS_IN_FLIGHT = REGISTRY.gauge(
+    "ensemble_workflows_in_flight", "Workflow requests currently executing", ("workflow",)
+)
+
+NODE_DURATION = REGISTRY.histogram(
+    "ensemble_node_duration_seconds", "Node latency, prompt rendering through execution", ("node_id",)
+)
+NODE_FAILURES = REGISTRY.counter("ensemble_node_failures", "Node executions that raised", ("node_id",))
+NODES_IN_FLIGHT = REGISTRY.gauge("ensemble_nodes_in_flight", "Node executions currently running", ("node_id",))
+
+TOOL_DURATION = REGISTRY.histogram("ensemble_tool_duration_seconds", "Tool call latency", ("tool",))
+TOOL_FAILURES = REGISTRY.counter("ensemble_tool_failures", "Tool calls that raised", ("tool",))
+TOOLS_IN_FLIGHT = REGISTRY.gauge("ensemble_tools_in_flight", "Tool calls currently running", ("tool",))
+
+LLM_DURATION = REGISTRY.histogram(
+    "ensemble_llm_duration_seconds", "Latency of a single chat model attempt", ("provider", "model")
+)
+LLM_CALLS = REGISTRY.counter("ensemble_llm_calls", "Completed chat model calls", ("provider", "model"))
+LLM_FAILURES = REGISTRY.counter(
+    "ensemble_llm_failures", "Chat model attempts that raised", ("provider", "model", "error")
+)
+LLM_RETRIES = REGISTRY.counter("ensemble_llm_retries", "Chat model calls retried after backoff", ("provider", "model"))
+LLM_TOKENS = REGISTRY.counter(
+    "ensemble_llm_tokens", "Tokens reported by chat models; type is input, output or cached", ("provider", "model", "type")
+)
+LLMS_IN_FLIGHT = REGISTRY.gauge("ensemble_llms_in_flight", "Chat model calls currently running", ("provider", "model"))
+
+
+@contextmanager
+def track(duration: Histogram, in_flight: Gauge, failures: Counter, *labels: str) -> Iterator[None]:
+    """Record latency, in-flight count and failures of the block under `labels`"""
+    gauge = in_flight.labels(*labels)
+    gauge.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        failures.labels(*labels).inc()
+        raise
+    finally:
+        duration.labels(*labels).observe(time.perf_counter() - start)
+        gauge.dec()
+
+
+def token_usage(response: LLMResult) -> tuple[int, int, int]:
+    """
+    Input, output and cached tokens of a chat model response. Cached tokens are
+    the provider's prompt-cache reads, or all input tokens of a response served
+    by ResponseCache/Cassette (tagged `cache_hit`), since nothing was billed.
+    """
+    input_tokens = output_tokens = cached_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None) or {}
+            input_tokens += usage.get("input_tokens", 0)
+            output_tokens += usage.get("output_tokens", 0)
+            if message is not None and message.response_metadata.get("cache_hit"):
+                cached_tokens += usage.get("input_tokens", 0)
+            else:
+                cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0)
+    return input_tokens, output_tokens, cached_tokens
+
+
+def record_llm_retry(provider: str, model: str) -> None:
+    LLM_RETRIES.labels(provider, model).inc()
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Records chat model latency, calls, failures and tokens per provider and model"""
+
+    def __init__(self) -> None:
+        self._runs: dict[UUID, tuple[str, str, float]] = {}
+
+    # Only model events are recorded; skip dispatch for everything else
+    @property
+    def ignore_chain(self) -> bool:
+        return True
+
+    @property
+    def ignore_agent(self) -> bool:
+        return True
+
+    @property
+    def ignore_retriever(self) -> bool:
+        return True
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[Any]],
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        metadata = metadata or {}
+        provider = metadata.get("ls_provider") or "unknown"
+        model = metadata.get("ls_model_name") or "unknown"
+        self._runs[run_id] = (provider, model, time.perf_counter())
+        LLMS_IN_FLIGHT.labels(provider, model).inc()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        provider, model, start = run
+        LLMS_IN_FLIGHT.labels(provider, model).dec()
+        LLM_DURATION.labels(provider, model).observe(time.perf_counter() - start)
+        LLM_CALLS.labels(provider, model).inc()
+
+        input_tokens, output_tokens, cached_tokens = token_usage(response)
+        if input_tokens:
+            LLM_TOKENS.labels(provider, model, "input").inc(input_tokens)
+        if output_tokens:
+            LLM_TOKENS.labels(provider, model, "output").inc(output_tokens)
+        if cached_tokens:
+            LLM_TOKENS.labels(provider, model, "cached").inc(cached_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        provider, model, start = run
+        LLMS_IN_FLIGHT.labels(provider, model).dec()
+        LLM_DURATION.labels(provider, model).observe(time.perf_counter() - start)
+        LLM_FAILURES.labels(provider, model, type(error).__name__).inc()
+
+
+# Handler for chat model metrics in this context. Unset, the process-wide
+# handler below is used, so every LangChain callback manager records chat
+# model metrics without explicit callbacks; set one to record elsewhere.
+_LLM_METRICS: ContextVar[LLMMetricsHandler | None] = ContextVar("ensemble_llm_metrics", default=None)
+_PROCESS_LLM_METRICS = LLMMetricsHandler()
+
+
+class _LLMMetricsHook:
+    """What the configure hook reads: this context's handler, else the process-wide one"""
+
+    def get(self) -> LLMMetricsHandler:
+        return _LLM_METRICS.get() or _PROCESS_LLM_METRICS
+
+
+# Only get() is called on registered hook variables
+register_configure_hook(cast(ContextVar, _LLMMetricsHook()), inheritable=True)
+
+
+@contextmanager
+def llm_metrics_handler(handler: LLMMetricsHandler) -> Iterator[LLMMetricsHandler]:
+    """Record chat model calls made inside the block with `handler` instead of the process-wide one"""
+    token = _LLM_METRICS.set(handler)
+    try:
+        yield handler
+    finally:
+        _LLM_METRICS.reset(token)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self) -> None:
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Scrapes would otherwise be logged to stderr on every request
+        pass
+
+
+def start_http_server(port: int, host: str = DEFAULT_METRICS_HOST, registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve `registry` on http://host:port/ from a daemon thread. Port 0 picks a free port."""
+    handler = type("MetricsRequestHandler", (_MetricsRequestHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def write_metrics_file(path: str | Path, registry: MetricsRegistry = REGISTRY) -> None:
+    """Atomically replace `path` with the current metrics"""
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    temp_path.write_text(registry.render())
+    os.replace(temp_path, path)
+
+
+class FileExporter:
+    """Rewrites a metrics file every `interval` seconds, and once more at exit"""
+
+    def __init__(self, path: str | Path, interval: float = 15.0, registry: MetricsRegistry = REGISTRY):
+        if interval <= 0:
+            raise ValueError(f"Metrics file interval must be > 0, got {interval}")
+        self.path = Path(str(path).format(pid=os.getpid()))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+        self.registry = registry
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-file", daemon=True)
+
+    def start(self) -> "FileExporter":
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"Writing metrics to {self.path} every {self.interval:g}s")
+        return self
+
+    def stop(self) -> None:
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self.write()
+
+    def write(self) -> None:
+        try:
+            write_metrics_file(self.path, self.registry)
+        except OSError as e:
+            logger.warning(f"Failed to write metrics file {self.path}: {e}")
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+
+_EXPORTERS_LOCK = threading.Lock()
+_http_server: ThreadingHTTPServer | None = None
+_file_exporter: FileExporter | None = None
+
+
+def configure_from_env() -> None:
+    """
+    Start the exporters named by ENSEMBLE_METRICS_PORT (on ENSEMBLE_METRICS_HOST,
+    localhost by default) / ENSEMBLE_METRICS_FILE, once per process
+    """
+    global _http_server, _file_exporter
+    with _EXPORTERS_LOCK:
+        port = os.environ.get(METRICS_PORT_ENV_VAR)
+        if port and _http_server is None:
+            _http_server = start_http_server(int(port), os.environ.get(METRICS_HOST_ENV_VAR) or DEFAULT_METRICS_HOST)
+
+        path = os.environ.get(METRICS_FILE_ENV_VAR)
+        if path and _file_exporter is None:
+            interval = float(os.environ.get(METRICS_INTERVAL_ENV_VAR, "15"))
+            _file_exporter = FileExporter(path, interval).start()
@@ -0,0 +1,192 @@
+# Rule-based pre-screen ahead of the LLM path.
+#
+# Every account normally pays for research and triage calls, even when its
+# record already settles the outcome. Batch runners evaluate PrescreenRules
+# over a whole block of records at once, as NumPy columns, and send matching
+# accounts straight to "human" with a synthetic `prescreen` NodeExecution;
+# the rest run the workflow as usual. Rules only act on fields a record
+# actually carries, so records without balance or notes are never screened.
+#
+# Rules, in order of precedence:
+#   - lob_out_of_scope: `lob` is one of `excluded_lobs`
+#   - zero_balance: |`total_outstanding`| below `min_outstanding`
+#   - no_notes: `notes` (a list, or a count) is empty
+
+import json
+from collections import Counter as CounterDict
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Sequence
+
+import numpy as np
+
+from ensemble_phase_2_poc.agents import AccountResearchAgent, TriageAgent
+from ensemble_phase_2_poc.config import parse_config
+from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.metrics import REGISTRY
+from ensemble_phase_2_poc.state import NodeExecution, WorkflowState
+
+
+logger = get_logger(__name__)
+
+PRESCREEN_NODE_ID = "prescreen"
+
+# Nodes a screened account skips, and the fewest LLM calls they make together
+SKIPPED_NODES = (AccountResearchAgent.node_id, TriageAgent.node_id)
+MIN_LLM_CALLS_SKIPPED = 2
+
+PRESCREENED = REGISTRY.counter(
+    "ensemble_prescreened_accounts", "Accounts routed to human by a pre-screen rule", ("rule",)
+)
+LLM_CALLS_SAVED = REGISTRY.counter(
+    "ensemble_prescreen_llm_calls_saved", "LLM calls avoided by pre-screening, estimated from unscreened accounts"
+)
+
+
+@dataclass(frozen=True)
+class PrescreenRules:
+    """Which accounts skip the LLM path"""
+
+    # Balances below this (in either direction) need no resolution
+    min_outstanding: float = 0.01
+    # Accounts with no notes give the resolution agent nothing to act on
+    screen_without_notes: bool = True
+    # Lines of business the workflow doesn't handle
+    excluded_lobs: tuple[str, ...] = ()
+
+    def __post_init__(self) -> None:
+        if self.min_outstanding < 0:
+            raise ValueError(f"min_outstanding must be >= 0, got {self.min_outstanding}")
+
+
+def parse_prescreen_rules(value: str) -> PrescreenRules:
+    """PrescreenRules from "1", a JSON object or a path to a JSON file"""
+    return parse_config(value, PrescreenRules, "Pre-screen rules", excluded_lobs=tuple)
+
+
+def _amount(value: Any) -> float:
+    """Balance as a float, NaN when missing or unparseable (e.g. an empty CSV cell)"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _count(value: Any) -> int:
+    """Number of notes from a list, a count or a JSON list string; -1 when unknown"""
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return -1
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return -1
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+        return int(value)
+    return -1
+
+
+@dataclass
+class AccountColumns:
+    """A block of account records as columns"""
+
+    lob: np.ndarray
+    total_outstanding: np.ndarray
+    note_count: np.ndarray
+
+    @classmethod
+    def from_records(cls, records: Sequence[Mapping[str, Any]]) -> "AccountColumns":
+        return cls(
+            lob=np.array([str(record.get("lob", "")) for record in records], dtype=str),
+            total_outstanding=np.fromiter(
+                (_amount(record.get("total_outstanding")) for record in records), dtype=np.float64, count=len(records)
+            ),
+            note_count=np.fromiter(
+                (_count(record.get("notes")) for record in records), dtype=np.int64, count=len(records)
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.lob)
+
+
+def evaluate(columns: AccountColumns, rules: PrescreenRules) -> np.ndarray:
+    """The rule that screens each account, or "" for accounts that take the LLM path"""
+    conditions = [
+        np.isin(columns.lob, rules.excluded_lobs) if rules.excluded_lobs else np.zeros(len(columns), dtype=bool),
+        # NaN (no balance given) compares False
+        np.abs(columns.total_outstanding) < rules.min_outstanding,
+        (columns.note_count == 0) & rules.screen_without_notes,
+    ]
+    choices = ["lob_out_of_scope", "zero_balance", "no_notes"]
+    return np.select(conditions, choices, default="")
+
+
+def screened_state(state: WorkflowState, rule: str) -> WorkflowState:
+    """Final state of an account screened by `rule`: a single synthetic node routing to human"""
+    return {
+        **state,
+        "node_outputs": {
+            PRESCREEN_NODE_ID: NodeExecution(
+                node_id=PRESCREEN_NODE_ID,
+                input="",
+                output="human",
+                metadata={"rule": rule, "llm_calls": 0, "wall_time_seconds": 0.0},
+            )
+        },
+        "execution_path": [PRESCREEN_NODE_ID],
+    }
+
+
+@dataclass
+class PrescreenReport:
+    """Accounts screened per rule, and the LLM calls that saved"""
+
+    screened_by_rule: CounterDict = field(default_factory=CounterDict)
+    # LLM calls unscreened accounts made in SKIPPED_NODES
+    _observed_calls: int = 0
+    _observed_accounts: int = 0
+
+    @property
+    def screened(self) -> int:
+        return sum(self.screened_by_rule.values())
+
+    def record_screened(self, rules: np.ndarray) -> None:
+        for rule, count in zip(*np.unique(rules[rules != ""], return_counts=True)):
+            self.screened_by_rule[str(rule)] += int(count)
+            PRESCREENED.labels(str(rule)).inc(int(count))
+
+    def observe(self, custom_outputs: Mapping[str, Any] | None) -> None:
+        """Learn the calls a screened account would have made from an account that ran the LLM path"""
+        nodes = ((custom_outputs or {}).get("usage") or {}).get("nodes", {})
+        if all(node_id in nodes for node_id in SKIPPED_NODES):
+            self._observed_calls += sum(nodes[node_id]["llm_calls"] for node_id in SKIPPED_NODES)
+            self._observed_accounts += 1
+
+    @property
+    def llm_calls_per_account(self) -> float:
+        if not self._observed_accounts:
+            return float(MIN_LLM_CALLS_SKIPPED)
+        return max(self._observed_calls / self._observed_accounts, MIN_LLM_CALLS_SKIPPED)
+
+    @property
+    def llm_calls_saved(self) -> int:
+        return round(self.screened * self.llm_calls_per_account)
+
+    def finish(self) -> None:
+        """Export the batch's savings and log them"""
+        LLM_CALLS_SAVED.labels().inc(self.llm_calls_saved)
+        if self.screened:
+            logger.info(
+                f"Pre-screen routed {self.screened} accounts to human ({dict(self.screened_by_rule)}), "
+                f"saving ~{self.llm_calls_saved} LLM calls"
+            )
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "screened": self.screened,
+            "screened_by_rule": dict(self.screened_by_rule),
+            "llm_calls_saved": self.llm_calls_saved,
+        }
@@ -0,0 +1,90 @@
+# What a finished node keeps of its prompt.
+#
+# Each NodeExecution stores the prompt its node rendered in `input`. Prompts
+# embed account data and upstream outputs, so they are most of an account's
+# workflow state and stay in memory until the account finishes, although no
+# later node reads them. The retention mode, set with the
+# ENSEMBLE_PROMPT_RETENTION env var (or --prompt-retention), decides what
+# BaseAgent stores once the node's execution is over:
+#   - keep (default): the prompt itself
+#   - drop: an empty string, with the prompt's length in metadata
+#   - a directory path: the prompt is written to <dir>/<sha256>.txt once and
+#     `input` holds that path; load_prompt() reads it back
+# MLflow traces record prompts independently of this setting.
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Literal
+
+from ensemble_phase_2_poc.config import env_setting
+from ensemble_phase_2_poc.state import NodeExecution
+
+
+PROMPT_RETENTION_ENV_VAR = "ENSEMBLE_PROMPT_RETENTION"
+
+
+@dataclass(frozen=True)
+class PromptRetention:
+    """How NodeExecution.input is stored once a node finishes"""
+
+    mode: Literal["keep", "drop", "externalize"] = "keep"
+    # Where externalized prompts are written
+    directory: Path | None = None
+
+    def __post_init__(self) -> None:
+        if self.mode not in ("keep", "drop", "externalize"):
+            raise ValueError(f"Unknown prompt retention mode: {self.mode}")
+        if (self.mode == "externalize") != (self.directory is not None):
+            raise ValueError("A directory is required to externalize prompts, and only then")
+
+    def retain(self, prompt: str) -> tuple[str, dict[str, Any]]:
+        """The value to store as `input`, and metadata entries describing it"""
+        if self.mode == "keep":
+            return prompt, {}
+        if self.mode == "drop":
+            return "", {"input_chars": len(prompt), "input_retention": "drop"}
+        return str(self._write(prompt)), {"input_chars": len(prompt), "input_retention": "externalize"}
+
+    def _write(self, prompt: str) -> Path:
+        """Store the prompt content-addressed, so repeated prompts share a file"""
+        data = prompt.encode()
+        path = self.directory / f"{hashlib.sha256(data).hexdigest()}.txt"
+        if not path.exists():
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Write then rename, so concurrent workers never see a partial file
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp, path)
+        return path
+
+
+def parse_prompt_retention(value: str) -> PromptRetention:
+    """PromptRetention from "keep", "drop" or a directory to externalize prompts to"""
+    value = value.strip()
+    if value in ("", "keep"):
+        return PromptRetention()
+    if value == "drop":
+        return PromptRetention(mode="drop")
+    return PromptRetention(mode="externalize", directory=Path(value))
+
+
+_get_retention = env_setting(PROMPT_RETENTION_ENV_VAR, parse_prompt_retention, default=PromptRetention())
+
+
+def get_prompt_retention() -> PromptRetention:
+    """Retention mode from the environment, so batch workers follow the CLI"""
+    return _get_retention()
+
+
+def load_prompt(node_execution: NodeExecution) -> str | None:
+    """A node's prompt, reading it back if it was externalized. None if it was dropped."""
+    retention = node_execution["metadata"].get("input_retention")
+    if retention == "drop":
+        return None
+    if retention == "externalize":
+        return Path(node_execution["input"]).read_text()
+    return node_execution["input"]
@@ -0,0 +1,312 @@
+# Speculative execution of workflow nodes.
+#
+# A node whose inputs are ready while the decision to run it is still pending
+# (resolution, while triage chooses between "agent" and "human") can start
+# early on a Speculation. Its LLM calls and read-only tools run freely, but a
+# tool with side effects (Tool.has_side_effects) blocks on the speculation's
+# gate until the decision is made:
+#   - confirm(): held tools proceed and the node's state update is returned
+#   - discard(): held tools and any further LLM calls raise
+#     SpeculationAborted and async runs are cancelled. Once the run has
+#     stopped, everything it spent, including a call that was still in flight
+#     at the decision, is recorded as wasted; settle() waits for that
+#   - discard("error"), when the deciding node failed: the same, but counted
+#     under its own outcome rather than as a miss, and not as waste
+#
+# Sync runs share a pool of MAX_SPECULATION_THREADS threads. A discarded run
+# still queued for one never starts; one already running holds its thread
+# until its current LLM or tool call returns and the next one hits the gate.
+# An async run is cancelled at once, so a call in flight adds no tokens.
+#
+# Outcomes and waste go to the process metrics and to a per-account summary
+# (Speculation.summary()); SpeculationReport aggregates those over a batch.
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterator, Literal, Mapping
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from ensemble_phase_2_poc.inference.router import COHERE_MODEL_PRICING, OPENAI_MODEL_PRICING
+from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.metrics import REGISTRY
+from ensemble_phase_2_poc.telemetry import NodeUsageHandler, track_usage
+
+
+logger = get_logger(__name__)
+
+# Sync speculative runs on threads at once; more queue for a free thread
+MAX_SPECULATION_THREADS = 32
+
+SPECULATIONS = REGISTRY.counter(
+    "ensemble_speculations",
+    "Speculative node runs by outcome (hit: the node was needed, error: the deciding node failed)",
+    ("node", "outcome"),
+)
+SPECULATION_HELD_TOOLS = REGISTRY.counter(
+    "ensemble_speculation_held_tool_calls", "Side-effecting tool calls held until a speculation was decided", ("tool",)
+)
+SPECULATION_WASTED_CALLS = REGISTRY.counter(
+    "ensemble_speculation_wasted_llm_calls", "LLM calls made by discarded speculative runs", ("node",)
+)
+SPECULATION_WASTED_TOKENS = REGISTRY.counter(
+    "ensemble_speculation_wasted_tokens", "Tokens spent by discarded speculative runs", ("node", "type")
+)
+SPECULATION_WASTED_COST = REGISTRY.counter(
+    "ensemble_speculation_wasted_cost_usd", "Estimated cost of discarded speculative runs", ("node",)
+)
+
+_GATE: ContextVar["SpeculationGate | None"] = ContextVar("ensemble_speculation_gate", default=None)
+
+_STATE_LOCK = threading.Lock()
+_EXECUTOR: ThreadPoolExecutor | None = None
+
+
+class SpeculationAborted(RuntimeError):
+    """Raised inside a speculative run once its speculation is discarded"""
+
+
+class SpeculationGate(BaseCallbackHandler):
+    """
+    Holds side effects of a speculative run until it is confirmed or rejected.
+    Also attached as a callback while active, to stop LLM calls after a rejection.
+    """
+
+    raise_error = True
+
+    def __init__(self) -> None:
+        self._decided = threading.Event()
+        self._confirmed = False
+
+    @property
+    def rejected(self) -> bool:
+        return self._decided.is_set() and not self._confirmed
+
+    def confirm(self) -> None:
+        self._confirmed = True
+        self._decided.set()
+
+    def reject(self) -> None:
+        self._decided.set()
+
+    def wait(self, tool_name: str) -> None:
+        """Block until decided; raise SpeculationAborted if rejected"""
+        if not self._decided.is_set():
+            SPECULATION_HELD_TOOLS.labels(tool_name).inc()
+            logger.debug(f"Holding {tool_name} until the speculation is decided")
+            self._decided.wait()
+        self._check(tool_name)
+
+    async def await_decision(self, tool_name: str) -> None:
+        """Async twin of wait()"""
+        if not self._decided.is_set():
+            SPECULATION_HELD_TOOLS.labels(tool_name).inc()
+            logger.debug(f"Holding {tool_name} until the speculation is decided")
+            await asyncio.to_thread(self._decided.wait)
+        self._check(tool_name)
+
+    def _check(self, what: str) -> None:
+        if not self._confirmed:
+            raise SpeculationAborted(f"Speculation discarded before {what}")
+
+    def on_chat_model_start(self, serialized: dict[str, Any], messages: list[list[Any]], **kwargs: Any) -> None:
+        if self.rejected:
+            self._check("LLM call")
+
+
+register_configure_hook(_GATE, inheritable=True)
+
+
+def hold_side_effects(tool_name: str) -> None:
+    """Called before a side-effecting tool runs: waits out any active speculation"""
+    gate = _GATE.get()
+    if gate is not None:
+        gate.wait(tool_name)
+
+
+async def ahold_side_effects(tool_name: str) -> None:
+    """Async twin of hold_side_effects()"""
+    gate = _GATE.get()
+    if gate is not None:
+        await gate.await_decision(tool_name)
+
+
+def _executor() -> ThreadPoolExecutor:
+    """Threads for sync speculative runs, which must run beside the deciding node"""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _STATE_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(max_workers=MAX_SPECULATION_THREADS, thread_name_prefix="speculation")
+    return _EXECUTOR
+
+
+def _cost(model: str | None, input_tokens: int, output_tokens: int) -> float:
+    """Dollar cost of tokens on `model`, priced from the router's tables (0 when unknown)"""
+    input_price, output_price = COHERE_MODEL_PRICING.get(model) or OPENAI_MODEL_PRICING.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1e6
+
+
+class Speculation:
+    """One early run of a node, kept or thrown away once the deciding node finishes"""
+
+    def __init__(self, node_id: str):
+        self.node_id = node_id
+        self.gate = SpeculationGate()
+        self.usage = NodeUsageHandler()
+        self.outcome: str | None = None
+        self._future: Future | None = None
+        self._task: asyncio.Task | None = None
+
+    @contextmanager
+    def _scope(self) -> Iterator[None]:
+        """Gate side effects and count usage of everything run inside"""
+        token = _GATE.set(self.gate)
+        try:
+            with track_usage() as usage:
+                # The node's own handler reports here through the nesting
+                self.usage = usage
+                yield
+        finally:
+            _GATE.reset(token)
+
+    def _run(self, node: Callable[[Any], dict], state: Any) -> dict:
+        with self._scope():
+            return node(state)
+
+    async def _arun(self, node: Callable[[Any], Awaitable[dict]], state: Any) -> dict:
+        with self._scope():
+            return await node(state)
+
+    def start(self, node: Callable[[Any], dict], state: Any) -> "Speculation":
+        """Run node(state) on a speculation thread"""
+        self._future = _executor().submit(copy_context().run, self._run, node, state)
+        return self
+
+    def astart(self, node: Callable[[Any], Awaitable[dict]], state: Any) -> "Speculation":
+        """Run `await node(state)` as a task on the running loop"""
+        self._task = asyncio.get_running_loop().create_task(self._arun(node, state))
+        return self
+
+    def confirm(self) -> dict:
+        """Release held side effects and wait for the node's state update"""
+        self._decide("hit")
+        return self._future.result()
+
+    async def aconfirm(self) -> dict:
+        """Async twin of confirm()"""
+        self._decide("hit")
+        return await self._task
+
+    def discard(self, outcome: Literal["miss", "error"] = "miss") -> None:
+        """
+        Abort the run at its next LLM or side-effecting tool call, or before it
+        starts if it is still queued. Does not wait for it; the waste of a miss
+        is recorded once the run has stopped. `outcome` is "miss" when the node
+        turned out not to be needed, "error" when the deciding node failed.
+        """
+        self._decide(outcome)
+        if self._task is not None:
+            self._task.cancel()
+            self._task.add_done_callback(self._abandoned)
+        if self._future is not None:
+            self._future.cancel()
+            self._future.add_done_callback(self._abandoned)
+
+    def settle(self, timeout: float | None = None) -> None:
+        """Wait for a discarded sync run to stop, so summary() covers everything it spent"""
+        if self._future is not None:
+            wait([self._future], timeout=timeout)
+
+    async def asettle(self) -> None:
+        """Async twin of settle()"""
+        if self._task is not None:
+            await asyncio.wait([self._task])
+
+    def _decide(self, outcome: str) -> None:
+        self.outcome = outcome
+        if outcome == "hit":
+            self.gate.confirm()
+        else:
+            self.gate.reject()
+        SPECULATIONS.labels(self.node_id, outcome).inc()
+
+    def _abandoned(self, run: Future | asyncio.Task) -> None:
+        """Done callback of a discarded run"""
+        error = None if run.cancelled() else run.exception()
+        if error is not None and not isinstance(error, SpeculationAborted):
+            logger.warning(f"Discarded speculative run of {self.node_id} failed: {error}")
+        if self.outcome == "miss":
+            self._record_waste()
+
+    def _record_waste(self) -> None:
+        summary = self.summary()
+        SPECULATION_WASTED_CALLS.labels(self.node_id).inc(summary["wasted_llm_calls"])
+        SPECULATION_WASTED_TOKENS.labels(self.node_id, "input").inc(summary["wasted_input_tokens"])
+        SPECULATION_WASTED_TOKENS.labels(self.node_id, "output").inc(summary["wasted_output_tokens"])
+        SPECULATION_WASTED_COST.labels(self.node_id).inc(summary["wasted_cost"])
+
+    def summary(self) -> dict[str, Any]:
+        """Outcome and what a miss cost; complete once the discarded run has settled"""
+        wasted = self.outcome == "miss"
+        input_tokens = self.usage.input_tokens if wasted else 0
+        output_tokens = self.usage.output_tokens if wasted else 0
+        return {
+            "node": self.node_id,
+            "outcome": self.outcome,
+            "wasted_llm_calls": self.usage.llm_calls if wasted else 0,
+            "wasted_input_tokens": input_tokens,
+            "wasted_output_tokens": output_tokens,
+            "wasted_cost": _cost(self.usage.model, input_tokens, output_tokens),
+        }
+
+
+@dataclass
+class SpeculationReport:
+    """Hit rate and wasted work of the speculations in a set of responses"""
+
+    hits: int = 0
+    misses: int = 0
+    wasted_llm_calls: int = 0
+    wasted_input_tokens: int = 0
+    wasted_output_tokens: int = 0
+    wasted_cost: float = 0.0
+
+    @property
+    def speculated(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.speculated if self.speculated else 0.0
+
+    def observe(self, custom_outputs: Mapping[str, Any] | None) -> None:
+        """Add the `speculation` summary of one response, if it has one"""
+        summary = (custom_outputs or {}).get("speculation")
+        if not summary:
+            return
+        if summary["outcome"] == "hit":
+            self.hits += 1
+        elif summary["outcome"] == "miss":
+            self.misses += 1
+        self.wasted_llm_calls += summary["wasted_llm_calls"]
+        self.wasted_input_tokens += summary["wasted_input_tokens"]
+        self.wasted_output_tokens += summary["wasted_output_tokens"]
+        self.wasted_cost += summary["wasted_cost"]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "speculated": self.speculated,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "wasted_llm_calls": self.wasted_llm_calls,
+            "wasted_input_tokens": self.wasted_input_tokens,
+            "wasted_output_tokens": self.wasted_output_tokens,
+            "wasted_cost": self.wasted_cost,
+        }
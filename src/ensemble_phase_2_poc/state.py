@@ -12,12 +12,34 @@ class NodeExecution(TypedDict):
     metadata: dict[str, Any]  # timestamps, token counts, model used, etc.
 
 
+class AccountContext(TypedDict):
+    """Per-account values passed to inner agents as LangGraph runtime context.
+
+    Tools read these from their injected ToolRuntime rather than having them
+    baked in at construction, so one agent and its tools serve every account.
+    """
+
+    account_number: str
+    client_name: str
+    facility_prefix: str
+    lob: str
+
+
+def merge_node_outputs(
+    left: dict[str, NodeExecution], right: dict[str, NodeExecution]
+) -> dict[str, NodeExecution]:
+    """Reducer for node_outputs: each node returns only its own entry, added to the rest"""
+    return {**left, **right}
+
+
 class WorkflowState(TypedDict):
     """State schema for LangGraph workflows"""
 
     # Node outputs keyed by semantic node_id (e.g., "research", "analyze")
     # Each node reads input from prior node's output via get_node_output()
-    node_outputs: dict[str, NodeExecution]
+    # Uses a merge reducer, so nodes return only their own entry and nodes
+    # running in parallel don't overwrite each other
+    node_outputs: Annotated[dict[str, NodeExecution], merge_node_outputs]
 
     # Ordered list of node_ids that have executed - uses reducer to accumulate
     execution_path: Annotated[list[str], operator.add]
@@ -43,3 +65,13 @@ def get_prior_outputs(state: WorkflowState, node_ids: list[str]) -> dict[str, st
         for node_id in node_ids
         if node_id in state["node_outputs"]
     }
+
+
+def get_account_context(state: WorkflowState) -> AccountContext:
+    """Extract the per-account runtime context from workflow state"""
+    return AccountContext(
+        account_number=state["account_number"],
+        client_name=state["client_name"],
+        facility_prefix=state["facility_prefix"],
+        lob=state["lob"],
+    )
@@ -0,0 +1,194 @@
+# Per-node timing and LLM usage accounting.
+#
+# BaseAgent wraps each node execution in track_node_usage(). While it is
+# active, a NodeUsageHandler is attached to every LangChain callback manager
+# configured in that context (via register_configure_hook), so the LLM calls
+# made by the node's inner agent are counted without threading callbacks
+# through execute(). The node's latency also feeds the process-wide metrics.
+#
+# Handlers nest: one opened inside another (e.g. a node run inside a
+# track_usage() block) also reports to the enclosing handler, so the outer
+# block sees the usage of nodes that never returned.
+#
+# Tools that compact their output for the model (tools/encoding.py) report
+# the estimated tokens sent and saved to the current handler as well.
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Iterator
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+from ensemble_phase_2_poc.metrics import NODE_DURATION, NODE_FAILURES, NODES_IN_FLIGHT, token_usage, track
+
+
+_NODE_USAGE: ContextVar["NodeUsageHandler | None"] = ContextVar("ensemble_node_usage", default=None)
+register_configure_hook(_NODE_USAGE, inheritable=True)
+
+# Counters summed across nodes in the response's usage block
+USAGE_COUNTERS = (
+    "llm_calls",
+    "retries",
+    "input_tokens",
+    "output_tokens",
+    "cached_tokens",
+    "tool_output_tokens",
+    "tool_output_tokens_saved",
+)
+
+
+class NodeUsageHandler(BaseCallbackHandler):
+    """
+    Accumulates LLM calls, retries and token counts for one node execution.
+    `llm_calls` counts every attempt when it starts, failed ones included, as
+    the provider sees them; `retries` counts the failed ones.
+    """
+
+    def __init__(self, parent: "NodeUsageHandler | None" = None, node_id: str | None = None) -> None:
+        self.parent = parent
+        self.node_id = node_id
+        self._lock = threading.Lock()
+        self._models: dict[UUID, str] = {}
+        self.model: str | None = None
+        self.llm_calls = 0
+        self.retries = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        # Estimated tokens of compacted tool outputs, and how many compaction removed
+        self.tool_output_tokens = 0
+        self.tool_output_tokens_saved = 0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self._start = 0.0
+        self._end = 0.0
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[Any]],
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        model = (metadata or {}).get("ls_model_name")
+        with self._lock:
+            self.llm_calls += 1
+            if model:
+                self._models[run_id] = model
+        if self.parent is not None:
+            self.parent.on_chat_model_start(serialized, messages, run_id=run_id, metadata=metadata, **kwargs)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        input_tokens, output_tokens, cached_tokens = token_usage(response)
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cached_tokens += cached_tokens
+            self.model = self._models.pop(run_id, self.model)
+        if self.parent is not None:
+            self.parent.on_llm_end(response, run_id=run_id, **kwargs)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if self.parent is not None:
+            self.parent.on_llm_error(error, run_id=run_id, **kwargs)
+        if isinstance(error, asyncio.CancelledError):
+            # A cancelled call, e.g. a discarded speculation, not a failure
+            with self._lock:
+                self._models.pop(run_id, None)
+            return
+        # A failed attempt inside a node that completed was retried
+        with self._lock:
+            self.retries += 1
+            self._models.pop(run_id, None)
+
+    def record_tool_output(self, raw_tokens: int, sent_tokens: int) -> None:
+        with self._lock:
+            self.tool_output_tokens += sent_tokens
+            self.tool_output_tokens_saved += raw_tokens - sent_tokens
+        if self.parent is not None:
+            self.parent.record_tool_output(raw_tokens, sent_tokens)
+
+    def start(self) -> None:
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+
+    def stop(self) -> None:
+        self.finished_at = time.time()
+        self._end = time.perf_counter()
+
+    @property
+    def wall_time_seconds(self) -> float:
+        return self._end - self._start
+
+    def as_metadata(self) -> dict[str, Any]:
+        """NodeExecution metadata entries for this node"""
+        with self._lock:
+            return {
+                "started_at": _isoformat(self.started_at),
+                "finished_at": _isoformat(self.finished_at),
+                "wall_time_seconds": self.wall_time_seconds,
+                "llm_calls": self.llm_calls,
+                "retries": self.retries,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "cached_tokens": self.cached_tokens,
+                "tool_output_tokens": self.tool_output_tokens,
+                "tool_output_tokens_saved": self.tool_output_tokens_saved,
+                "model": self.model,
+            }
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+@contextmanager
+def track_node_usage(node_id: str) -> Iterator[NodeUsageHandler]:
+    """Count the LLM usage of everything run inside the block, including worker threads it spawns"""
+    with track_usage(node_id) as handler:
+        with track(NODE_DURATION, NODES_IN_FLIGHT, NODE_FAILURES, node_id):
+            yield handler
+
+
+@contextmanager
+def track_usage(node_id: str | None = None) -> Iterator[NodeUsageHandler]:
+    """Count the LLM usage inside the block, without node metrics. Also reports to any enclosing handler."""
+    handler = NodeUsageHandler(parent=_NODE_USAGE.get(), node_id=node_id)
+    token = _NODE_USAGE.set(handler)
+    handler.start()
+    try:
+        yield handler
+    finally:
+        handler.stop()
+        _NODE_USAGE.reset(token)
+
+
+def current_usage() -> NodeUsageHandler | None:
+    """The innermost handler counting usage in this context, if any"""
+    return _NODE_USAGE.get()
+
+
+def summarize_usage(node_metadata: dict[str, dict[str, Any]]) -> dict[str, Any]:
+    """Aggregate latency and token breakdown from per-node metadata, keyed by node_id"""
+    nodes = {
+        node_id: {
+            "wall_time_seconds": metadata.get("wall_time_seconds", 0.0),
+            **{counter: metadata.get(counter, 0) for counter in USAGE_COUNTERS},
+            "model": metadata.get("model"),
+        }
+        for node_id, metadata in node_metadata.items()
+    }
+    return {
+        "wall_time_seconds": sum(node["wall_time_seconds"] for node in nodes.values()),
+        **{counter: sum(node[counter] for node in nodes.values()) for counter in USAGE_COUNTERS},
+        "nodes": nodes,
+    }
@@ -1,6 +1,10 @@
 from ensemble_phase_2_poc.tools.get_account_data import GetAccountData
 from ensemble_phase_2_poc.tools.post_contractual_adjustment import PostContractualAdjustment
 from ensemble_phase_2_poc.tools.post_account_note import PostAccountNote
+from ensemble_phase_2_poc.tools.base_tool import validate_tool_descriptions
+
+# Fail at import if descriptions.yaml and the tool classes have drifted apart
+validate_tool_descriptions()
 
 
 __all__ = [
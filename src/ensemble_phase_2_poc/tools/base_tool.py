@@ -1,16 +1,88 @@
 import mlflow
 from abc import abstractmethod
+from functools import lru_cache
 from logging import Logger
 from pathlib import Path
-from typing import Any
+from types import MappingProxyType
+from typing import Annotated, Any, ClassVar, Iterable, Mapping
 import yaml
-from langchain.tools import BaseTool
+from langchain.tools import BaseTool, ToolRuntime
+from langchain_core.tools import InjectedToolArg
+from pydantic import BaseModel, ConfigDict
 
 from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.metrics import TOOL_DURATION, TOOL_FAILURES, TOOLS_IN_FLIGHT, track
+from ensemble_phase_2_poc.speculation import ahold_side_effects, hold_side_effects
+from ensemble_phase_2_poc.state import AccountContext
+from ensemble_phase_2_poc.telemetry import current_usage
+from ensemble_phase_2_poc.tools.encoding import (
+    TOOL_OUTPUT_TOKENS_SAVED,
+    default_tool_output,
+    encode_tool_output,
+    estimate_tokens,
+    get_output_encoding,
+)
 
 
 FILE_PATH = Path(__file__).parent / "descriptions.yaml"
 
+# libyaml's loader is several times faster when available
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@lru_cache(maxsize=None)
+def load_tool_descriptions(path: str | Path = FILE_PATH) -> Mapping[str, str]:
+    """
+    Read-only tool name -> description mapping for a descriptions file.
+    Each file is parsed once per process and shared by every caller.
+    """
+    # Spellings of the same file (relative, symlinked) share one parse
+    return _load_tool_descriptions(Path(path).resolve())
+
+
+@lru_cache(maxsize=None)
+def _load_tool_descriptions(path: Path) -> Mapping[str, str]:
+    with open(path, "r") as file:
+        descriptions = yaml.load(file, Loader=_YAML_LOADER) or {}
+
+    if not isinstance(descriptions, dict):
+        raise ValueError(f"Tool descriptions file {path} must contain a mapping of tool name to description")
+
+    return MappingProxyType(dict(descriptions))
+
+
+def validate_tool_descriptions(
+    tool_names: Iterable[str] | None = None,
+    path: str | Path = FILE_PATH,
+) -> None:
+    """
+    Check that the descriptions file and the tools agree: every tool has a
+    description and every description belongs to a tool. Defaults to the
+    names of all Tool subclasses defined so far.
+    """
+    tool_names = set(Tool.registered_tools if tool_names is None else tool_names)
+    described = set(load_tool_descriptions(path))
+
+    errors = []
+    if missing := tool_names - described:
+        errors.append(f"tools without a description: {sorted(missing)}")
+    if unknown := described - tool_names:
+        errors.append(f"descriptions without a tool: {sorted(unknown)}")
+    if errors:
+        raise ValueError(f"Tool descriptions in {path} do not match the registered tools: {'; '.join(errors)}")
+
+
+class ToolInput(BaseModel):
+    """
+    Base input schema for tools. The `runtime` field is injected by the agent's
+    ToolNode and hidden from the LLM; it carries the per-account AccountContext.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    runtime: Annotated[ToolRuntime[AccountContext] | None, InjectedToolArg] = None
+
+
 class Tool(BaseTool):
     """
     Base tool class that extends LangGraph's BaseTool.
@@ -18,15 +90,75 @@ class Tool(BaseTool):
 
     include_in_scorer_check: bool
 
-    def _run(self, *args, **kwargs) -> Any:
+    # Tools that change the account are held while their node runs speculatively
+    has_side_effects: ClassVar[bool] = False
+
+    # Concrete tool name -> class, populated as subclasses are defined
+    registered_tools: ClassVar[dict[str, type["Tool"]]] = {}
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:
+        super().__pydantic_init_subclass__(**kwargs)
+        name = cls.model_fields["name"].default if "name" in cls.model_fields else None
+        if isinstance(name, str) and name:
+            Tool.registered_tools[name] = cls
+
+    def _run(self, *args, runtime: ToolRuntime | None = None, **kwargs) -> Any:
         """
-        Sets span attribute for include_in_scorer_check and delegates to _execute.
+        Sets span attribute for include_in_scorer_check, records tool metrics and
+        delegates to _execute. Side-effecting tools first wait for any speculation
+        they run under to be confirmed. The result is compacted for the calling
+        node when an output encoding is configured for it.
         Do not override this method - override _execute instead.
         """
-        span = mlflow.get_current_active_span()
-        if span:
-            span.set_attribute("include_in_scorer_check", self.include_in_scorer_check)
-        return self._execute(*args, **kwargs)
+        if self.has_side_effects:
+            hold_side_effects(self.name)
+        self._set_span_attributes()
+        with track(TOOL_DURATION, TOOLS_IN_FLIGHT, TOOL_FAILURES, self.name):
+            return self._encode_output(self._bind_context(runtime)._execute(*args, **kwargs))
+
+    async def _arun(self, *args, runtime: ToolRuntime | None = None, **kwargs) -> Any:
+        """
+        Async twin of _run, used when the agent is invoked via ainvoke.
+        Do not override this method - override _aexecute instead.
+        """
+        if self.has_side_effects:
+            await ahold_side_effects(self.name)
+        self._set_span_attributes()
+        with track(TOOL_DURATION, TOOLS_IN_FLIGHT, TOOL_FAILURES, self.name):
+            return self._encode_output(await self._bind_context(runtime)._aexecute(*args, **kwargs))
+
+    def _encode_output(self, output: Any) -> Any:
+        """
+        The output as the calling node's encoding for this tool renders it, with
+        the estimated tokens saved recorded on the node. Unchanged without one.
+        """
+        usage = current_usage()
+        encoding = get_output_encoding(usage.node_id if usage else None, self.name)
+        if encoding is None:
+            return output
+        encoded = encode_tool_output(output, encoding)
+        raw_tokens, sent_tokens = estimate_tokens(default_tool_output(output)), estimate_tokens(encoded)
+        usage.record_tool_output(raw_tokens, sent_tokens)
+        TOOL_OUTPUT_TOKENS_SAVED.labels(self.name).inc(max(raw_tokens - sent_tokens, 0))
+        return encoded
+
+    def _bind_context(self, runtime: ToolRuntime | None) -> "Tool":
+        """
+        Return a copy of this tool with the account values from the runtime context.
+        The shared instance is left untouched, so one tool can serve many accounts
+        concurrently. Without a runtime context the instance's own values are used.
+        """
+        context = runtime.context if runtime is not None else None
+        if not context:
+            return self
+        return self.model_copy(
+            update={
+                field: context[field]
+                for field in AccountContext.__annotations__
+                if field in type(self).model_fields and field in context
+            }
+        )
 
     @abstractmethod
     def _execute(self, *args, **kwargs) -> Any:
@@ -35,6 +167,19 @@ class Tool(BaseTool):
         """
         raise NotImplementedError("Subclasses must implement _execute")
 
+    async def _aexecute(self, *args, **kwargs) -> Any:
+        """
+        Async tool logic. Defaults to calling _execute inline, which is fine for
+        non-blocking tools. Override for tools that do real I/O.
+        """
+        return self._execute(*args, **kwargs)
+
+    def _set_span_attributes(self) -> None:
+        """Tag the active tool span so scorers can filter on include_in_scorer_check"""
+        span = mlflow.get_current_active_span()
+        if span:
+            span.set_attribute("include_in_scorer_check", self.include_in_scorer_check)
+
     @property
     def logger(self) -> Logger:
         """Logger instance for this tool, named after the concrete class."""
@@ -45,12 +190,13 @@ class Tool(BaseTool):
         return self._logger
 
     @classmethod
-    def get_tool_description(cls, name: str) -> str:
-        """Render tool descriptions"""
-        with open(FILE_PATH, "r") as file:
-            descriptions = yaml.safe_load(file)
+    def get_tool_description(cls, name: str, path: str | Path = FILE_PATH) -> str:
+        """Render tool descriptions from the cached registry for `path`"""
+        description = load_tool_descriptions(path).get(name)
 
-        if descriptions.get(name, None) is None:
-            raise ValueError(f"Prompt '{name}' not found, please include the tool description in descriptions.yaml")
+        if description is None:
+            raise ValueError(
+                f"Prompt '{name}' not found, please include the tool description in {Path(path).name}"
+            )
 
-        return descriptions.get(name)
+        return description
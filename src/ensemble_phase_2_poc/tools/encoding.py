@@ -0,0 +1,261 @@
+# Compact, token-budgeted encoding of tool outputs for the LLM.
+#
+# By default a tool's return value reaches the model as json.dumps() of the
+# whole structure, and stays in the conversation for every later turn. With
+# ENSEMBLE_TOOL_OUTPUT_ENCODING set (or --compact-tool-outputs), Tool._run
+# looks up an OutputEncoding for the (consuming node, tool) pair and sends:
+#   - only the fields that node needs (`fields`, dotted paths; a path through
+#     a list applies to every element)
+#   - without null/empty values, as minified JSON
+#   - with lists of records as a table, {"columns": [...], "rows": [[...]]},
+#     so keys aren't repeated per claim or procedure code
+#   - cut to `max_tokens`, best effort: trailing items of the largest lists
+#     first, then the longest strings, with a trailer saying what was left out
+# The tokens sent and saved are added to the node's metadata.
+
+import json
+import math
+from dataclasses import dataclass
+from typing import Any, Iterator, Mapping
+
+from ensemble_phase_2_poc.config import build_config, env_setting, load_json_config
+from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.metrics import REGISTRY
+
+
+logger = get_logger(__name__)
+
+TOOL_OUTPUT_ENCODING_ENV_VAR = "ENSEMBLE_TOOL_OUTPUT_ENCODING"
+
+# Same heuristic as the rate limiter's token estimate
+CHARS_PER_TOKEN = 4
+# Strings are never cut shorter than this while fitting a budget
+MIN_STRING_CHARS = 40
+
+TOOL_OUTPUT_TOKENS_SAVED = REGISTRY.counter(
+    "ensemble_tool_output_tokens_saved", "Estimated tokens removed from tool outputs by compact encoding", ("tool",)
+)
+
+
+@dataclass(frozen=True)
+class OutputEncoding:
+    """How one node receives one tool's output"""
+
+    # Dotted paths to keep, e.g. "claims.procedure_codes.cpt". None keeps everything.
+    fields: tuple[str, ...] | None = None
+    # Lists of two or more records as columns + rows
+    tabular: bool = True
+    # Estimated tokens the encoded output may use
+    max_tokens: int | None = None
+
+    def __post_init__(self) -> None:
+        if self.max_tokens is not None and self.max_tokens < 1:
+            raise ValueError(f"max_tokens must be >= 1, got {self.max_tokens}")
+
+
+# What the research agent needs from get_account_data to summarize issues and
+# next actions: amounts, statuses, codes and notes, but no contact details
+ACCOUNT_RESEARCH_FIELDS = (
+    "account_number",
+    "client_name",
+    "facility_prefix",
+    "lob",
+    "patient.patient_id",
+    "insurance.primary.payer_name",
+    "insurance.primary.plan_type",
+    "insurance.primary.copay",
+    "insurance.primary.deductible",
+    "insurance.primary.deductible_met",
+    "insurance.secondary.payer_name",
+    "insurance.secondary.plan_type",
+    "claims.claim_id",
+    "claims.date_of_service",
+    "claims.provider.name",
+    "claims.diagnosis_codes",
+    "claims.procedure_codes",
+    "claims.total_charges",
+    "claims.insurance_paid",
+    "claims.patient_responsibility",
+    "claims.adjustments",
+    "claims.status",
+    "claims.remittance_date",
+    "balance",
+    "notes.date",
+    "notes.text",
+)
+
+DEFAULT_OUTPUT_ENCODINGS: Mapping[tuple[str, str], OutputEncoding] = {
+    ("account_research_agent", "get_account_data"): OutputEncoding(fields=ACCOUNT_RESEARCH_FIELDS, max_tokens=1500),
+}
+
+
+def parse_output_encodings(value: str) -> dict[tuple[str, str], OutputEncoding]:
+    """
+    Encodings from "1" (the defaults), a JSON object or a path to a JSON file of
+    {node_id: {tool_name: {"fields": [...], "tabular": bool, "max_tokens": int}}}.
+    Entries replace the default for the same node and tool.
+    """
+    encodings = dict(DEFAULT_OUTPUT_ENCODINGS)
+    for node_id, tools in load_json_config(value, "Tool output encodings").items():
+        if not isinstance(tools, dict):
+            raise ValueError(f"Tool output encodings for {node_id} must be a JSON object of {{tool_name: encoding}}")
+        for tool_name, fields in tools.items():
+            encodings[(node_id, tool_name)] = build_config(
+                fields, OutputEncoding, f"Output encoding for {node_id}/{tool_name}", fields=_paths
+            )
+    return encodings
+
+
+def _paths(value: list[str] | None) -> tuple[str, ...] | None:
+    return None if value is None else tuple(value)
+
+
+_get_encodings = env_setting(TOOL_OUTPUT_ENCODING_ENV_VAR, parse_output_encodings, default={})
+
+
+def get_output_encoding(node_id: str | None, tool_name: str) -> OutputEncoding | None:
+    """Encoding for `tool_name` called from `node_id`, or None to send the output as is"""
+    if node_id is None:
+        return None
+    return _get_encodings().get((node_id, tool_name))
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _field_tree(fields: tuple[str, ...]) -> dict[str, Any]:
+    """{"claims": {"claim_id": {}}} from ("claims.claim_id",); an empty dict keeps the whole subtree"""
+    tree: dict[str, Any] = {}
+    for path in fields:
+        node = tree
+        parts = path.split(".")
+        for index, part in enumerate(parts):
+            if part in node and not node[part]:
+                # An ancestor path already keeps everything below it
+                break
+            node = node.setdefault(part, {})
+            if index == len(parts) - 1:
+                node.clear()
+    return tree
+
+
+def _project(value: Any, tree: Mapping[str, Any]) -> Any:
+    """Keep the fields in `tree`, applying it to each element of lists"""
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+def _prune(value: Any) -> Any:
+    """Drop null and empty values, which only cost tokens"""
+    if isinstance(value, dict):
+        pruned = {key: _prune(item) for key, item in value.items()}
+        return {key: item for key, item in pruned.items() if item not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [item for item in (_prune(item) for item in value) if item not in (None, "", [], {})]
+    return value
+
+
+def _flatten(record: Mapping[str, Any], prefix: str = "") -> dict[str, Any]:
+    """Nested dicts as dotted columns: {"provider": {"name": x}} -> {"provider.name": x}"""
+    flat: dict[str, Any] = {}
+    for key, value in record.items():
+        if isinstance(value, dict) and value:
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def _tabulate(value: Any) -> Any:
+    """Lists of two or more records as {"columns", "rows"}, recursively"""
+    if isinstance(value, dict):
+        return {key: _tabulate(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if len(value) >= 2 and all(isinstance(item, dict) for item in value):
+            records = [_flatten(item) for item in value]
+            columns = list(dict.fromkeys(column for record in records for column in record))
+            return {
+                "columns": columns,
+                "rows": [[_tabulate(record.get(column)) for column in columns] for record in records],
+            }
+        return [_tabulate(item) for item in value]
+    return value
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _render(value: Any, encoding: OutputEncoding, omitted: Mapping[str, int]) -> str:
+    text = _dumps(_tabulate(value) if encoding.tabular else value)
+    if omitted:
+        text += "\n(left out to fit the token budget: " + ", ".join(
+            f"{path}: {count}" for path, count in omitted.items()
+        ) + ")"
+    return text
+
+
+def _lists(value: Any, path: str = "") -> Iterator[tuple[str, list]]:
+    """(dotted path, list) for every list in value, nested ones included"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _lists(item, f"{path}.{key}" if path else key)
+    elif isinstance(value, list):
+        if path:
+            yield path, value
+        for item in value:
+            yield from _lists(item, path)
+
+
+def _strings(value: Any) -> Iterator[tuple[Any, Any, str]]:
+    """(container, key, string) for every string value in value"""
+    items = value.items() if isinstance(value, dict) else enumerate(value) if isinstance(value, list) else ()
+    for key, item in items:
+        if isinstance(item, str):
+            yield value, key, item
+        else:
+            yield from _strings(item)
+
+
+def _shrink(value: Any, omitted: dict[str, int]) -> bool:
+    """Remove the cheapest-to-lose content from value in place. False when nothing is left to cut."""
+    lists = [(path, items) for path, items in _lists(value) if len(items) > 1]
+    if lists:
+        path, items = max(lists, key=lambda entry: len(_dumps(entry[1])))
+        items.pop()
+        omitted[f"{path} items"] = omitted.get(f"{path} items", 0) + 1
+        return True
+    # A cut string is MIN_STRING_CHARS plus the ellipsis, so it is never cut again
+    strings = [entry for entry in _strings(value) if len(entry[2]) > MIN_STRING_CHARS + 1]
+    if strings:
+        container, key, text = max(strings, key=lambda entry: len(entry[2]))
+        container[key] = text[:max(MIN_STRING_CHARS, len(text) // 2)] + "…"
+        omitted["truncated strings"] = omitted.get("truncated strings", 0) + 1
+        return True
+    return False
+
+
+def encode_tool_output(output: Any, encoding: OutputEncoding) -> str:
+    """The text sent to the model for `output` under `encoding`"""
+    value = _prune(_project(output, _field_tree(encoding.fields)) if encoding.fields else output)
+    omitted: dict[str, int] = {}
+    text = _render(value, encoding, omitted)
+    if encoding.max_tokens is None:
+        return text
+    while estimate_tokens(text) > encoding.max_tokens:
+        if not _shrink(value, omitted):
+            logger.warning(f"Tool output still uses ~{estimate_tokens(text)} tokens, over its budget of {encoding.max_tokens}")
+            break
+        text = _render(value, encoding, omitted)
+    return text
+
+
+def default_tool_output(output: Any) -> str:
+    """What LangChain sends for an unencoded tool output"""
+    return output if isinstance(output, str) else json.dumps(output, ensure_ascii=False, default=str)
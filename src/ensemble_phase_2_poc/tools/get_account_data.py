@@ -1,21 +1,20 @@
 from typing import List, Dict, Any
-from pydantic import BaseModel
-from ensemble_phase_2_poc.tools.base_tool import Tool
+from ensemble_phase_2_poc.tools.base_tool import Tool, ToolInput
 
 
-class GetAccountDataInput(BaseModel):
+class GetAccountDataInput(ToolInput):
     """Input schema for GetAccountData - no args from LLM, uses bound values"""
 
 
 class GetAccountData(Tool):
-    """Get account data - injected args are stored as instance attributes"""
+    """Get account data - injected args come from the runtime context"""
 
     name: str = "get_account_data"
     description: str = Tool.get_tool_description(name)
     args_schema: type = GetAccountDataInput
     include_in_scorer_check: bool = False
 
-    # Injected values (set at instantiation)
+    # Injected values (bound per call from the runtime AccountContext, or set at instantiation)
     account_number: str = ""
     client_name: str = ""
     facility_prefix: str = ""
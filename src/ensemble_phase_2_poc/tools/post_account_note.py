@@ -1,9 +1,9 @@
-from typing import List, Dict, Any
-from pydantic import BaseModel, Field
-from ensemble_phase_2_poc.tools.base_tool import Tool
+from typing import Any, ClassVar, Dict, List
+from pydantic import Field
+from ensemble_phase_2_poc.tools.base_tool import Tool, ToolInput
 
 
-class PostAccountNoteInput(BaseModel):
+class PostAccountNoteInput(ToolInput):
     """Input schema for PostAccountNote - description from LLM"""
 
     description: str = Field(
@@ -12,14 +12,15 @@ class PostAccountNoteInput(BaseModel):
 
 
 class PostAccountNote(Tool):
-    """Post a note on the account - injected args are stored as instance attributes"""
+    """Post a note on the account - injected args come from the runtime context"""
 
     name: str = "post_account_note"
     description: str = Tool.get_tool_description(name)
     args_schema: type = PostAccountNoteInput
+    has_side_effects: ClassVar[bool] = True
     include_in_scorer_check: bool = False
 
-    # Injected values (set at instantiation)
+    # Injected values (bound per call from the runtime AccountContext, or set at instantiation)
     account_number: str = ""
     client_name: str = ""
     facility_prefix: str = ""
@@ -1,9 +1,9 @@
-from typing import List, Dict, Any
-from pydantic import BaseModel, Field
-from ensemble_phase_2_poc.tools.base_tool import Tool
+from typing import Any, ClassVar, Dict, List
+from pydantic import Field
+from ensemble_phase_2_poc.tools.base_tool import Tool, ToolInput
 
 
-class PostContractualAdjustmentInput(BaseModel):
+class PostContractualAdjustmentInput(ToolInput):
     """Input schema for PostContractualAdjustment - only transaction_id from LLM"""
 
     transaction_id: str = Field(
@@ -12,14 +12,15 @@ class PostContractualAdjustmentInput(BaseModel):
 
 
 class PostContractualAdjustment(Tool):
-    """Post a contractual adjustment - injected args are stored as instance attributes"""
+    """Post a contractual adjustment - injected args come from the runtime context"""
 
     name: str = "post_contractual_adjustment"
     description: str = Tool.get_tool_description(name)
     args_schema: type = PostContractualAdjustmentInput
+    has_side_effects: ClassVar[bool] = True
     include_in_scorer_check: bool = True
 
-    # Injected values (set at instantiation)
+    # Injected values (bound per call from the runtime AccountContext, or set at instantiation)
     account_number: str = ""
     client_name: str = ""
     facility_prefix: str = ""
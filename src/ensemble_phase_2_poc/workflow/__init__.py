@@ -1,9 +1,14 @@
-from ensemble_phase_2_poc.workflow.base_workflow import LangGraphResponsesAgent
+from ensemble_phase_2_poc.workflow.base_workflow import LangGraphResponsesAgent, BatchResult
+from ensemble_phase_2_poc.workflow.dag import DAGWorkflow, Route, build_dag
 from ensemble_phase_2_poc.workflow.sequential_workflow import SequentialAccountResolutionWorkflow
 from ensemble_phase_2_poc.workflow.branching_workflow import BranchingAccountResolutionWorkflow
 
 __all__ = [
     "LangGraphResponsesAgent",
+    "BatchResult",
+    "DAGWorkflow",
+    "Route",
+    "build_dag",
     "SequentialAccountResolutionWorkflow",
     "BranchingAccountResolutionWorkflow",
 ]
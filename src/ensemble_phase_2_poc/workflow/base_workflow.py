@@ -5,16 +5,68 @@
 #
 # Generated by Claude Opus 4.5
 
+import asyncio
+import threading
+import time
 from abc import ABC, abstractmethod
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Generator, Hashable, Sequence
 
 from logging import Logger
 from langgraph.graph import StateGraph
 from langgraph.graph.state import CompiledStateGraph
 from mlflow.pyfunc import ResponsesAgent
-from mlflow.types.responses import ResponsesAgentRequest, ResponsesAgentResponse
+from mlflow.types.responses import (
+    ResponsesAgentRequest,
+    ResponsesAgentResponse,
+    ResponsesAgentStreamEvent,
+)
 
-from ensemble_phase_2_poc.state import WorkflowState, get_node_output
+from ensemble_phase_2_poc.concurrency import AIMDController, AIMDPolicy
+from ensemble_phase_2_poc.state import WorkflowState, NodeExecution, get_node_output
 from ensemble_phase_2_poc.logger import get_logger
+from ensemble_phase_2_poc.metrics import WORKFLOW_DURATION, WORKFLOW_FAILURES, WORKFLOWS_IN_FLIGHT, track
+from ensemble_phase_2_poc.prescreen import AccountColumns, PrescreenReport, PrescreenRules, evaluate, screened_state
+from ensemble_phase_2_poc.telemetry import summarize_usage
+
+
+# Process-wide cache of compiled graphs keyed by (workflow class, graph_cache_key()).
+# Building the graph instantiates every agent and compile() validates the graph,
+# so this is paid once per process instead of once per workflow instance.
+_COMPILED_GRAPHS: dict[tuple[type, Hashable], CompiledStateGraph] = {}
+_COMPILED_GRAPHS_LOCK = threading.Lock()
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a predict_batch() call.
+
+    `responses` is aligned with the input requests. A request that raised is
+    represented by a response whose `error` field is set, so one bad account
+    never aborts the rest of the batch.
+    """
+
+    responses: list[ResponsesAgentResponse] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+    # Accounts routed to human by the pre-screen and LLM calls saved, when enabled
+    prescreen: dict[str, Any] | None = None
+
+    @property
+    def num_failed(self) -> int:
+        return sum(1 for response in self.responses if response.error is not None)
+
+    @property
+    def num_succeeded(self) -> int:
+        return len(self.responses) - self.num_failed
+
+    @property
+    def throughput(self) -> float:
+        """Requests completed per second of wall time"""
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return len(self.responses) / self.elapsed_seconds
 
 
 class LangGraphResponsesAgent(ResponsesAgent, ABC):
@@ -27,8 +79,10 @@ class LangGraphResponsesAgent(ResponsesAgent, ABC):
     The base class handles:
     - Compiling the workflow
     - Serializing ResponsesAgentRequest -> WorkflowState
-    - Invoking the agent
+    - Invoking the agent (sync via predict(), async via apredict())
+    - Streaming one event per completed node (predict_stream())
     - Serializing final state -> ResponsesAgentResponse
+    - Fanning a batch of requests out over a worker pool (predict_batch)
 
     Example:
     ```
@@ -45,11 +99,41 @@ class LangGraphResponsesAgent(ResponsesAgent, ABC):
 
     @property
     def agent(self) -> CompiledStateGraph:
-        """Lazily compile the workflow on first access."""
+        """Lazily fetch the compiled workflow on first access.
+
+        Compiled graphs are shared by every instance with the same class and
+        graph_cache_key(). Compilation happens exactly once per key, even when
+        many threads race on first access.
+        """
         if self._compiled_agent is None:
-            self._compiled_agent = self.build_workflow().compile()
+            key = (type(self), self.graph_cache_key())
+            compiled = _COMPILED_GRAPHS.get(key)
+            if compiled is None:
+                with _COMPILED_GRAPHS_LOCK:
+                    compiled = _COMPILED_GRAPHS.get(key)
+                    if compiled is None:
+                        self.logger.info(f"Compiling workflow graph for {key[0].__name__}")
+                        compiled = self.build_workflow().compile()
+                        _COMPILED_GRAPHS[key] = compiled
+            self._compiled_agent = compiled
         return self._compiled_agent
 
+    def graph_cache_key(self) -> Hashable:
+        """Configuration that changes the graph built by build_workflow().
+
+        Override when build_workflow() depends on constructor arguments, so that
+        differently configured instances don't share a compiled graph.
+        """
+        return ()
+
+    @classmethod
+    def clear_graph_cache(cls) -> None:
+        """Drop cached compiled graphs for this class (all classes when called on the base)"""
+        with _COMPILED_GRAPHS_LOCK:
+            for key in list(_COMPILED_GRAPHS):
+                if issubclass(key[0], cls):
+                    del _COMPILED_GRAPHS[key]
+
     @property
     def logger(self) -> Logger:
         """Logger instance for this agent, named after the concrete class."""
@@ -70,11 +154,248 @@ class LangGraphResponsesAgent(ResponsesAgent, ABC):
         initial_state = self._request_to_state(request)
 
         # Run the workflow
-        final_state = self.agent.invoke(initial_state)
+        with track(WORKFLOW_DURATION, WORKFLOWS_IN_FLIGHT, WORKFLOW_FAILURES, type(self).__name__):
+            final_state = self.agent.invoke(initial_state)
 
         # Convert final state to response
         return self._state_to_response(final_state)
 
+    def predict_stream(
+        self, request: ResponsesAgentRequest
+    ) -> Generator[ResponsesAgentStreamEvent, None, None]:
+        """Streaming entry point for Databricks/mlflow integration.
+
+        Emits a `response.output_item.done` event as each node finishes, then a
+        final `response.completed` event carrying the same payload as predict().
+        Closing the generator early stops the graph before the remaining nodes run.
+        """
+        initial_state = self._request_to_state(request)
+        final_state = initial_state
+        execution_path: list[str] = []
+
+        # "updates" yields each node's state delta as soon as it completes,
+        # "values" yields the full state after each step
+        with track(WORKFLOW_DURATION, WORKFLOWS_IN_FLIGHT, WORKFLOW_FAILURES, type(self).__name__), \
+             closing(self.agent.stream(initial_state, stream_mode=["updates", "values"])) as stream:
+            try:
+                for mode, chunk in stream:
+                    if mode == "values":
+                        final_state = chunk
+                        continue
+
+                    # A graph node may record several nodes' executions (e.g. a speculative
+                    # triage node that also ran resolution), one event each
+                    for update in chunk.values():
+                        for node_id in (update or {}).get("execution_path", ()):
+                            node_execution = update.get("node_outputs", {}).get(node_id)
+                            if node_execution is None:
+                                continue
+                            execution_path.append(node_id)
+                            self.logger.debug(f"Streaming output of node: {node_id}")
+
+                            yield ResponsesAgentStreamEvent(
+                                type="response.output_item.done",
+                                output_index=len(execution_path) - 1,
+                                item=self.create_text_output_item(text=node_execution["output"], id=node_id),
+                                custom_outputs={
+                                    "execution_path": list(execution_path),
+                                    **self._node_event_outputs(node_id, node_execution),
+                                },
+                            )
+            except GeneratorExit:
+                # The caller stopped reading; closing the stream stops the graph,
+                # which is not a workflow failure
+                return
+
+        response = self._state_to_response(final_state)
+        yield ResponsesAgentStreamEvent(
+            type="response.completed",
+            response=response.model_dump(exclude_none=True),
+            custom_outputs=response.custom_outputs,
+        )
+
+    def _node_event_outputs(self, node_id: str, node_execution: NodeExecution) -> dict[str, Any]:
+        """custom_outputs attached to a node's stream event. Override to surface
+        node-specific fields such as routing decisions.
+        """
+        return {"node_id": node_id}
+
+    async def apredict(self, request: ResponsesAgentRequest) -> ResponsesAgentResponse:
+        """Async entry point. Runs the graph via ainvoke so nodes use their async path."""
+        initial_state = self._request_to_state(request)
+        with track(WORKFLOW_DURATION, WORKFLOWS_IN_FLIGHT, WORKFLOW_FAILURES, type(self).__name__):
+            final_state = await self.agent.ainvoke(initial_state)
+        return self._state_to_response(final_state)
+
+    def predict_batch(
+        self,
+        requests: Sequence[ResponsesAgentRequest],
+        max_concurrency: int = 8,
+        prescreen: PrescreenRules | None = None,
+        adaptive: AIMDPolicy | None = None,
+    ) -> BatchResult:
+        """Run many requests through the workflow on a bounded thread pool.
+
+        Results keep the order of `requests`. Failures are captured per request
+        as error responses instead of aborting the batch. With `prescreen`,
+        accounts its rules match (on fields in their custom_inputs) are routed
+        to human without running the workflow. With `adaptive`, an AIMD limit
+        of at most `max_concurrency` sets how many requests run at once.
+        """
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be >= 1, got {max_concurrency}")
+
+        # Resolve the compiled graph once up front rather than in every worker thread
+        _ = self.agent
+        controller = AIMDController(adaptive.capped(max_concurrency), name="predict_batch") if adaptive else None
+
+        def _run_one(request: ResponsesAgentRequest) -> ResponsesAgentResponse:
+            if controller is None:
+                return self._predict_or_error(request)
+            with controller.slot():
+                return self._predict_or_error(request)
+
+        self.logger.info(
+            f"Starting batch of {len(requests)} requests with max_concurrency={max_concurrency}"
+        )
+        start = time.perf_counter()
+        rules, report = self._prescreen(requests, prescreen)
+        with ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="predict-batch"
+        ) as executor:
+            llm_responses = list(executor.map(
+                _run_one, [request for request, rule in zip(requests, rules) if not rule]
+            ))
+        result = BatchResult(
+            responses=self._merge_screened(requests, rules, llm_responses, report),
+            elapsed_seconds=time.perf_counter() - start,
+            prescreen=report.as_dict() if report is not None else None,
+        )
+
+        self.logger.info(
+            f"Batch complete: {result.num_succeeded} succeeded, {result.num_failed} failed "
+            f"in {result.elapsed_seconds:.2f}s ({result.throughput:.2f} requests/s)"
+        )
+        return result
+
+    async def apredict_batch(
+        self,
+        requests: Sequence[ResponsesAgentRequest],
+        max_concurrency: int = 64,
+        prescreen: PrescreenRules | None = None,
+        adaptive: AIMDPolicy | None = None,
+    ) -> BatchResult:
+        """Async twin of predict_batch(): keeps up to max_concurrency requests in
+        flight on the running event loop instead of one thread per request.
+        """
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be >= 1, got {max_concurrency}")
+
+        _ = self.agent
+        semaphore = asyncio.Semaphore(max_concurrency)
+        controller = AIMDController(adaptive.capped(max_concurrency), name="apredict_batch") if adaptive else None
+
+        async def _predict_or_error(request: ResponsesAgentRequest) -> ResponsesAgentResponse:
+            try:
+                return await self.apredict(request)
+            except Exception as e:
+                return self._error_response(request, e)
+
+        async def _run_one(request: ResponsesAgentRequest) -> ResponsesAgentResponse:
+            async with semaphore:
+                if controller is None:
+                    return await _predict_or_error(request)
+                async with controller.aslot():
+                    return await _predict_or_error(request)
+
+        self.logger.info(
+            f"Starting async batch of {len(requests)} requests with max_concurrency={max_concurrency}"
+        )
+        start = time.perf_counter()
+        rules, report = self._prescreen(requests, prescreen)
+        llm_responses = await asyncio.gather(
+            *(_run_one(request) for request, rule in zip(requests, rules) if not rule)
+        )
+        result = BatchResult(
+            responses=self._merge_screened(requests, rules, list(llm_responses), report),
+            elapsed_seconds=time.perf_counter() - start,
+            prescreen=report.as_dict() if report is not None else None,
+        )
+
+        self.logger.info(
+            f"Async batch complete: {result.num_succeeded} succeeded, {result.num_failed} failed "
+            f"in {result.elapsed_seconds:.2f}s ({result.throughput:.2f} requests/s)"
+        )
+        return result
+
+    def _prescreen(
+        self,
+        requests: Sequence[ResponsesAgentRequest],
+        prescreen: PrescreenRules | None,
+    ) -> tuple[Sequence[str], PrescreenReport | None]:
+        """The pre-screen rule matching each request ("" for none), evaluated over the whole batch"""
+        if prescreen is None:
+            return [""] * len(requests), None
+        rules = evaluate(AccountColumns.from_records([request.custom_inputs or {} for request in requests]), prescreen)
+        report = PrescreenReport()
+        report.record_screened(rules)
+        return rules, report
+
+    def _merge_screened(
+        self,
+        requests: Sequence[ResponsesAgentRequest],
+        rules: Sequence[str],
+        llm_responses: list[ResponsesAgentResponse],
+        report: PrescreenReport | None,
+    ) -> list[ResponsesAgentResponse]:
+        """Interleave screened responses with the workflow's, in request order"""
+        if report is None:
+            return llm_responses
+        for response in llm_responses:
+            report.observe(response.custom_outputs)
+        report.finish()
+
+        remaining = iter(llm_responses)
+        return [
+            self.screened_response(request, str(rule)) if rule else next(remaining)
+            for request, rule in zip(requests, rules)
+        ]
+
+    def screened_response(self, request: ResponsesAgentRequest, rule: str) -> ResponsesAgentResponse:
+        """Response for an account the pre-screen routed to human, shaped like a workflow run"""
+        return self._state_to_response(screened_state(self._request_to_state(request), rule))
+
+    def _predict_or_error(self, request: ResponsesAgentRequest) -> ResponsesAgentResponse:
+        """predict() that converts an exception into an error response"""
+        try:
+            return self.predict(request)
+        except Exception as e:
+            return self._error_response(request, e)
+
+    def _error_response(
+        self,
+        request: ResponsesAgentRequest,
+        error: Exception,
+    ) -> ResponsesAgentResponse:
+        """Build the per-item error record returned by the batch methods"""
+        custom_inputs = request.custom_inputs or {}
+        self.logger.error(
+            f"Request for account {custom_inputs.get('account_number', '')} failed: {error!r}"
+        )
+
+        return ResponsesAgentResponse(
+            output=[],
+            error={"code": type(error).__name__, "message": str(error)},
+            custom_outputs={
+                "account_number": custom_inputs.get("account_number", ""),
+                "client_name": custom_inputs.get("client_name", ""),
+                "facility_prefix": custom_inputs.get("facility_prefix", ""),
+                "lob": custom_inputs.get("lob", ""),
+                "execution_path": [],
+                "node_outputs": {},
+            },
+        )
+
     def _request_to_state(self, request: ResponsesAgentRequest) -> WorkflowState:
         """Convert ResponsesAgentRequest to WorkflowState"""
         custom_inputs = request.custom_inputs or {}
@@ -110,5 +431,11 @@ class LangGraphResponsesAgent(ResponsesAgent, ABC):
                     node_id: get_node_output(final_state, node_id)
                     for node_id in execution_path
                 },
+                # Latency and token breakdown, totals plus one entry per node
+                "usage": summarize_usage({
+                    node_id: final_state["node_outputs"][node_id]["metadata"]
+                    for node_id in execution_path
+                    if node_id in final_state.get("node_outputs", {})
+                }),
             },
         )
@@ -1,7 +1,12 @@
-from langgraph.graph import StateGraph, START, END
+import os
+from typing import Any, Hashable, Sequence
 
-from ensemble_phase_2_poc.state import WorkflowState, get_node_output
-from ensemble_phase_2_poc.workflow.base_workflow import LangGraphResponsesAgent
+from langchain_core.runnables import Runnable, RunnableLambda
+from mlflow.types.responses import ResponsesAgentResponse
+
+from ensemble_phase_2_poc.speculation import Speculation
+from ensemble_phase_2_poc.state import WorkflowState, NodeExecution, get_node_output
+from ensemble_phase_2_poc.workflow.dag import DAGWorkflow, Route, WorkflowNode
 from ensemble_phase_2_poc.agents import (
     AccountResearchAgent,
     ResolutionAgent,
@@ -9,7 +14,85 @@ from ensemble_phase_2_poc.agents import (
     TriageAgent
 )
 
-class BranchingAccountResolutionWorkflow(LangGraphResponsesAgent):
+
+# Set to "1" to run resolution speculatively alongside triage by default
+SPECULATIVE_ENV_VAR = "ENSEMBLE_SPECULATIVE_RESOLUTION"
+
+
+class SpeculativeTriageNode:
+    """
+    Triage with resolution started beside it on a Speculation.
+
+    Resolution's side-effecting tools are held until triage decides. On "agent"
+    they are released and the node returns both triage and resolution outputs;
+    otherwise the resolution run is discarded, as an "error" if triage raised.
+    On a miss the node waits for the discarded run to stop, at most the rest of
+    its current LLM call, so triage's metadata records all the wasted work
+    under `speculation`.
+    """
+
+    def __init__(self, triage: TriageAgent, resolution: ResolutionAgent):
+        self.triage = triage
+        self.resolution = resolution
+        self.node_id = triage.node_id
+        # For build_dag(): this node records both outputs and needs both agents' inputs
+        self.provides = (triage.node_id, resolution.node_id)
+        self.depends_on = sorted(set(triage.depends_on) | set(resolution.depends_on))
+
+    def __call__(self, state: WorkflowState) -> dict:
+        speculation = Speculation(self.resolution.node_id).start(self.resolution, state)
+        try:
+            update = self.triage(state)
+        except BaseException:
+            speculation.discard("error")
+            raise
+        if not self._needs_resolution(update):
+            speculation.discard()
+            # A call in flight at the decision still counts towards the waste
+            speculation.settle()
+            return self._with_summary(update, speculation)
+        return self._merge(update, speculation.confirm(), speculation)
+
+    async def __acall__(self, state: WorkflowState) -> dict:
+        speculation = Speculation(self.resolution.node_id).astart(self.resolution.__acall__, state)
+        try:
+            update = await self.triage.__acall__(state)
+        except BaseException:
+            speculation.discard("error")
+            raise
+        if not self._needs_resolution(update):
+            speculation.discard()
+            await speculation.asettle()
+            return self._with_summary(update, speculation)
+        return self._merge(update, await speculation.aconfirm(), speculation)
+
+    def _needs_resolution(self, update: dict) -> bool:
+        # Anything but "agent" discards; the routing function rejects invalid outputs
+        return get_node_output(update, self.triage.node_id).strip().lower() == "agent"
+
+    def _with_summary(self, update: dict, speculation: Speculation) -> dict:
+        triage = update["node_outputs"][self.triage.node_id]
+        triage["metadata"]["speculation"] = speculation.summary()
+        return update
+
+    def _merge(self, update: dict, resolution_update: dict, speculation: Speculation) -> dict:
+        update = self._with_summary(update, speculation)
+        return {
+            "node_outputs": {
+                **update["node_outputs"],
+                self.resolution.node_id: resolution_update["node_outputs"][self.resolution.node_id],
+            },
+            "execution_path": [self.triage.node_id, self.resolution.node_id],
+        }
+
+    def as_node(self) -> tuple[str, Runnable]:
+        """(node_id, runnable) for graph.add_node(), like BaseAgent.as_node()"""
+        self.triage.validate_prompt()
+        self.resolution.validate_prompt()
+        return (self.node_id, RunnableLambda(self, afunc=self.__acall__, name=self.node_id))
+
+
+class BranchingAccountResolutionWorkflow(DAGWorkflow):
     """
     Branching workflow for account resolution.
 
@@ -17,56 +100,64 @@ class BranchingAccountResolutionWorkflow(LangGraphResponsesAgent):
         - (if "agent") -> ResolutionAgent -> AccountNoteAgent
         - (if "human") -> END
 
+    The edges follow from each agent's `depends_on` plus the triage Route (see dag.py).
+
     To deploy to Databricks, just instantiate this class - the base class
     handles all the mlflow/ResponsesAgent integration.
-    """
 
-    def build_workflow(self) -> StateGraph:
-        """Define the workflow graph"""
-        self.logger.info("Building branching account resolution workflow")
+    When streaming, the triage node's event carries `triage_decision` so callers
+    can stop consuming runs routed to "human".
 
-        # Instantiate nodes
-        research = AccountResearchAgent()
-        resolution = ResolutionAgent()
-        post_note = AccountNoteAgent()
-        triage = TriageAgent()
-
-        self.logger.debug(f"Nodes initialized: {research.node_id}, {triage.node_id}, {resolution.node_id}, {post_note.node_id}")
-
-        # Define routing functions
-        def _route_to_agent(state: WorkflowState) -> bool:
-            triage_output = get_node_output(state, triage.node_id).lower()
-
-            if triage_output not in ["agent", "human"]:
-                self.logger.error(f"Invalid triage output received: {triage_output}")
-                raise ValueError(f"Invalid triage agent output: {triage_output}")
-
-            route_target = "resolution_agent" if triage_output == "agent" else "END"
-            self.logger.info(f"Routing decision: {triage_output} -> {route_target}")
-            return True if triage_output == "agent" else False
-
-        # Create the graph
-        graph = StateGraph(WorkflowState)
+    With `speculative=True` (default: the ENSEMBLE_SPECULATIVE_RESOLUTION env
+    var), resolution starts alongside triage instead of after it, with its
+    side-effecting tools held until triage says "agent" (SpeculativeTriageNode).
+    `custom_outputs["speculation"]` then reports the outcome and wasted work.
+    """
 
-        # Add nodes
-        graph.add_node(*research.as_node())
-        graph.add_node(*resolution.as_node())
-        graph.add_node(*post_note.as_node())
-        graph.add_node(*triage.as_node())
+    def __init__(self, speculative: bool | None = None):
+        super().__init__()
+        if speculative is None:
+            speculative = os.environ.get(SPECULATIVE_ENV_VAR, "").strip().lower() in ("1", "true")
+        self.speculative = speculative
+
+    def graph_cache_key(self) -> Hashable:
+        return (self.speculative,)
+
+    def _node_event_outputs(self, node_id: str, node_execution: NodeExecution) -> dict[str, Any]:
+        """Surface the triage decision as soon as the triage node completes"""
+        outputs = super()._node_event_outputs(node_id, node_execution)
+        if node_id == TriageAgent.node_id:
+            outputs["triage_decision"] = node_execution["output"].strip().lower()
+        return outputs
+
+    def _state_to_response(self, final_state: WorkflowState) -> ResponsesAgentResponse:
+        """Surface the speculation summary recorded on the triage node, if any"""
+        response = super()._state_to_response(final_state)
+        triage = final_state.get("node_outputs", {}).get(TriageAgent.node_id)
+        if triage is not None and "speculation" in triage["metadata"]:
+            response.custom_outputs["speculation"] = triage["metadata"]["speculation"]
+        return response
+
+    def nodes(self) -> Sequence[WorkflowNode]:
+        research, triage, resolution, post_note = (
+            AccountResearchAgent(), TriageAgent(), ResolutionAgent(), AccountNoteAgent()
+        )
+        if self.speculative:
+            # Resolution runs inside the triage node; "agent" goes straight to the note
+            return [research, SpeculativeTriageNode(triage, resolution), post_note]
+        return [research, triage, resolution, post_note]
 
-        # Define the sequence
-        graph.add_edge(START, research.node_id)
-        graph.add_edge(research.node_id, triage.node_id)
+    def routes(self) -> Sequence[Route]:
+        # "agent" continues with the first node after triage, "human" ends the workflow
+        after_triage = AccountNoteAgent.node_id if self.speculative else ResolutionAgent.node_id
+        return [Route(TriageAgent.node_id, self._triage_decision, {"agent": (after_triage,), "human": ()})]
 
-        # Define conditional edge after triage agent
-        # if "agent", pass to resolution agent
-        # if "human", end workflow
-        graph.add_conditional_edges(
-            triage.node_id, _route_to_agent, {True: resolution.node_id, False: END}
-        )
+    def _triage_decision(self, state: WorkflowState) -> str:
+        triage_output = get_node_output(state, TriageAgent.node_id).strip().lower()
 
-        graph.add_edge(resolution.node_id, post_note.node_id)
-        graph.add_edge(post_note.node_id, END)
+        if triage_output not in ["agent", "human"]:
+            self.logger.error(f"Invalid triage output received: {triage_output}")
+            raise ValueError(f"Invalid triage agent output: {triage_output}")
 
-        self.logger.info("Branching workflow graph built successfully")
-        return graph
+        self.logger.info(f"Routing decision: {triage_output}")
+        return triage_output
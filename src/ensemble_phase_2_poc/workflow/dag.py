@@ -0,0 +1,187 @@
+# Workflow graphs derived from node dependencies.
+#
+# Every node declares the node_ids it reads in `depends_on`. build_dag()
+# turns those declarations, plus any conditional Routes, into a StateGraph:
+#   - a node with no dependencies starts from START
+#   - a node with one or more dependencies waits for all of them (a join)
+#   - a node that is a Route target only runs when its route picks it
+#   - a node nothing depends on ends at END
+# Nodes whose dependencies are met in the same step run concurrently, and the
+# node_outputs reducer in state.py merges their outputs.
+#
+# Unknown dependencies, duplicate node_ids, cycles and routes that can't be
+# satisfied raise ValueError when the graph is built, not mid-batch.
+
+from abc import abstractmethod
+from dataclasses import dataclass
+from graphlib import CycleError, TopologicalSorter
+from typing import Callable, Hashable, Mapping, Protocol, Sequence
+
+from langchain_core.runnables import Runnable
+from langgraph.graph import END, START, StateGraph
+
+from ensemble_phase_2_poc.state import WorkflowState
+from ensemble_phase_2_poc.workflow.base_workflow import LangGraphResponsesAgent
+
+
+class WorkflowNode(Protocol):
+    """What build_dag() needs from a node; BaseAgent provides all of it"""
+
+    @property
+    def node_id(self) -> str: ...
+
+    @property
+    def depends_on(self) -> list[str]: ...
+
+    def as_node(self) -> tuple[str, Runnable]: ...
+
+
+@dataclass(frozen=True)
+class Route:
+    """
+    Conditional continuation after `source`. `decide(state)` returns a key of
+    `targets`, naming the nodes to run next; an empty tuple ends the branch.
+    """
+
+    source: str
+    decide: Callable[[WorkflowState], Hashable]
+    targets: Mapping[Hashable, tuple[str, ...]]
+
+
+def _provides(node: WorkflowNode) -> tuple[str, ...]:
+    """node_ids a graph node records. Composite nodes list several in `provides`"""
+    return tuple(getattr(node, "provides", (node.node_id,)))
+
+
+def _ancestors(node_id: str, predecessors: Mapping[str, set[str]]) -> set[str]:
+    seen: set[str] = set()
+    stack = list(predecessors[node_id])
+    while stack:
+        current = stack.pop()
+        if current not in seen:
+            seen.add(current)
+            stack.extend(predecessors[current])
+    return seen
+
+
+def build_dag(nodes: Sequence[WorkflowNode], routes: Sequence[Route] = ()) -> StateGraph:
+    """StateGraph running `nodes` in dependency order, gated by `routes`"""
+    # node_id (including ones recorded by composite nodes) -> graph node
+    owner: dict[str, str] = {}
+    for node in nodes:
+        for node_id in _provides(node):
+            if node_id in owner:
+                raise ValueError(f"Duplicate node_id '{node_id}' in workflow")
+            owner[node_id] = node.node_id
+    by_name = {node.node_id: node for node in nodes}
+
+    # Dependency edges between graph nodes
+    depends_on: dict[str, set[str]] = {}
+    for node in nodes:
+        deps = set()
+        for dep in node.depends_on:
+            if dep not in owner:
+                raise ValueError(f"Node '{node.node_id}' depends on '{dep}', which is not in the workflow")
+            if owner[dep] != node.node_id:
+                deps.add(owner[dep])
+        depends_on[node.node_id] = deps
+
+    # Route targets run only when picked; each may be gated by one route
+    gated_by: dict[str, Route] = {}
+    for route in routes:
+        if route.source not in by_name:
+            raise ValueError(f"Route source '{route.source}' is not in the workflow")
+        for target in {target for targets in route.targets.values() for target in targets}:
+            if target not in by_name:
+                raise ValueError(f"Route from '{route.source}' targets '{target}', which is not in the workflow")
+            if target in gated_by:
+                raise ValueError(f"Node '{target}' is targeted by more than one route")
+            gated_by[target] = route
+
+    predecessors = {
+        name: deps | ({gated_by[name].source} if name in gated_by else set())
+        for name, deps in depends_on.items()
+    }
+    try:
+        order = list(TopologicalSorter(predecessors).static_order())
+    except CycleError as error:
+        raise ValueError(f"Workflow dependencies form a cycle: {' -> '.join(error.args[1])}") from None
+
+    # A routed node is triggered by its route alone, so everything else it
+    # needs must already have finished by the time the route's source has
+    for target, route in gated_by.items():
+        upstream = _ancestors(route.source, predecessors) | {route.source}
+        if missing := depends_on[target] - upstream:
+            raise ValueError(
+                f"Node '{target}' is routed from '{route.source}' but also depends on {sorted(missing)}, "
+                f"which may not have run by then"
+            )
+
+    graph = StateGraph(WorkflowState)
+    for name in order:
+        graph.add_node(*by_name[name].as_node())
+
+    for name in order:
+        if name in gated_by:
+            continue
+        deps = sorted(depends_on[name])
+        if not deps:
+            graph.add_edge(START, name)
+        elif len(deps) == 1:
+            graph.add_edge(deps[0], name)
+        else:
+            graph.add_edge(deps, name)
+
+    for route in routes:
+        graph.add_conditional_edges(
+            route.source,
+            _route_function(route),
+            sorted({target for targets in route.targets.values() for target in targets}) + [END],
+        )
+
+    has_successor = {dep for deps in depends_on.values() for dep in deps} | {route.source for route in routes}
+    for name in order:
+        if name not in has_successor:
+            graph.add_edge(name, END)
+
+    return graph
+
+
+def _route_function(route: Route) -> Callable[[WorkflowState], list[str] | str]:
+    def _route(state: WorkflowState) -> list[str] | str:
+        key = route.decide(state)
+        if key not in route.targets:
+            raise ValueError(f"Route from '{route.source}' returned unknown key {key!r}")
+        return list(route.targets[key]) or END
+
+    _route.__name__ = f"route_{route.source}"
+    return _route
+
+
+class DAGWorkflow(LangGraphResponsesAgent):
+    """
+    Workflow whose graph is derived from its nodes' `depends_on`.
+
+    Subclasses implement nodes() and, for conditional branches, routes():
+    ```
+        class MyWorkflow(DAGWorkflow):
+            def nodes(self):
+                return [ResearchAgent(), EnrichmentAgent(), SummaryAgent()]
+    ```
+    Nodes that don't depend on each other run in parallel.
+    """
+
+    @abstractmethod
+    def nodes(self) -> Sequence[WorkflowNode]:
+        """Nodes in the workflow, in any order"""
+        ...
+
+    def routes(self) -> Sequence[Route]:
+        """Conditional routes between nodes. Defaults to none."""
+        return ()
+
+    def build_workflow(self) -> StateGraph:
+        """Derive the workflow graph from nodes() and routes()"""
+        nodes = self.nodes()
+        self.logger.info(f"Building {type(self).__name__} from dependencies of: {[node.node_id for node in nodes]}")
+        return build_dag(nodes, self.routes())
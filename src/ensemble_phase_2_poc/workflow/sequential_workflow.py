@@ -1,7 +1,6 @@
-from langgraph.graph import StateGraph, START, END
+from typing import Sequence
 
-from ensemble_phase_2_poc.state import WorkflowState
-from ensemble_phase_2_poc.workflow.base_workflow import LangGraphResponsesAgent
+from ensemble_phase_2_poc.workflow.dag import DAGWorkflow, WorkflowNode
 from ensemble_phase_2_poc.agents import (
     AccountResearchAgent,
     ResolutionAgent,
@@ -9,40 +8,17 @@ from ensemble_phase_2_poc.agents import (
 )
 
 
-class SequentialAccountResolutionWorkflow(LangGraphResponsesAgent):
+class SequentialAccountResolutionWorkflow(DAGWorkflow):
     """
     Sequential workflow for account resolution.
 
     Flow: AccountResearchAgent -> ResolutionAgent -> AccountNoteAgent
 
+    The edges follow from each agent's `depends_on` (see dag.py).
+
     To deploy to Databricks, just instantiate this class - the base class
     handles all the mlflow/ResponsesAgent integration.
     """
 
-    def build_workflow(self) -> StateGraph:
-        """Define the workflow graph"""
-        self.logger.info("Building sequential account resolution workflow")
-
-        # Instantiate nodes
-        research = AccountResearchAgent()
-        resolution = ResolutionAgent()
-        post_note = AccountNoteAgent()
-
-        self.logger.debug(f"Nodes initialized: {research.node_id}, {resolution.node_id}, {post_note.node_id}")
-
-        # Create the graph
-        graph = StateGraph(WorkflowState)
-
-        # Add nodes
-        graph.add_node(*research.as_node())
-        graph.add_node(*resolution.as_node())
-        graph.add_node(*post_note.as_node())
-
-        # Define the sequence
-        graph.add_edge(START, research.node_id)
-        graph.add_edge(research.node_id, resolution.node_id)
-        graph.add_edge(resolution.node_id, post_note.node_id)
-        graph.add_edge(post_note.node_id, END)
-
-        self.logger.info("Sequential workflow graph built successfully")
-        return graph
+    def nodes(self) -> Sequence[WorkflowNode]:
+        return [AccountResearchAgent(), ResolutionAgent(), AccountNoteAgent()]
@@ -0,0 +1,297 @@
+"""Tests for ensemble_phase_2_poc.agents module."""
+
+import asyncio
+import os
+from typing import Any
+
+import pytest
+from unittest.mock import patch
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from ensemble_phase_2_poc.agents import (
+    AccountNoteAgent,
+    AccountResearchAgent,
+    ResolutionAgent,
+    TriageAgent,
+)
+from ensemble_phase_2_poc.agents.base_agent import BaseAgent
+from ensemble_phase_2_poc.agents.prompt_registry import PromptRegistry, PromptTemplateError
+from ensemble_phase_2_poc.state import WorkflowState, NodeExecution
+
+
+class ScriptedToolCaller(BaseChatModel):
+    """Calls the first bound tool once, then echoes the tool result as its answer"""
+
+    tool_name: str = ""
+    tool_args: dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tool_name": tools[0].name}) if tools else self
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            message = AIMessage(content=f"done: {last.content}")
+        else:
+            message = AIMessage(
+                content="",
+                tool_calls=[{"name": self.tool_name, "args": self.tool_args, "id": "call-1"}],
+            )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def make_state(account_number: str) -> WorkflowState:
+    return WorkflowState(
+        node_outputs={
+            "account_research_agent": NodeExecution(
+                node_id="account_research_agent", input="", output="summary", metadata={}
+            )
+        },
+        execution_path=["account_research_agent"],
+        account_number=account_number,
+        client_name="Acme Healthcare",
+        facility_prefix="FAC",
+        lob="Acute",
+    )
+
+
+@pytest.fixture
+def scripted_model(monkeypatch):
+    monkeypatch.setenv("COHERE_API_KEY", "test-key")
+    model = ScriptedToolCaller(tool_args={"transaction_id": "1300"})
+    with patch("ensemble_phase_2_poc.agents.base_agent.ChatFactory.get_model", return_value=model) as get_model:
+        yield get_model
+
+
+class TestExecutorReuse:
+    """Test that a node's inner agent is built once and reused across accounts."""
+
+    def test_executor_built_once(self, scripted_model):
+        """Two accounts through the same node share one executor and one model client"""
+        agent = ResolutionAgent()
+        with patch.object(ResolutionAgent, "build_executor", wraps=agent.build_executor) as build:
+            agent(make_state("ACC-1"))
+            agent(make_state("ACC-2"))
+
+        assert build.call_count == 1
+        assert scripted_model.call_count == 1
+
+    def test_tools_receive_runtime_context(self, scripted_model):
+        """Account values reach the shared tool through runtime context, per call"""
+        agent = ResolutionAgent()
+        first = agent(make_state("ACC-1"))["node_outputs"]["resolution_agent"]["output"]
+        second = agent(make_state("ACC-2"))["node_outputs"]["resolution_agent"]["output"]
+
+        assert "ACC-1" in first and "ACC-2" not in first
+        assert "ACC-2" in second and "ACC-1" not in second
+        assert "1300" in first
+
+    def test_async_tools_receive_runtime_context(self, scripted_model):
+        """The ainvoke path threads the same runtime context into tools"""
+        agent = ResolutionAgent()
+        update = asyncio.run(agent.__acall__(make_state("ACC-9")))
+        assert "ACC-9" in update["node_outputs"]["resolution_agent"]["output"]
+
+    def test_executor_is_required(self):
+        """A node without build_executor() can't be instantiated"""
+
+        class NoExecutorAgent(BaseAgent):
+            node_id = "no_executor_agent"
+
+            def render_prompt(self, state):
+                return ""
+
+        with pytest.raises(TypeError, match="build_executor"):
+            NoExecutorAgent()
+
+
+class TestPromptRegistry:
+    """Test the in-memory prompt template registry."""
+
+    @pytest.mark.parametrize(
+        "agent_cls", [AccountResearchAgent, TriageAgent, ResolutionAgent, AccountNoteAgent]
+    )
+    def test_shipped_prompts_match_agents(self, agent_cls):
+        """Every shipped template uses exactly the placeholders its agent supplies"""
+        agent_cls().validate_prompt()
+
+    def test_templates_read_once(self):
+        """Repeated get_prompt calls are served from memory"""
+        AccountResearchAgent.get_prompt("account_research_agent")
+        with patch("pathlib.Path.read_text") as read_text:
+            AccountResearchAgent.get_prompt("account_research_agent")
+            read_text.assert_not_called()
+
+    def test_mismatch_fails_at_build_time(self, tmp_path):
+        """as_node() raises when the template and prompt_variables disagree"""
+        (tmp_path / "drifted_agent.md").write_text("Account {account_number}, summary {summary}")
+
+        class DriftedAgent(BaseAgent):
+            PROMPT_DIR = tmp_path
+            node_id = "drifted_agent"
+            prompt_variables = ("account_number", "lob")
+
+            def render_prompt(self, state):
+                return ""
+
+            def build_executor(self):
+                return self.build_agent()
+
+            def execute(self, prompt, state):
+                return ""
+
+        with pytest.raises(PromptTemplateError, match=r"not supplied by the agent: \['summary'\]"):
+            DriftedAgent().as_node()
+
+    def test_missing_template(self, tmp_path):
+        """A node without a template fails validation"""
+        with pytest.raises(PromptTemplateError, match="not found"):
+            PromptRegistry(tmp_path).validate("ghost_agent", [])
+
+    @pytest.mark.parametrize("text", ["Unbalanced {account_number", "Positional {} field"])
+    def test_malformed_template(self, tmp_path, text):
+        """Malformed templates are rejected at load time"""
+        (tmp_path / "bad.md").write_text(text)
+        with pytest.raises(PromptTemplateError):
+            PromptRegistry(tmp_path).get("bad")
+
+    def test_hot_reload(self, tmp_path):
+        """With hot_reload, an edited template is picked up on the next get()"""
+        path = tmp_path / "live.md"
+        path.write_text("v1 {lob}")
+        registry = PromptRegistry(tmp_path, hot_reload=True)
+        assert registry.get("live") == "v1 {lob}"
+
+        path.write_text("v2 {lob} {account_number}")
+        stat = path.stat()
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+        assert registry.get("live") == "v2 {lob} {account_number}"
+        assert registry.fields("live") == {"lob", "account_number"}
+
+
+class TestNodeUsage:
+    """Test per-node timing and token accounting in NodeExecution metadata."""
+
+    @pytest.fixture
+    def simulated_model(self, monkeypatch):
+        from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+        monkeypatch.setenv("COHERE_API_KEY", "test-key")
+        model = SimulatedChatModel(
+            model="command-a-03-2025", latency_distribution="fixed", latency_mean_ms=0, seed=0
+        )
+        with patch("ensemble_phase_2_poc.agents.base_agent.ChatFactory.get_model", return_value=model):
+            yield model
+
+    def test_metadata_records_calls_and_tokens(self, simulated_model):
+        """A tool-calling node makes two LLM calls and records their usage"""
+        metadata = ResolutionAgent()(make_state("ACC-1"))["node_outputs"]["resolution_agent"]["metadata"]
+
+        assert metadata["llm_calls"] == 2
+        assert metadata["retries"] == 0
+        assert metadata["input_tokens"] > 0 and metadata["output_tokens"] > 0
+        assert metadata["cached_tokens"] == 0
+        assert metadata["model"] == "command-a-03-2025"
+        assert metadata["wall_time_seconds"] >= 0
+        assert metadata["started_at"] <= metadata["finished_at"]
+        assert metadata["depends_on"] == ["account_research_agent"]
+
+    def test_default_routes_use_a_smaller_model_for_triage(self, monkeypatch):
+        """Without a routing config, triage runs on the small tier's model and resolution on the large tier's"""
+        from ensemble_phase_2_poc.inference.router import ChatFactory
+
+        monkeypatch.setenv("COHERE_API_KEY", "test-key")
+        monkeypatch.setenv("ENSEMBLE_SIMULATE_LLM", '{"latency_distribution": "fixed", "latency_mean_ms": 0}')
+        monkeypatch.setattr(ChatFactory, "_router", None)
+        ChatFactory.configure_router()
+
+        triage = TriageAgent()(make_state("ACC-1"))["node_outputs"]["triage_agent"]["metadata"]
+        resolution = ResolutionAgent()(make_state("ACC-1"))["node_outputs"]["resolution_agent"]["metadata"]
+        assert triage["model"] == "command-r7b-12-2024"
+        assert resolution["model"] == "command-a-03-2025"
+
+    def test_async_path_records_usage(self, simulated_model):
+        """Calls made through aexecute's worker thread are attributed to the node"""
+        update = asyncio.run(ResolutionAgent().__acall__(make_state("ACC-1")))
+        assert update["node_outputs"]["resolution_agent"]["metadata"]["llm_calls"] == 2
+
+    def test_cache_hits_count_as_cached_tokens(self, simulated_model):
+        """Responses served from the response cache report their input tokens as cached"""
+        from ensemble_phase_2_poc.inference.cache import ResponseCache
+
+        simulated_model.cache = ResponseCache()
+        agent = ResolutionAgent()
+        first = agent(make_state("ACC-1"))["node_outputs"]["resolution_agent"]["metadata"]
+        second = agent(make_state("ACC-1"))["node_outputs"]["resolution_agent"]["metadata"]
+
+        assert first["cached_tokens"] == 0
+        assert second["llm_calls"] == 2
+        assert second["cached_tokens"] == second["input_tokens"] > 0
+
+    def test_errors_count_as_retries(self):
+        """Failed LLM attempts inside a node are counted as retries"""
+        from uuid import uuid4
+        from ensemble_phase_2_poc.telemetry import track_node_usage
+
+        with track_node_usage("resolution_agent") as usage:
+            usage.on_llm_error(RuntimeError("429"), run_id=uuid4())
+        assert usage.as_metadata()["retries"] == 1
+
+    def test_failed_attempts_count_as_calls(self):
+        """A failed attempt is counted as a call as well as a retry"""
+        from uuid import uuid4
+        from langchain_core.outputs import LLMResult
+        from ensemble_phase_2_poc.telemetry import track_node_usage
+
+        with track_node_usage("resolution_agent") as usage:
+            failed, succeeded = uuid4(), uuid4()
+            usage.on_chat_model_start({}, [[]], run_id=failed)
+            usage.on_llm_error(RuntimeError("429"), run_id=failed)
+            usage.on_chat_model_start({}, [[]], run_id=succeeded)
+            usage.on_llm_end(LLMResult(generations=[]), run_id=succeeded)
+        assert usage.as_metadata()["llm_calls"] == 2
+        assert usage.as_metadata()["retries"] == 1
+
+
+class TestNodeUpdate:
+    """Test the state update a node returns."""
+
+    @pytest.fixture
+    def resolution(self):
+        with patch.object(ResolutionAgent, "execute", lambda self, prompt, state: "adjusted"):
+            yield ResolutionAgent()
+
+    def test_update_holds_only_own_entry(self, resolution):
+        """Upstream outputs are left to the node_outputs reducer, not copied"""
+        update = resolution(make_state("ACC-1"))
+        assert list(update["node_outputs"]) == ["resolution_agent"]
+        assert "ACC-1" in update["node_outputs"]["resolution_agent"]["input"]
+
+    def test_drop_prompt(self, resolution, monkeypatch):
+        from ensemble_phase_2_poc.prompt_retention import load_prompt
+
+        monkeypatch.setenv("ENSEMBLE_PROMPT_RETENTION", "drop")
+        execution = resolution(make_state("ACC-1"))["node_outputs"]["resolution_agent"]
+
+        assert execution["input"] == ""
+        assert execution["metadata"]["input_chars"] > 0
+        assert load_prompt(execution) is None
+
+    def test_externalize_prompt(self, resolution, monkeypatch, tmp_path):
+        """Externalized prompts are stored once per content and can be read back"""
+        from ensemble_phase_2_poc.prompt_retention import load_prompt
+
+        monkeypatch.setenv("ENSEMBLE_PROMPT_RETENTION", str(tmp_path / "prompts"))
+        first = resolution(make_state("ACC-1"))["node_outputs"]["resolution_agent"]
+        second = resolution(make_state("ACC-1"))["node_outputs"]["resolution_agent"]
+
+        assert first["input"] == second["input"]
+        assert len(list((tmp_path / "prompts").iterdir())) == 1
+        assert "ACC-1" in load_prompt(first)
+        assert len(load_prompt(first)) == first["metadata"]["input_chars"]
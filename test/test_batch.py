@@ -0,0 +1,238 @@
+"""Tests for ensemble_phase_2_poc.batch module."""
+
+import io
+import json
+import time
+
+import pytest
+from langgraph.graph import StateGraph, START, END
+
+from ensemble_phase_2_poc.batch import (
+    LatencyTracker,
+    read_records,
+    record_to_request,
+    run_batch,
+)
+from ensemble_phase_2_poc import metrics
+from ensemble_phase_2_poc.concurrency import AIMDPolicy
+from ensemble_phase_2_poc.prescreen import PrescreenRules
+from ensemble_phase_2_poc.state import WorkflowState, NodeExecution
+from ensemble_phase_2_poc.workflow import LangGraphResponsesAgent
+
+
+class EchoWorkflow(LangGraphResponsesAgent):
+    """Single-node workflow that needs no LLM. Module-level so worker processes can import it."""
+
+    def build_workflow(self) -> StateGraph:
+        def echo(state: WorkflowState) -> dict:
+            if state["account_number"] == "ACC-BAD":
+                raise RuntimeError("bad account")
+            if state["account_number"] == "ACC-SLOW":
+                time.sleep(1.0)
+            return {
+                "node_outputs": {
+                    "echo": NodeExecution(
+                        node_id="echo", input="", output=state["account_number"], metadata={}
+                    )
+                },
+                "execution_path": ["echo"],
+            }
+
+        graph = StateGraph(WorkflowState)
+        graph.add_node("echo", echo)
+        graph.add_edge(START, "echo")
+        graph.add_edge("echo", END)
+        return graph
+
+
+class SimulatedLLMWorkflow(LangGraphResponsesAgent):
+    """One simulated LLM call per account; outputs the thread it ran on"""
+
+    def build_workflow(self) -> StateGraph:
+        def call_llm(state: WorkflowState) -> dict:
+            import threading
+            from langchain_core.messages import HumanMessage
+            from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+            model = SimulatedChatModel(latency_distribution="fixed", latency_mean_ms=20, script=["ok"])
+            model.invoke([HumanMessage(content=state["account_number"])])
+            return {
+                "node_outputs": {
+                    "llm": NodeExecution(
+                        node_id="llm", input="", output=threading.current_thread().name, metadata={}
+                    )
+                },
+                "execution_path": ["llm"],
+            }
+
+        graph = StateGraph(WorkflowState)
+        graph.add_node("llm", call_llm)
+        graph.add_edge(START, "llm")
+        graph.add_edge("llm", END)
+        return graph
+
+
+class TestReadRecords:
+    """Test lazy record reading."""
+
+    def test_reads_jsonl(self, tmp_path):
+        """JSONL files yield one dict per non-empty line"""
+        path = tmp_path / "accounts.jsonl"
+        path.write_text('{"account_number": "ACC-1"}\n\n{"account_number": "ACC-2"}\n')
+        assert [r["account_number"] for r in read_records(path)] == ["ACC-1", "ACC-2"]
+
+    def test_reads_csv(self, tmp_path):
+        """CSV files yield one dict per row keyed by header"""
+        path = tmp_path / "accounts.csv"
+        path.write_text("account_number,client_name,facility_prefix,lob\nACC-1,Acme,FAC,Acute\n")
+        records = list(read_records(path))
+        assert records == [
+            {"account_number": "ACC-1", "client_name": "Acme", "facility_prefix": "FAC", "lob": "Acute"}
+        ]
+
+    def test_rejects_unknown_format(self, tmp_path):
+        """Unsupported extensions raise ValueError"""
+        path = tmp_path / "accounts.txt"
+        path.write_text("")
+        with pytest.raises(ValueError, match="Unsupported input format"):
+            list(read_records(path))
+
+    def test_record_to_request(self):
+        """Account fields are copied into custom_inputs, missing ones default to empty"""
+        request = record_to_request({"account_number": "ACC-1", "lob": "Acute", "extra": 1})
+        assert request.custom_inputs == {
+            "account_number": "ACC-1",
+            "client_name": "",
+            "facility_prefix": "",
+            "lob": "Acute",
+        }
+
+
+class TestLatencyTracker:
+    """Test LatencyTracker percentiles and counters."""
+
+    def test_percentiles(self):
+        tracker = LatencyTracker()
+        for latency in range(1, 101):
+            tracker.record(float(latency))
+        assert tracker.percentile(50) == 50.0
+        assert tracker.percentile(95) == 95.0
+        assert tracker.completed == 100
+
+    def test_window_is_bounded(self):
+        """Only the most recent `window` latencies are kept"""
+        tracker = LatencyTracker(window=10)
+        for latency in range(1000):
+            tracker.record(float(latency), failed=latency % 2 == 0)
+        assert tracker.percentile(0) == 990.0
+        assert tracker.completed == 1000
+        assert tracker.failed == 500
+
+
+class TestRunBatch:
+    """End-to-end run through a real process pool."""
+
+    @pytest.mark.parametrize("adaptive", [None, AIMDPolicy(initial_limit=1)])
+    def test_writes_every_record(self, tmp_path, adaptive):
+        """Every input record produces one output line; failures are recorded, not raised"""
+        input_path = tmp_path / "accounts.jsonl"
+        output_path = tmp_path / "results.jsonl"
+        accounts = ["ACC-1", "ACC-BAD", "ACC-2", "ACC-3"]
+        input_path.write_text("\n".join(json.dumps({"account_number": a}) for a in accounts))
+        metrics.REGISTRY.clear()
+
+        stats = run_batch(
+            input_path,
+            output_path,
+            EchoWorkflow,
+            workers=2,
+            max_in_flight=2,
+            progress_stream=io.StringIO(),
+            adaptive=adaptive,
+        )
+
+        results = sorted(
+            (json.loads(line) for line in output_path.read_text().splitlines()),
+            key=lambda r: r["index"],
+        )
+        assert [r["account_number"] for r in results] == accounts
+        assert results[1]["error"]["code"] == "RuntimeError"
+        assert results[0]["custom_outputs"]["node_outputs"]["echo"] == "ACC-1"
+        assert "provider_feedback" not in results[0]
+        assert stats.completed == 4
+        assert stats.failed == 1
+        # Recorded in the workers, exported by the parent
+        exported = metrics.REGISTRY.render().splitlines()
+        assert 'ensemble_workflow_duration_seconds_count{workflow="EchoWorkflow"} 4' in exported
+        assert 'ensemble_workflow_failures_total{workflow="EchoWorkflow"} 1' in exported
+
+    def test_adaptive_limit_grows_past_workers(self, tmp_path):
+        """Without backpressure the limit grows, and one worker runs several accounts at once"""
+        input_path = tmp_path / "accounts.jsonl"
+        output_path = tmp_path / "results.jsonl"
+        input_path.write_text("\n".join(json.dumps({"account_number": f"ACC-{i}"}) for i in range(24)))
+
+        stats = run_batch(
+            input_path,
+            output_path,
+            SimulatedLLMWorkflow,
+            workers=1,
+            progress_stream=io.StringIO(),
+            adaptive=AIMDPolicy(initial_limit=1, max_limit=4, latency_tolerance=10.0),
+        )
+
+        results = [json.loads(line) for line in output_path.read_text().splitlines()]
+        assert stats.completed == 24 and stats.failed == 0
+        assert stats.concurrency_limit == 4
+        assert len({r["custom_outputs"]["node_outputs"]["llm"] for r in results}) > 1
+
+    def test_finished_slots_are_refilled(self, tmp_path):
+        """A slow record holds only its own slot; the others are written as they finish"""
+        input_path = tmp_path / "accounts.jsonl"
+        output_path = tmp_path / "results.jsonl"
+        accounts = ["ACC-SLOW"] + [f"ACC-{i}" for i in range(8)]
+        input_path.write_text("\n".join(json.dumps({"account_number": a}) for a in accounts))
+
+        run_batch(
+            input_path,
+            output_path,
+            EchoWorkflow,
+            workers=1,
+            progress_stream=io.StringIO(),
+            adaptive=AIMDPolicy(initial_limit=2, max_limit=2),
+        )
+
+        written = [json.loads(line)["account_number"] for line in output_path.read_text().splitlines()]
+        assert written[-1] == "ACC-SLOW"
+
+    def test_prescreen_skips_workers(self, tmp_path):
+        """Screened records are written by the parent; only the rest reach a worker"""
+        input_path = tmp_path / "accounts.jsonl"
+        output_path = tmp_path / "results.jsonl"
+        records = [
+            {"account_number": "ACC-1", "total_outstanding": 0, "notes": ["n"]},
+            {"account_number": "ACC-2", "total_outstanding": 49.0, "notes": ["n"]},
+            {"account_number": "ACC-3", "lob": "Behavioral"},
+        ]
+        input_path.write_text("\n".join(json.dumps(r) for r in records))
+
+        stats = run_batch(
+            input_path,
+            output_path,
+            EchoWorkflow,
+            workers=1,
+            progress_stream=io.StringIO(),
+            prescreen=PrescreenRules(excluded_lobs=("Behavioral",)),
+        )
+
+        results = {r["account_number"]: r for r in map(json.loads, output_path.read_text().splitlines())}
+        assert results["ACC-1"]["custom_outputs"]["execution_path"] == ["prescreen"]
+        assert results["ACC-1"]["custom_outputs"]["node_outputs"]["prescreen"] == "human"
+        assert results["ACC-2"]["custom_outputs"]["execution_path"] == ["echo"]
+        assert results["ACC-3"]["index"] == 2
+        assert stats.completed == 3
+        assert stats.prescreen == {
+            "screened": 2,
+            "screened_by_rule": {"zero_balance": 1, "lob_out_of_scope": 1},
+            "llm_calls_saved": 4,
+        }
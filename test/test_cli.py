@@ -1,11 +1,16 @@
 """Tests for ensemble_phase_2_poc.cli module."""
 
+import pytest
 from unittest.mock import patch, MagicMock
+import os
 import sys
 from ensemble_phase_2_poc.workflow.base_workflow import LangGraphResponsesAgent
 
 from ensemble_phase_2_poc.cli import (
     WORKFLOW_REGISTRY,
+    configure_llm,
+    configure_metrics,
+    configure_workflow,
     parse_args,
     main,
 )
@@ -56,6 +61,130 @@ class TestParseArgs:
             assert args.tracking_uri == "http://mlflow:5000"
 
 
+    def test_batch_args(self):
+        """batch requires input/output and accepts a worker count"""
+        with patch.object(sys, "argv", ["cli", "batch", "-i", "in.jsonl", "-o", "out.jsonl", "-n", "3"]):
+            args = parse_args()
+            assert args.command == "batch"
+            assert args.input == "in.jsonl"
+            assert args.output == "out.jsonl"
+            assert args.workers == 3
+            assert args.workflow == "branching"
+            assert args.llm_cache is None
+            assert args.adaptive_concurrency is None
+            assert args.prescreen is None
+
+    def test_speculative_args(self):
+        """--speculative reaches batch workers through the environment"""
+        with patch.object(sys, "argv", ["cli", "batch", "-i", "in.jsonl", "-o", "out.jsonl", "--speculative"]), \
+             patch.dict(os.environ, {}, clear=True):
+            configure_workflow(parse_args())
+            assert os.environ["ENSEMBLE_SPECULATIVE_RESOLUTION"] == "1"
+            assert "ENSEMBLE_PROMPT_RETENTION" not in os.environ
+
+    def test_prompt_retention_args(self):
+        with patch.object(sys, "argv", ["cli", "run", "--prompt-retention", "drop"]), \
+             patch.dict(os.environ, {}, clear=True):
+            configure_workflow(parse_args())
+            assert os.environ["ENSEMBLE_PROMPT_RETENTION"] == "drop"
+
+    def test_compact_tool_outputs_args(self):
+        with patch.object(sys, "argv", ["cli", "run", "--compact-tool-outputs"]), \
+             patch.dict(os.environ, {}, clear=True):
+            configure_workflow(parse_args())
+            assert os.environ["ENSEMBLE_TOOL_OUTPUT_ENCODING"] == "1"
+        with patch.object(sys, "argv", ["cli", "run", "--compact-tool-outputs", "{\"node\": []}"]), \
+             patch.dict(os.environ, {}, clear=True), pytest.raises(ValueError):
+            configure_workflow(parse_args())
+
+    def test_llm_cache_args(self):
+        """--llm-cache enables the response cache via the environment"""
+        argv = ["cli", "evaluate", "--llm-cache", "cache.db", "--llm-cache-ttl", "3600"]
+        with patch.object(sys, "argv", argv), patch.dict(os.environ, {}, clear=False):
+            args = parse_args()
+            configure_llm(args)
+            assert os.environ["ENSEMBLE_LLM_CACHE"] == "cache.db"
+            assert os.environ["ENSEMBLE_LLM_CACHE_TTL"] == "3600.0"
+
+    def test_cassette_args(self):
+        """--cassette selects record/replay via the environment, replay needs no real API key"""
+        argv = ["cli", "batch", "-i", "in.jsonl", "-o", "out.jsonl", "--cassette", "calls.jsonl"]
+        with patch.object(sys, "argv", argv), patch.dict(os.environ, {}, clear=True):
+            args = parse_args()
+            configure_llm(args)
+            assert os.environ["ENSEMBLE_LLM_CASSETTE"] == "calls.jsonl"
+            assert os.environ["ENSEMBLE_LLM_CASSETTE_MODE"] == "replay"
+            assert os.environ["COHERE_API_KEY"]
+
+    def test_simulate_args(self):
+        """--simulate with no profile uses the defaults"""
+        with patch.object(sys, "argv", ["cli", "run", "--simulate"]), patch.dict(os.environ, {}, clear=True):
+            configure_llm(parse_args())
+            assert os.environ["ENSEMBLE_SIMULATE_LLM"] == "1"
+
+    def test_retry_policy_args(self):
+        """--retry-policy is validated, then passed on via the environment"""
+        argv = ["cli", "run", "--retry-policy", '{"max_tries": 2}']
+        with patch.object(sys, "argv", argv), patch.dict(os.environ, {}, clear=True):
+            configure_llm(parse_args())
+            assert os.environ["ENSEMBLE_LLM_RETRY_POLICY"] == '{"max_tries": 2}'
+
+        argv = ["cli", "run", "--retry-policy", '{"max_tries": 0}']
+        with patch.object(sys, "argv", argv), patch.dict(os.environ, {}, clear=True):
+            with pytest.raises(ValueError):
+                configure_llm(parse_args())
+
+    def test_hedge_args(self):
+        """--hedge with no policy enables hedging with the defaults"""
+        with patch.object(sys, "argv", ["cli", "evaluate", "--hedge"]), patch.dict(os.environ, {}, clear=True):
+            configure_llm(parse_args())
+            assert os.environ["ENSEMBLE_LLM_HEDGING"] == "1"
+
+    def test_routes_args(self):
+        """--routes is validated, then passed to workers via the environment"""
+        routes = '{"nodes": {"triage_agent": "cohere/command-r7b-12-2024"}}'
+        with patch.object(sys, "argv", ["cli", "evaluate", "--routes", routes]), patch.dict(os.environ, {}, clear=True):
+            configure_llm(parse_args())
+            assert os.environ["ENSEMBLE_LLM_ROUTES"] == routes
+
+        with patch.object(sys, "argv", ["cli", "evaluate", "--routes", '{"tiers": {"small": ["command-r"]}}']):
+            with pytest.raises(ValueError):
+                configure_llm(parse_args())
+
+    def test_rate_limit_args(self):
+        """Batch workers share a SQLite bucket store unless one is given"""
+        limits = '{"cohere": {"requests_per_minute": 100}}'
+        argv = ["cli", "batch", "-i", "in.jsonl", "-o", "out.jsonl", "--rate-limits", limits]
+        with patch.object(sys, "argv", argv), patch.dict(os.environ, {}, clear=True):
+            configure_llm(parse_args())
+            assert os.environ["ENSEMBLE_LLM_RATE_LIMITS"] == limits
+            assert os.environ["ENSEMBLE_LLM_RATE_LIMIT_STORE"].endswith("buckets.db")
+
+        argv = ["cli", "evaluate", "--rate-limits", '{"cohere": {"requests_per_minute": 0}}']
+        with patch.object(sys, "argv", argv), patch.dict(os.environ, {}, clear=True):
+            with pytest.raises(ValueError):
+                configure_llm(parse_args())
+
+    def test_metrics_args(self):
+        """--metrics-file is passed to the exporters via the environment"""
+        argv = ["cli", "batch", "-i", "in.jsonl", "-o", "out.jsonl", "--metrics-file", "m-{pid}.prom"]
+        with patch.object(sys, "argv", argv), patch.dict(os.environ, {}, clear=True), \
+             patch("ensemble_phase_2_poc.metrics.configure_from_env") as configure_from_env:
+            configure_metrics(parse_args())
+            assert os.environ["ENSEMBLE_METRICS_FILE"] == "m-{pid}.prom"
+            assert os.environ["ENSEMBLE_METRICS_INTERVAL"] == "15.0"
+            assert "ENSEMBLE_METRICS_PORT" not in os.environ
+            assert "ENSEMBLE_METRICS_HOST" not in os.environ
+            configure_from_env.assert_called_once()
+
+        argv = ["cli", "run", "--metrics-port", "9100", "--metrics-host", "0.0.0.0"]
+        with patch.object(sys, "argv", argv), patch.dict(os.environ, {}, clear=True), \
+             patch("ensemble_phase_2_poc.metrics.configure_from_env"):
+            configure_metrics(parse_args())
+            assert os.environ["ENSEMBLE_METRICS_PORT"] == "9100"
+            assert os.environ["ENSEMBLE_METRICS_HOST"] == "0.0.0.0"
+
+
 class TestMain:
     @patch("ensemble_phase_2_poc.cli.mlflow")
     @patch("ensemble_phase_2_poc.cli.parse_args")
@@ -69,9 +198,23 @@ class TestMain:
         mock_parse_args.return_value = MagicMock(
             command="run",
             workflow="branching",
+            speculative=False,
+            prompt_retention=None,
+            compact_tool_outputs=None,
             experiment="my-exp",
             tracking_uri="http://my-uri",
             run_name="my-run",
+            llm_cache=None,
+            llm_cache_ttl=None,
+            cassette=None,
+            simulate=None,
+            retry_policy=None,
+            hedge=None,
+            routes=None,
+            rate_limits=None,
+            metrics_port=None,
+            metrics_host=None,
+            metrics_file=None,
         )
         mock_workflow_instance = MagicMock()
         mock_workflow_instance.predict.return_value = MagicMock(
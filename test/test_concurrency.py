@@ -0,0 +1,145 @@
+"""Tests for ensemble_phase_2_poc.concurrency module."""
+
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from ensemble_phase_2_poc.concurrency import (
+    CONCURRENCY_ADJUSTMENTS,
+    CONCURRENCY_LIMIT,
+    AIMDController,
+    AIMDPolicy,
+    parse_aimd_policy,
+)
+from ensemble_phase_2_poc.inference.feedback import ProviderFeedback, classify, collect_feedback
+
+
+def _feedback(calls=1, throttled=0, timeouts=0, errors=0, latency=1.0):
+    succeeded = calls - throttled - timeouts - errors
+    return ProviderFeedback(calls, throttled, timeouts, errors, latency * succeeded)
+
+
+class TestAIMDController:
+    """Test limit adjustments from provider feedback."""
+
+    def test_additive_increase(self):
+        """Healthy accounts grow the limit by about one per `limit` accounts, up to max_limit"""
+        controller = AIMDController(AIMDPolicy(initial_limit=2, max_limit=4), name="grow")
+        for _ in range(2):
+            controller.on_result(_feedback())
+        assert controller.limit == 3
+        for _ in range(20):
+            controller.on_result(_feedback())
+        assert controller.limit == 4
+        assert CONCURRENCY_LIMIT.labels("grow").value == 4
+
+    def test_multiplicative_decrease(self):
+        """Throttling halves the limit once per cool-down; timeouts and latency spikes cut it too"""
+        controller = AIMDController(AIMDPolicy(initial_limit=16, cooldown=60), name="cut")
+        controller.on_result(_feedback(calls=3, throttled=2))
+        controller.on_result(_feedback(throttled=1))
+        assert controller.limit == 8
+        assert CONCURRENCY_ADJUSTMENTS.labels("cut", "decrease", "throttled").value == 1
+
+        with patch("ensemble_phase_2_poc.concurrency.time.monotonic", return_value=1e9):
+            controller.on_result(_feedback(timeouts=1))
+        assert controller.limit == 4
+
+        controller = AIMDController(AIMDPolicy(initial_limit=16, cooldown=0), name="slow")
+        controller.on_result(_feedback(latency=1.0))
+        controller.on_result(_feedback(latency=5.0))
+        assert controller.limit == 8
+        assert CONCURRENCY_ADJUSTMENTS.labels("slow", "decrease", "latency").value == 1
+
+    def test_errors_hold_growth(self):
+        """Non-throttling errors above max_error_rate neither grow nor cut the limit"""
+        controller = AIMDController(AIMDPolicy(initial_limit=2, max_error_rate=0.1))
+        for _ in range(10):
+            controller.on_result(_feedback(calls=2, errors=1))
+        assert controller.limit == 2
+
+    def test_slot_learns_from_provider(self):
+        """A throttled simulated provider inside a slot cuts the limit"""
+        from cohere.errors import TooManyRequestsError
+        from ensemble_phase_2_poc.inference.retry import RetryPolicy, configure_retry
+        from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+        controller = AIMDController(AIMDPolicy(initial_limit=4))
+        model = SimulatedChatModel(latency_distribution="fixed", latency_mean_ms=0, rate_limit_rate=1.0)
+        configure_retry(RetryPolicy(max_tries=1))
+        try:
+            with pytest.raises(TooManyRequestsError, match="simulated rate limit"):
+                with controller.slot() as feedback:
+                    assert controller.in_flight == 1
+                    model.invoke([HumanMessage(content="hi")])
+        finally:
+            configure_retry()
+
+        assert feedback.throttled == 1
+        assert controller.in_flight == 0
+        assert controller.limit == 2
+
+    def test_aslot_bounds_coroutines(self):
+        """Coroutines wait for room under the limit, which grows while calls succeed"""
+        import asyncio
+        from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+        controller = AIMDController(AIMDPolicy(initial_limit=1, max_limit=3, latency_tolerance=10.0))
+        model = SimulatedChatModel(latency_distribution="fixed", latency_mean_ms=5, script=["ok"])
+        peak = 0
+
+        async def run_one():
+            nonlocal peak
+            async with controller.aslot():
+                peak = max(peak, controller.in_flight)
+                assert controller.in_flight <= controller.limit
+                await model.ainvoke([HumanMessage(content="hi")])
+
+        async def main():
+            await asyncio.gather(*(run_one() for _ in range(20)))
+
+        asyncio.run(main())
+        assert controller.limit == 3
+        assert peak == 3
+        assert controller.in_flight == 0
+
+    def test_capped_policy(self):
+        assert AIMDPolicy(initial_limit=8, max_limit=64).capped(4) == AIMDPolicy(initial_limit=4, max_limit=4)
+        assert AIMDPolicy(min_limit=2, initial_limit=2).capped(1) == AIMDPolicy(min_limit=1, initial_limit=1, max_limit=1)
+
+    def test_invalid_policy(self):
+        with pytest.raises(ValueError):
+            AIMDPolicy(initial_limit=0)
+        with pytest.raises(ValueError):
+            AIMDPolicy(decrease=1.5)
+        assert parse_aimd_policy('{"initial_limit": 8}').initial_limit == 8
+        with pytest.raises(ValueError, match="Unknown Adaptive concurrency policy fields"):
+            parse_aimd_policy('{"start": 8}')
+
+
+class TestProviderFeedback:
+    """Test classification and collection of provider attempts."""
+
+    def test_classify(self):
+        from cohere.errors import TooManyRequestsError
+        import httpx
+
+        assert classify(None) == "ok"
+        assert classify(TooManyRequestsError(body={})) == "throttled"
+        assert classify(httpx.ReadTimeout("slow")) == "timeout"
+        assert classify(ValueError("bad")) == "error"
+
+    def test_nested_collectors(self):
+        """Attempts count towards every enclosing collector, and only while inside it"""
+        from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+        model = SimulatedChatModel(latency_distribution="fixed", latency_mean_ms=0)
+        with collect_feedback() as outer:
+            model.invoke([HumanMessage(content="one")])
+            with collect_feedback() as inner:
+                model.invoke([HumanMessage(content="two")])
+        model.invoke([HumanMessage(content="three")])
+
+        assert (outer.calls, inner.calls) == (2, 1)
+        assert outer.succeeded == 2 and outer.mean_latency is not None
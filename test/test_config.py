@@ -0,0 +1,70 @@
+"""Tests for ensemble_phase_2_poc.config module."""
+
+import json
+from dataclasses import dataclass
+
+import pytest
+
+from ensemble_phase_2_poc.config import ConfiguredFromEnv, env_setting, load_json_config, parse_config
+
+
+@dataclass(frozen=True)
+class Policy:
+    limit: int = 4
+    statuses: tuple[int, ...] = ()
+
+
+class TestJsonConfig:
+    """Test the shared inline-JSON / file-path loader."""
+
+    def test_defaults_inline_and_file(self, tmp_path):
+        assert load_json_config("1", "Policy") == {}
+        assert load_json_config(" true ", "Policy") == {}
+        assert load_json_config('{"limit": 8}', "Policy") == {"limit": 8}
+        path = tmp_path / "policy.json"
+        path.write_text(json.dumps({"limit": 2}))
+        assert load_json_config(str(path), "Policy") == {"limit": 2}
+
+    def test_rejects_non_objects(self):
+        with pytest.raises(ValueError, match="Policy must be a JSON object"):
+            load_json_config("[1, 2]", "Policy")
+        with pytest.raises(ValueError, match="Policy is not valid JSON"):
+            load_json_config("{limit: 8}", "Policy")
+        with pytest.raises(FileNotFoundError):
+            load_json_config("missing.json", "Policy")
+
+    def test_parse_config(self):
+        assert parse_config("1", Policy, "Policy") == Policy()
+        assert parse_config('{"statuses": [429]}', Policy, "Policy", statuses=tuple) == Policy(statuses=(429,))
+        with pytest.raises(ValueError, match=r"Unknown Policy fields: \['limt'\]"):
+            parse_config('{"limt": 8}', Policy, "Policy")
+
+
+class TestConfiguredFromEnv:
+    """Test configuring process-wide settings from the environment."""
+
+    def test_configures_once_from_env(self, monkeypatch):
+        calls = []
+        guard = ConfiguredFromEnv("ENSEMBLE_TEST_SETTING", calls.append)
+        monkeypatch.setenv("ENSEMBLE_TEST_SETTING", " 1 ")
+        guard.ensure()
+        guard.ensure()
+        assert calls == ["1"]
+        guard.reset()
+        monkeypatch.delenv("ENSEMBLE_TEST_SETTING")
+        guard.ensure()
+        assert calls == ["1", None]
+
+    def test_explicit_configuration_wins(self, monkeypatch):
+        calls = []
+        guard = ConfiguredFromEnv("ENSEMBLE_TEST_SETTING", calls.append)
+        monkeypatch.setenv("ENSEMBLE_TEST_SETTING", "1")
+        guard.mark_configured()
+        guard.ensure()
+        assert calls == []
+
+    def test_env_setting_follows_the_variable(self, monkeypatch):
+        get = env_setting("ENSEMBLE_TEST_SETTING", int, default=0)
+        assert get() == 0
+        monkeypatch.setenv("ENSEMBLE_TEST_SETTING", "3")
+        assert get() == 3
@@ -18,4 +18,772 @@ def test_provider_routing(provider, expected_class):
         model="dummy_model",
         api_key="some_api_key" # this works because API key errors are not thrown until model is actually invoked
     )
-    assert isinstance(chat_model, expected_class)
\ No newline at end of file
+    assert isinstance(chat_model, expected_class)
+    assert chat_model._retry_model_name == "dummy_model"
+
+# Repeated get_model calls with the same arguments should return the pooled instance
+def test_pooled_model_reused():
+    first = ChatFactory.get_model(provider="cohere", model="pooled-model", api_key="key-a")
+    second = ChatFactory.get_model(provider="cohere", model="pooled-model", api_key="key-a")
+    other_key = ChatFactory.get_model(provider="cohere", model="pooled-model", api_key="key-b")
+    other_kwargs = ChatFactory.get_model(provider="cohere", model="pooled-model", api_key="key-a", temperature=0.1)
+    assert first is second
+    assert first is not other_key
+    assert first is not other_kwargs
+
+
+# All pooled Cohere models should sit on the same shared httpx client
+def test_pooled_models_share_http_client():
+    a = ChatFactory.get_model(provider="cohere", model="model-a", api_key="key")
+    b = ChatFactory.get_model(provider="cohere", model="model-b", api_key="key")
+    assert a.client._client_wrapper.httpx_client.httpx_client is b.client._client_wrapper.httpx_client.httpx_client
+
+
+# The shared async client works from one asyncio.run() to the next, with keep-alive connections per loop
+def test_pooled_async_client_across_event_loops():
+    import asyncio
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class KeepAliveHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        model = ChatFactory.get_model(provider="cohere", model="loop-model", api_key="key")
+        client = model.async_client._client_wrapper.httpx_client.httpx_client
+        url = f"http://127.0.0.1:{server.server_port}/"
+        assert asyncio.run(client.get(url)).status_code == 200
+        assert asyncio.run(client.get(url)).status_code == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# Pool stats report hits/misses and the configured limits, without leaking API keys
+def test_pool_stats():
+    ChatFactory.configure_pool(max_connections=7, max_keepalive_connections=3)
+    ChatFactory.get_model(provider="cohere", model="stats-model", api_key="secret-key")
+    ChatFactory.get_model(provider="cohere", model="stats-model", api_key="secret-key")
+    stats = ChatFactory.pool_stats()
+    ChatFactory.configure_pool()
+
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["config"]["max_connections"] == 7
+    assert stats["pooled_models"] == [{"provider": "cohere", "model": "stats-model"}]
+    assert stats["http_clients"]["cohere"]["sync_connections"]["open"] == 0
+    assert "secret-key" not in str(stats)
+
+
+# Response cache: a repeated request is served from the cache, including tool calls
+def test_response_cache_hit_with_tool_calls(tmp_path):
+    from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+    from langchain_core.messages import AIMessage, HumanMessage
+    from ensemble_phase_2_poc.inference.cache import ResponseCache
+
+    cache = ResponseCache(path=tmp_path / "cache.db")
+    response = AIMessage(content="", tool_calls=[{"name": "get_account_data", "args": {}, "id": "call-abc"}])
+    model = FakeMessagesListChatModel(responses=[response, AIMessage(content="second")], cache=cache)
+
+    first = model.invoke([HumanMessage(content="Research ACC-1")])
+    again = model.invoke([HumanMessage(content="Research ACC-1")])
+
+    assert again.tool_calls == first.tool_calls
+    assert model.i == 1  # the fake model was only called once
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    # A fresh cache on the same file is served from the disk tier
+    reopened = ResponseCache(path=tmp_path / "cache.db")
+    model.cache = reopened
+    assert model.invoke([HumanMessage(content="Research ACC-1")]).tool_calls == first.tool_calls
+    assert reopened.stats()["disk_hits"] == 1
+
+
+# Tool call ids and usage metadata don't affect the cache key
+def test_response_cache_key_normalizes_tool_call_ids():
+    from langchain_core.load import dumps
+    from langchain_core.messages import AIMessage, ToolMessage
+    from ensemble_phase_2_poc.inference.cache import cache_key
+
+    def conversation(call_id: str, tokens: int) -> str:
+        return dumps([
+            AIMessage(
+                content="",
+                tool_calls=[{"name": "t", "args": {}, "id": call_id}],
+                usage_metadata={"input_tokens": tokens, "output_tokens": 1, "total_tokens": tokens + 1},
+            ),
+            ToolMessage(content="ok", tool_call_id=call_id),
+        ])
+
+    assert cache_key(conversation("a1", 10), "llm") == cache_key(conversation("b2", 99), "llm")
+    assert cache_key(conversation("a1", 10), "llm") != cache_key(conversation("a1", 10), "other-llm")
+
+
+# Entries past their TTL are misses; the LRU tier is bounded
+def test_response_cache_eviction(tmp_path):
+    from unittest.mock import patch
+    from langchain_core.outputs import Generation
+    from ensemble_phase_2_poc.inference.cache import ResponseCache
+
+    cache = ResponseCache(path=tmp_path / "cache.db", max_memory_entries=1, ttl_seconds=60)
+    cache.update("a", "llm", [Generation(text="A")])
+    cache.update("b", "llm", [Generation(text="B")])
+    assert cache.stats()["memory_entries"] == 1
+    assert cache.lookup("a", "llm")[0].text == "A"  # evicted from memory, still on disk
+
+    with patch("ensemble_phase_2_poc.inference.cache.time.time", return_value=10**12):
+        assert cache.lookup("a", "llm") is None
+        assert cache.prune() == 1
+
+
+# configure_cache attaches the cache to models handed out by ChatFactory
+def test_chat_factory_cache_opt_in(tmp_path):
+    assert ChatFactory.get_model(provider="cohere", model="cache-model", api_key="key").cache is None
+
+    cache = ChatFactory.configure_cache(path=str(tmp_path / "cache.db"))
+    try:
+        cached_model = ChatFactory.get_model(provider="cohere", model="cache-model", api_key="key")
+        assert cached_model.cache is cache
+        assert ChatFactory.cache_stats()["misses"] == 0
+    finally:
+        ChatFactory.disable_cache()
+    assert ChatFactory.cache_stats() is None
+
+
+# Record mode captures calls; replay serves them back without calling the model
+def test_cassette_record_then_replay(tmp_path):
+    from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+    from ensemble_phase_2_poc.inference.cassette import Cassette, CassetteMissError
+
+    path = tmp_path / "calls.jsonl"
+    call = AIMessage(content="", tool_calls=[{"name": "get_account_data", "args": {}, "id": "live-1"}])
+    answer = AIMessage(content="Account is in scope")
+    recorder = FakeMessagesListChatModel(responses=[call, answer], cache=Cassette(path, mode="record"))
+
+    prompt = [HumanMessage(content="Research ACC-1")]
+    recorded_call = recorder.invoke(prompt)
+    recorded_answer = recorder.invoke(prompt + [recorded_call, ToolMessage(content="{}", tool_call_id="live-1")])
+
+    # The replaying model has no responses of its own: every call must come from the cassette
+    replay = Cassette(path, mode="replay")
+    player = FakeMessagesListChatModel(responses=[], cache=replay)
+    replayed_call = player.invoke(prompt)
+    replayed_answer = player.invoke(
+        # Tool call ids differ from the recording, as they would on a live run
+        prompt + [AIMessage(content="", tool_calls=[{"name": "get_account_data", "args": {}, "id": "other"}]),
+                  ToolMessage(content="{}", tool_call_id="other")]
+    )
+
+    assert replayed_call.tool_calls == recorded_call.tool_calls
+    assert replayed_answer.content == recorded_answer.content
+    assert replay.stats()["hits"] == 2
+
+    with pytest.raises(CassetteMissError):
+        player.invoke([HumanMessage(content="Research ACC-2")])
+
+
+# Cassettes can be seeded from MLflow chat model spans
+def test_seed_cassette_from_traces(tmp_path):
+    from types import SimpleNamespace
+    from langchain_core.load import dumps
+    from langchain_core.messages import HumanMessage
+    from ensemble_phase_2_poc.inference.cassette import Cassette, seed_cassette_from_traces
+
+    span = SimpleNamespace(
+        span_id="span-1",
+        inputs={"messages": [{"role": "user", "content": "Research ACC-1", "tool_calls": None, "tool_call_id": None}]},
+        outputs={"choices": [{"message": {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": "c9", "type": "function",
+                            "function": {"name": "get_account_data", "arguments": "{}"}}],
+        }}]},
+        get_attribute=lambda key: {"input_tokens": 3, "output_tokens": 4, "total_tokens": 7},
+    )
+    trace = SimpleNamespace(search_spans=lambda span_type: [span])
+
+    path = tmp_path / "seeded.jsonl"
+    assert seed_cassette_from_traces([trace], path) == 1
+
+    generations = Cassette(path, mode="replay").lookup(dumps([HumanMessage(content="Research ACC-1")]), "any-llm")
+    message = generations[0].message
+    assert message.tool_calls[0]["name"] == "get_account_data"
+    assert message.usage_metadata["total_tokens"] == 7
+
+
+# The cassette takes precedence over the response cache on new models
+def test_chat_factory_cassette_opt_in(tmp_path):
+    ChatFactory.configure_cache()
+    cassette = ChatFactory.configure_cassette(str(tmp_path / "calls.jsonl"), mode="record")
+    try:
+        model = ChatFactory.get_model(provider="cohere", model="cassette-model", api_key="key")
+        assert model.cache is cassette
+        assert ChatFactory.cache_stats()["mode"] == "record"
+    finally:
+        ChatFactory.disable_cassette()
+        ChatFactory.disable_cache()
+
+
+# The simulated provider calls the bound tool, then answers from its result
+def test_simulated_model_tool_calling():
+    from langchain_core.messages import HumanMessage, ToolMessage
+    from langchain_core.tools import tool
+    from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+    @tool
+    def post_contractual_adjustment(transaction_id: str) -> str:
+        """Post an adjustment"""
+        return transaction_id
+
+    model = SimulatedChatModel(latency_distribution="fixed", latency_mean_ms=0).bind_tools(
+        [post_contractual_adjustment]
+    )
+    call = model.invoke([HumanMessage(content="Resolve ACC-1")])
+    assert call.tool_calls[0]["name"] == "post_contractual_adjustment"
+    assert call.tool_calls[0]["args"] == {"transaction_id": "1300"}
+    assert call.usage_metadata["output_tokens"] > 0
+
+    answer = model.invoke([
+        HumanMessage(content="Resolve ACC-1"),
+        call,
+        ToolMessage(content="posted", tool_call_id=call.tool_calls[0]["id"]),
+    ])
+    assert not answer.tool_calls
+    assert "posted" in answer.content
+
+
+# Triage answers are agent/human, stable per account, and follow the configured ratio
+def test_simulated_model_triage():
+    from langchain_core.messages import HumanMessage
+    from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+    model = SimulatedChatModel(latency_distribution="fixed", latency_mean_ms=0, triage_agent_ratio=0.5)
+    prompts = [[HumanMessage(content=f"Triage account ACC-{i}")] for i in range(200)]
+    decisions = [model.invoke(prompt).content for prompt in prompts]
+
+    assert set(decisions) == {"agent", "human"}
+    assert 60 < decisions.count("agent") < 140
+    assert [model.invoke(prompt).content for prompt in prompts[:10]] == decisions[:10]
+    assert SimulatedChatModel(triage_agent_ratio=1.0, latency_mean_ms=0).invoke(prompts[0]).content == "agent"
+
+
+@pytest.fixture
+def no_retries():
+    """Surface provider errors on the first attempt, with fresh circuit breakers"""
+    ChatFactory.configure_retry(max_tries=1, failure_threshold=1000)
+    yield
+    ChatFactory.configure_retry()
+
+
+# Injected failures look like the provider's own errors, with Retry-After on 429s
+def test_simulated_model_failure_injection(no_retries):
+    from cohere.core.api_error import ApiError
+    from langchain_core.messages import HumanMessage
+    from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+    model = SimulatedChatModel(latency_distribution="fixed", latency_mean_ms=0, rate_limit_rate=1.0, retry_after_seconds=2)
+    with pytest.raises(ApiError) as error:
+        model.invoke([HumanMessage(content="hi")])
+    assert error.value.status_code == 429
+    assert error.value.headers["retry-after"] == "2"
+
+    model = SimulatedChatModel(latency_distribution="fixed", latency_mean_ms=0, server_error_rate=1.0, seed=1)
+    with pytest.raises(ApiError) as error:
+        model.invoke([HumanMessage(content="hi")])
+    assert error.value.status_code >= 500
+
+
+# ENSEMBLE_SIMULATE_LLM routes every model, so a full workflow runs offline
+def test_simulate_env_var_runs_workflow_offline(monkeypatch):
+    from mlflow.types.responses import ResponsesAgentRequest
+    from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+    from ensemble_phase_2_poc.workflow import BranchingAccountResolutionWorkflow
+
+    monkeypatch.setenv("ENSEMBLE_SIMULATE_LLM", '{"latency_distribution": "fixed", "latency_mean_ms": 0, "triage_agent_ratio": 1.0}')
+    monkeypatch.setenv("COHERE_API_KEY", "simulated")
+    model = ChatFactory.get_model(provider="cohere", model="command-a-03-2025", api_key="unused")
+    assert isinstance(model, SimulatedChatModel)
+    assert model.model == "command-a-03-2025"
+
+    BranchingAccountResolutionWorkflow.clear_graph_cache()
+    try:
+        response = BranchingAccountResolutionWorkflow().predict(
+            ResponsesAgentRequest(input=[], custom_inputs={
+                "account_number": "ACC-1", "client_name": "Acme", "facility_prefix": "FAC", "lob": "Acute",
+            })
+        )
+    finally:
+        BranchingAccountResolutionWorkflow.clear_graph_cache()
+
+    assert response.custom_outputs["execution_path"][-1] == "account_note_agent"
+    assert ChatFactory.get_provider_pricing("simulated", "command-a-03-2025") == (2.50, 10.00)
+
+
+# Retry policy and circuit breaker (inference/retry.py)
+
+@pytest.fixture
+def retry_policy():
+    """Install a policy for one test; sleeps are recorded instead of taken"""
+    from unittest.mock import patch
+
+    def _configure(**kwargs):
+        return ChatFactory.configure_retry(**kwargs)
+
+    with patch("ensemble_phase_2_poc.inference.retry.time.sleep") as sleep:
+        _configure.sleep = sleep
+        yield _configure
+    ChatFactory.configure_retry()
+
+
+def _rate_limited(retry_after="1"):
+    from cohere.errors import TooManyRequestsError
+    return TooManyRequestsError(body={"message": "slow down"}, headers={"retry-after": retry_after})
+
+
+# 429s, 5xx and network errors are retriable; bad requests, auth and local errors are fatal
+def test_retry_classification():
+    import httpx
+    from cohere.errors import BadRequestError, ServiceUnavailableError, UnauthorizedError
+    from ensemble_phase_2_poc.inference.cassette import CassetteMissError
+    from ensemble_phase_2_poc.inference.retry import RetryPolicy
+
+    policy = RetryPolicy()
+    for error in (_rate_limited(), ServiceUnavailableError(body={}), httpx.ConnectTimeout("timed out")):
+        assert policy.is_retriable(error), error
+    for error in (BadRequestError(body={}), UnauthorizedError(body={}), ValueError("bad tool call"), CassetteMissError("miss")):
+        assert not policy.is_retriable(error), error
+
+
+# Policies come from "1", inline JSON or a file, and are read from the environment on first use
+def test_retry_policy_from_env(monkeypatch):
+    from ensemble_phase_2_poc.inference import retry
+
+    assert retry.parse_retry_policy("1") == retry.RetryPolicy()
+    assert retry.parse_retry_policy('{"retry_statuses": [429]}').retry_statuses == (429,)
+    with pytest.raises(ValueError, match="Unknown Retry policy fields"):
+        retry.parse_retry_policy('{"max_retries": 2}')
+
+    monkeypatch.setenv(retry.RETRY_POLICY_ENV_VAR, '{"max_tries": 2}')
+    retry._FROM_ENV.reset()
+    try:
+        assert retry.get_retry_policy().max_tries == 2
+    finally:
+        retry.configure_retry()
+
+
+def test_retry_after_headers():
+    from email.utils import formatdate
+    from ensemble_phase_2_poc.inference.retry import retry_after
+
+    assert retry_after(_rate_limited("2")) == 2.0
+    assert retry_after(_rate_limited(formatdate(usegmt=True))) == pytest.approx(0.0, abs=1.0)
+
+    error = RuntimeError("rate limited")
+    error.headers = {"Retry-After-Ms": "250"}
+    assert retry_after(error) == 0.25
+    assert retry_after(ValueError("no headers")) is None
+
+
+# Retriable errors are retried after Retry-After; fatal ones surface on the first attempt
+def test_call_with_retry(retry_policy):
+    from ensemble_phase_2_poc.inference.retry import call_with_retry
+
+    retry_policy(max_tries=5)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _rate_limited("2")
+        return "ok"
+
+    assert call_with_retry("cohere", "command-a", flaky) == "ok"
+    assert len(attempts) == 3
+    assert [call.args[0] for call in retry_policy.sleep.call_args_list] == [2.0, 2.0]
+
+    def invalid():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        call_with_retry("cohere", "command-a", invalid)
+    assert len(attempts) == 1
+
+
+def test_retry_give_ups(retry_policy):
+    """Retries stop at max_tries, at an over-long Retry-After, and when the budget is spent"""
+    from cohere.errors import TooManyRequestsError
+    from ensemble_phase_2_poc.inference.retry import call_with_retry
+
+    def rate_limited(retry_after):
+        def call():
+            calls.append(1)
+            raise _rate_limited(retry_after)
+        return call
+
+    retry_policy(max_tries=3, failure_threshold=100)
+    calls = []
+    with pytest.raises(TooManyRequestsError, match="slow down"):
+        call_with_retry("cohere", "m", rate_limited("1"))
+    assert len(calls) == 3
+
+    retry_policy(max_tries=3, max_delay=5, failure_threshold=100)
+    calls = []
+    with pytest.raises(TooManyRequestsError, match="slow down"):
+        call_with_retry("cohere", "m", rate_limited("120"))
+    assert len(calls) == 1
+
+    retry_policy(max_tries=10, retry_budget_min=2, retry_budget_ratio=0.0, failure_threshold=100)
+    calls = []
+    with pytest.raises(TooManyRequestsError, match="slow down"):
+        call_with_retry("cohere", "m", rate_limited("1"))
+    assert len(calls) == 3
+
+
+def test_circuit_breaker(retry_policy):
+    """Opens after consecutive failures, fails fast, and closes after a successful probe"""
+    from cohere.errors import TooManyRequestsError
+    from ensemble_phase_2_poc.inference.retry import (
+        CIRCUIT_TRANSITIONS,
+        CircuitOpenError,
+        call_with_retry,
+        get_circuit_breaker,
+    )
+
+    def outage():
+        calls.append(1)
+        raise _rate_limited("0")
+
+    retry_policy(max_tries=1, failure_threshold=2, reset_timeout=60)
+    calls = []
+    for _ in range(2):
+        with pytest.raises(TooManyRequestsError, match="slow down"):
+            call_with_retry("openai", "m", outage)
+    with pytest.raises(CircuitOpenError):
+        call_with_retry("openai", "m", outage)
+    assert len(calls) == 2
+    assert get_circuit_breaker("openai").state == "open"
+
+    # Once the cool-down has passed, one probe is let through
+    get_circuit_breaker("openai").reset_timeout = 0
+    assert call_with_retry("openai", "m", lambda: "recovered") == "recovered"
+    assert get_circuit_breaker("openai").state == "closed"
+    assert CIRCUIT_TRANSITIONS.labels("openai", "closed", "open").value >= 1
+    assert CIRCUIT_TRANSITIONS.labels("openai", "half_open", "closed").value >= 1
+
+
+# Every provider model, the simulated one included, retries through the policy
+def test_simulated_model_retries(retry_policy):
+    from cohere.errors import TooManyRequestsError
+    from langchain_core.messages import HumanMessage
+    from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+    retry_policy(max_tries=3, failure_threshold=100)
+    model = SimulatedChatModel(latency_distribution="fixed", latency_mean_ms=0, rate_limit_rate=1.0, retry_after_seconds=0.5)
+    with pytest.raises(TooManyRequestsError, match="simulated rate limit"):
+        model.invoke([HumanMessage(content="hi")])
+    assert [call.args[0] for call in retry_policy.sleep.call_args_list if call.args[0]] == [0.5, 0.5]
+
+
+# Hedged requests (inference/hedging.py)
+
+@pytest.fixture
+def hedging():
+    """Enable hedging with a primed latency history of 20ms calls"""
+    from ensemble_phase_2_poc.inference.hedging import latency_window
+
+    policy = ChatFactory.configure_hedging(min_delay=0.05, min_samples=5, max_hedge_ratio=1.0)
+    window = latency_window("simulated", "hedged")
+    for _ in range(policy.min_samples):
+        window.record(0.02)
+    yield policy
+    ChatFactory.disable_hedging()
+
+
+def _slow_then_fast(model):
+    """First attempt takes 2s, any later one 10ms"""
+    from unittest.mock import patch
+    return patch.object(type(model), "_draw", side_effect=[(2.0, None), (0.01, None)], autospec=True)
+
+
+# A slow call is raced against a duplicate, and the faster answer is returned
+@pytest.mark.parametrize("use_async", [False, True])
+def test_hedged_request_wins(hedging, use_async):
+    import asyncio
+    import time
+    from langchain_core.messages import HumanMessage
+    from ensemble_phase_2_poc.inference.hedging import HEDGES_FIRED, HEDGES_WON
+    from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+    model = SimulatedChatModel(model="hedged", script=["answer"])
+    fired, won = HEDGES_FIRED.labels("simulated", "hedged").value, HEDGES_WON.labels("simulated", "hedged").value
+
+    start = time.perf_counter()
+    with _slow_then_fast(model):
+        if use_async:
+            response = asyncio.run(model.ainvoke([HumanMessage(content="hi")]))
+        else:
+            response = model.invoke([HumanMessage(content="hi")])
+
+    assert response.content == "answer"
+    assert time.perf_counter() - start < 1.0
+    assert HEDGES_FIRED.labels("simulated", "hedged").value == fired + 1
+    assert HEDGES_WON.labels("simulated", "hedged").value == won + 1
+
+
+# Only the answer that was used is recorded, not the duplicate request
+@pytest.mark.parametrize("use_async", [False, True])
+def test_hedged_request_usage_counted_once(hedging, use_async):
+    import asyncio
+    import time
+    from unittest.mock import patch
+    from langchain_core.messages import HumanMessage
+    from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+    from ensemble_phase_2_poc.metrics import LLM_CALLS, LLM_DURATION
+    from ensemble_phase_2_poc.telemetry import track_usage
+
+    model = SimulatedChatModel(model="hedged", script=["answer"])
+    calls, observed = LLM_CALLS.labels("simulated", "hedged").value, sum(LLM_DURATION.labels("simulated", "hedged").counts)
+
+    # The losing request finishes within the test, so anything it recorded would show
+    draws = [(0.3, None), (0.01, None)]
+    with patch.object(type(model), "_draw", side_effect=draws, autospec=True), track_usage() as usage:
+        if use_async:
+            response = asyncio.run(model.ainvoke([HumanMessage(content="hi")]))
+        else:
+            response = model.invoke([HumanMessage(content="hi")])
+        time.sleep(0.5)
+
+    assert usage.llm_calls == 1
+    assert usage.retries == 0
+    assert usage.output_tokens == response.usage_metadata["output_tokens"]
+    assert LLM_CALLS.labels("simulated", "hedged").value == calls + 1
+    assert sum(LLM_DURATION.labels("simulated", "hedged").counts) == observed + 1
+
+
+# With the hedge budget spent, slow calls just wait for the primary request
+def test_hedge_budget(hedging):
+    from langchain_core.messages import HumanMessage
+    from ensemble_phase_2_poc.inference.hedging import HEDGES_SKIPPED, latency_window
+    from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+    ChatFactory.configure_hedging(min_delay=0.01, min_samples=1, max_hedge_ratio=0.0)
+    latency_window("simulated", "hedged").record(0.001)
+    skipped = HEDGES_SKIPPED.labels("simulated", "hedged").value
+
+    model = SimulatedChatModel(model="hedged", latency_distribution="fixed", latency_mean_ms=100, script=["ok"])
+    assert model.invoke([HumanMessage(content="hi")]).content == "ok"
+    assert HEDGES_SKIPPED.labels("simulated", "hedged").value == skipped + 1
+
+
+def test_hedging_off_by_default(monkeypatch):
+    from ensemble_phase_2_poc.inference import hedging
+
+    monkeypatch.delenv("ENSEMBLE_LLM_HEDGING", raising=False)
+    monkeypatch.setattr(hedging, "_STATE", hedging._HedgingState())
+    assert hedging.get_hedging_policy() is None
+
+    monkeypatch.setenv("ENSEMBLE_LLM_HEDGING", '{"percentile": 0.99}')
+    monkeypatch.setattr(hedging, "_STATE", hedging._HedgingState())
+    assert hedging.get_hedging_policy().percentile == 0.99
+    with pytest.raises(ValueError, match="Unknown Hedging policy fields"):
+        hedging.parse_hedging_policy('{"quantile": 0.99}')
+
+
+# Client-side rate limits (inference/rate_limit.py)
+
+def test_token_bucket_math():
+    from ensemble_phase_2_poc.inference.rate_limit import _take
+
+    # Full bucket of 60/min: take 50, then 20 more needs 10 tokens = 10s of refill
+    wait, levels = _take({}, [("k:rpm", 60, 50)], now=0.0)
+    assert wait == 0 and levels == {"k:rpm": (10, 0.0)}
+    wait, unchanged = _take(levels, [("k:rpm", 60, 20)], now=0.0)
+    assert wait == pytest.approx(10.0) and unchanged == {}
+    wait, levels = _take(levels, [("k:rpm", 60, 20)], now=10.0)
+    assert wait == 0 and levels == {"k:rpm": (0, 10.0)}
+
+    # All or nothing across buckets; an oversized request waits for a full bucket and goes into debt
+    wait, unchanged = _take({"a": (100, 0.0)}, [("a", 100, 1), ("b", 10, 20)], now=0.0)
+    assert wait == 0 and unchanged["b"] == (-10, 0.0)
+
+
+def test_rate_limiter_shared_store(tmp_path):
+    """Limiters opened on the same file, in this or another process, share one set of buckets"""
+    import subprocess
+    import sys
+    from ensemble_phase_2_poc.inference.rate_limit import RateLimit, RateLimiter
+
+    limits = {"cohere": RateLimit(requests_per_minute=3)}
+    first = RateLimiter(limits, path=tmp_path / "buckets.db")
+    second = RateLimiter(limits, path=tmp_path / "buckets.db")
+    assert first.try_acquire("cohere", "command-a", "key", 0) == 0
+    assert second.try_acquire("cohere", "command-a", "key", 0) == 0
+
+    script = (
+        "from ensemble_phase_2_poc.inference.rate_limit import RateLimit, RateLimiter;"
+        f"limiter = RateLimiter({{'cohere': RateLimit(requests_per_minute=3)}}, path={str(tmp_path / 'buckets.db')!r});"
+        "print(limiter.try_acquire('cohere', 'command-a', 'key', 0))"
+    )
+    assert float(subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout) == 0
+    assert first.try_acquire("cohere", "command-a", "key", 0) > 0
+
+    # Other API keys and unlisted providers have their own buckets, or none
+    assert first.try_acquire("cohere", "command-a", "other-key", 0) == 0
+    assert first.try_acquire("openai", "gpt-4o", "key", 0) == 0
+
+
+def test_rate_limiter_aacquire_keeps_event_loop_running(tmp_path):
+    """While another process holds the SQLite file, waiting for it doesn't block other coroutines"""
+    import asyncio
+    import sqlite3
+    import threading
+    from ensemble_phase_2_poc.inference.rate_limit import RateLimit, RateLimiter
+
+    limiter = RateLimiter({"cohere": RateLimit(requests_per_minute=3)}, path=tmp_path / "buckets.db")
+    other = sqlite3.connect(tmp_path / "buckets.db", isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.3, other.execute, ("COMMIT",)).start()
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        waited = await limiter.aacquire("cohere", "command-a", "key", 0)
+        ticker.cancel()
+        return waited, ticks
+
+    waited, ticks = asyncio.run(main())
+    other.close()
+    assert waited >= 0.25
+    assert ticks >= 10
+
+
+def test_parse_rate_limits():
+    from ensemble_phase_2_poc.inference.rate_limit import RateLimit, parse_rate_limits
+
+    assert parse_rate_limits('{"cohere": {"requests_per_minute": 60}}') == {"cohere": RateLimit(requests_per_minute=60)}
+    with pytest.raises(ValueError, match="Unknown Rate limit for cohere fields"):
+        parse_rate_limits('{"cohere": {"rpm": 60}}')
+    with pytest.raises(ValueError, match="Rate limit for cohere must be a JSON object"):
+        parse_rate_limits('{"cohere": 60}')
+
+
+def test_rate_limiter_reconcile():
+    """Estimated tokens are corrected once the real usage is known"""
+    from ensemble_phase_2_poc.inference.rate_limit import RateLimit, RateLimiter
+
+    limiter = RateLimiter({"cohere/command-a": RateLimit(tokens_per_minute=1000)})
+    assert limiter.try_acquire("cohere", "command-a", "key", 600) == 0
+    assert limiter.try_acquire("cohere", "command-a", "key", 600) > 0
+    limiter.reconcile("cohere", "command-a", "key", estimated=600, actual=100)
+    assert limiter.try_acquire("cohere", "command-a", "key", 600) == 0
+
+
+def test_simulated_model_rate_limited():
+    from langchain_core.messages import HumanMessage
+    from ensemble_phase_2_poc.inference.rate_limit import get_rate_limiter
+    from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+    ChatFactory.configure_rate_limits({"simulated/limited": {"requests_per_minute": 1, "tokens_per_minute": 10_000}})
+    try:
+        model = SimulatedChatModel(model="limited", latency_distribution="fixed", latency_mean_ms=0, script=["ok"])
+        response = model.invoke([HumanMessage(content="hi")])
+
+        limiter = get_rate_limiter()
+        # The request slot is spent, and the token reservation was reconciled to the reported usage
+        assert limiter.try_acquire("simulated", "limited", "default", 0) > 0
+        tokens = limiter._store.transact(["simulated/limited/default:tpm"], lambda levels: (levels, {}))
+        assert tokens["simulated/limited/default:tpm"][0] == pytest.approx(
+            10_000 - response.usage_metadata["total_tokens"], abs=1
+        )
+    finally:
+        ChatFactory.disable_rate_limits()
+
+
+# Per-node model routing (ModelRouter in inference/router.py)
+
+@pytest.fixture
+def router(monkeypatch):
+    """Routing config from each test; the default router is rebuilt afterwards"""
+    from ensemble_phase_2_poc.inference.router import parse_router_config
+
+    monkeypatch.setattr(ChatFactory, "_router", None)
+    monkeypatch.delenv("ENSEMBLE_SIMULATE_LLM", raising=False)
+    monkeypatch.setenv("COHERE_API_KEY", "cohere-key")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    return lambda config: ChatFactory.configure_router(parse_router_config(config))
+
+
+def test_router_resolves_tiers(router):
+    """Nodes get their tier's model, node overrides win, and models without an API key are skipped"""
+    router("""{
+        "tiers": {"small": ["openai/gpt-4.1-nano", "cohere/command-r7b-12-2024"]},
+        "nodes": {"account_note_agent": "small", "resolution_agent": "openai/gpt-4.1"}
+    }""")
+
+    model, middleware = ChatFactory.route("triage_agent", "small")
+    assert (model.model, model.cohere_api_key.get_secret_value()) == ("command-r7b-12-2024", "cohere-key")
+    assert middleware == []
+    assert ChatFactory.route("account_note_agent", "large")[0].model == "command-r7b-12-2024"
+    assert ChatFactory.route("account_research_agent", "large")[0].model == "command-a-03-2025"
+
+    with pytest.raises(ValueError, match="OPENAI_API_KEY"):
+        ChatFactory.route("resolution_agent", "large")
+    with pytest.raises(ValueError, match="Unknown tier"):
+        ChatFactory.route("triage_agent", "medium")
+    with pytest.raises(ValueError, match=r"Unknown Router config fields: \['node'\]"):
+        router('{"node": {"triage_agent": "large"}}')
+
+
+def test_router_selection(router):
+    """The cheapest model within the latency budget wins; over budget, the fastest"""
+    from ensemble_phase_2_poc.inference.router import ModelRoute
+
+    active = router("""{"tiers": {"small": {"models": ["cohere/command-a-03-2025", "cohere/command-r7b-12-2024"], "max_latency": 2.0}}}""")
+    tier, candidates = active.candidates("triage_agent", "small")
+    large, small = ModelRoute.parse("cohere/command-a-03-2025"), ModelRoute.parse("cohere/command-r7b-12-2024")
+
+    assert active.select(tier, candidates) == small
+    active.record_latency(small, 5.0)
+    assert active.select(tier, candidates) == large
+    active.record_latency(large, 9.0)
+    assert active.select(tier, candidates) == small
+
+
+def test_routed_agent_reselects_per_call(router, monkeypatch):
+    """A multi-model tier routes each call through RoutingMiddleware and records its latency"""
+    from langchain.agents import create_agent
+    from ensemble_phase_2_poc.inference.router import ModelRoute
+
+    monkeypatch.setenv("ENSEMBLE_SIMULATE_LLM", '{"latency_distribution": "fixed", "latency_mean_ms": 0}')
+    active = router("""{"tiers": {"small": {"models": ["cohere/command-r7b-12-2024", "cohere/command-a-03-2025"], "max_latency": 1.0}}}""")
+    model, middleware = ChatFactory.route("triage_agent", "small")
+    agent = create_agent(model=model, tools=[], middleware=middleware)
+    assert model.model == "command-r7b-12-2024"
+
+    active.record_latency(ModelRoute("cohere", "command-r7b-12-2024"), 3.0)
+    result = agent.invoke({"messages": [{"role": "user", "content": "hi"}]})
+
+    assert result["messages"][-1].response_metadata["model_name"] == "command-a-03-2025"
+    assert active.latency(ModelRoute("cohere", "command-a-03-2025")) is not None
@@ -0,0 +1,197 @@
+"""Tests for ensemble_phase_2_poc.metrics module."""
+
+import os
+import urllib.request
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from ensemble_phase_2_poc import metrics
+from ensemble_phase_2_poc.metrics import FileExporter, MetricsRegistry, start_http_server
+
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry()
+    registry.counter("requests", "Requests served", ("route",)).labels("/a").inc(3)
+    histogram = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.labels("/a").observe(value)
+    registry.gauge("in_flight", "Requests running").labels().set(2)
+    return registry
+
+
+class TestRegistry:
+    """Test metric recording and the Prometheus text format."""
+
+    def test_render(self, registry):
+        """Counters get a _total suffix, histogram buckets are cumulative"""
+        lines = registry.render().splitlines()
+
+        assert "# TYPE requests counter" in lines
+        assert 'requests_total{route="/a"} 3' in lines
+        assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{route="/a",le="1"} 2' in lines
+        assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+        assert 'latency_seconds_count{route="/a"} 3' in lines
+        assert 'latency_seconds_sum{route="/a"} 5.55' in lines
+        assert "in_flight 2" in lines
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        registry.counter("errors", "Errors", ("message",)).labels('bad "quote"\n').inc()
+        assert 'errors_total{message="bad \\"quote\\"\\n"} 1' in registry.render()
+
+    def test_invalid_usage(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("calls", "Calls", ("provider",))
+        with pytest.raises(ValueError):
+            counter.labels("cohere", "extra")
+        with pytest.raises(ValueError):
+            counter.labels("cohere").inc(-1)
+        with pytest.raises(ValueError):
+            registry.counter("calls", "Duplicate")
+
+    def test_track_records_failures(self):
+        registry = MetricsRegistry()
+        duration = registry.histogram("op_seconds", "Op latency", ("op",))
+        in_flight = registry.gauge("ops_in_flight", "Ops running", ("op",))
+        failures = registry.counter("op_failures", "Op failures", ("op",))
+
+        with pytest.raises(RuntimeError):
+            with metrics.track(duration, in_flight, failures, "load"):
+                assert in_flight.labels("load").value == 1
+                raise RuntimeError("boom")
+
+        assert in_flight.labels("load").value == 0
+        assert failures.labels("load").value == 1
+        assert 'op_seconds_count{op="load"} 1' in registry.render()
+
+    def test_merged_snapshots_are_summed(self, registry):
+        """Another process's snapshot is added to local series; a newer one replaces it"""
+        worker = MetricsRegistry()
+        worker.counter("requests", "Requests served", ("route",)).labels("/a").inc(2)
+        histogram = worker.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+        histogram.labels("/b").observe(0.5)
+
+        registry.merge(1234, worker.snapshot())
+        registry.merge(1234, worker.snapshot())
+        lines = registry.render().splitlines()
+
+        assert 'requests_total{route="/a"} 5' in lines
+        assert 'latency_seconds_count{route="/a"} 3' in lines
+        assert 'latency_seconds_bucket{route="/b",le="1"} 1' in lines
+        assert lines.count("# TYPE requests counter") == 1
+
+        registry.clear()
+        assert "requests_total" not in registry.render()
+
+    def test_metric_types_define_their_series(self):
+        with pytest.raises(TypeError):
+            metrics.Metric("bare", "No series type")
+
+
+class TestExporters:
+    """Test the HTTP endpoint and file exporter."""
+
+    def test_http_endpoint(self, registry):
+        server = start_http_server(0, registry=registry)
+        try:
+            # Local only unless a host is given
+            assert server.server_address[0] == "127.0.0.1"
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+                assert 'requests_total{route="/a"} 3' in response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_file_exporter(self, registry, tmp_path):
+        """The path may carry {pid}; stop() writes a final snapshot"""
+        exporter = FileExporter(tmp_path / "metrics-{pid}.prom", interval=60, registry=registry)
+        exporter.stop()
+
+        path = tmp_path / f"metrics-{os.getpid()}.prom"
+        assert 'requests_total{route="/a"} 3' in path.read_text()
+        assert not list(tmp_path.glob(".*.tmp"))
+
+
+class TestInstrumentation:
+    """Test the metrics recorded by LLM calls, nodes and workflows."""
+
+    @pytest.fixture(autouse=True)
+    def clean_registry(self):
+        metrics.REGISTRY.clear()
+        yield
+        metrics.REGISTRY.clear()
+
+    def test_llm_calls_and_tokens(self):
+        """Every chat model call is recorded without passing callbacks"""
+        from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+        model = SimulatedChatModel(model="sim-1", latency_distribution="fixed", latency_mean_ms=0)
+        model.invoke([HumanMessage(content="hello there")])
+
+        assert metrics.LLM_CALLS.labels("simulated", "sim-1").value == 1
+        assert metrics.LLM_TOKENS.labels("simulated", "sim-1", "output").value > 0
+        assert metrics.LLMS_IN_FLIGHT.labels("simulated", "sim-1").value == 0
+
+    def test_llm_metrics_handler_can_be_swapped(self):
+        """A context can record with its own handler; other threads keep the process-wide one"""
+        import threading
+        from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+        class RecordingHandler(metrics.LLMMetricsHandler):
+            def __init__(self):
+                super().__init__()
+                self.ended = 0
+
+            def on_llm_end(self, response, **kwargs):
+                self.ended += 1
+
+        model = SimulatedChatModel(model="sim-1", latency_distribution="fixed", latency_mean_ms=0)
+        with metrics.llm_metrics_handler(RecordingHandler()) as handler:
+            model.invoke([HumanMessage(content="hello")])
+            # A new thread starts from an empty context
+            thread = threading.Thread(target=model.invoke, args=([HumanMessage(content="hello")],))
+            thread.start()
+            thread.join()
+
+        assert handler.ended == 1
+        assert metrics.LLM_CALLS.labels("simulated", "sim-1").value == 1
+
+    def test_llm_failures(self):
+        from cohere.errors import TooManyRequestsError
+        from ensemble_phase_2_poc.inference.retry import RetryPolicy, configure_retry
+        from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+        model = SimulatedChatModel(model="sim-1", latency_distribution="fixed", latency_mean_ms=0, rate_limit_rate=1.0)
+        configure_retry(RetryPolicy(max_tries=1))
+        try:
+            with pytest.raises(TooManyRequestsError, match="simulated rate limit"):
+                model.invoke([HumanMessage(content="hello")])
+        finally:
+            configure_retry()
+
+        assert metrics.LLM_FAILURES.labels("simulated", "sim-1", "TooManyRequestsError").value == 1
+        assert metrics.LLMS_IN_FLIGHT.labels("simulated", "sim-1").value == 0
+
+    def test_node_and_workflow_latency(self):
+        from ensemble_phase_2_poc.agents import AccountNoteAgent, AccountResearchAgent, ResolutionAgent, TriageAgent
+        from ensemble_phase_2_poc.workflow import SequentialAccountResolutionWorkflow
+        from mlflow.types.responses import ResponsesAgentRequest
+
+        with patch.object(AccountResearchAgent, "execute", lambda self, prompt, state: "summary"), \
+             patch.object(TriageAgent, "execute", lambda self, prompt, state: "agent"), \
+             patch.object(ResolutionAgent, "execute", lambda self, prompt, state: "adjusted"), \
+             patch.object(AccountNoteAgent, "execute", lambda self, prompt, state: "noted"):
+            SequentialAccountResolutionWorkflow().predict(
+                ResponsesAgentRequest(input=[], custom_inputs={"account_number": "ACC-1"})
+            )
+
+        rendered = metrics.REGISTRY.render()
+        assert 'ensemble_node_duration_seconds_count{node_id="resolution_agent"} 1' in rendered
+        assert 'ensemble_workflow_duration_seconds_count{workflow="SequentialAccountResolutionWorkflow"} 1' in rendered
+        assert 'ensemble_nodes_in_flight{node_id="resolution_agent"} 0' in rendered
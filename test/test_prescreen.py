@@ -0,0 +1,86 @@
+"""Tests for ensemble_phase_2_poc.prescreen module."""
+
+from unittest.mock import patch
+
+import pytest
+from mlflow.types.responses import ResponsesAgentRequest
+
+from ensemble_phase_2_poc.prescreen import (
+    AccountColumns,
+    PrescreenReport,
+    PrescreenRules,
+    evaluate,
+    parse_prescreen_rules,
+)
+
+
+RECORDS = [
+    {"account_number": "ACC-1", "lob": "Acute", "total_outstanding": 49.0, "notes": [{"text": "adjust"}]},
+    {"account_number": "ACC-2", "lob": "Acute", "total_outstanding": "0.00", "notes": "[]"},
+    {"account_number": "ACC-3", "lob": "Behavioral", "total_outstanding": 10.0},
+    {"account_number": "ACC-4", "lob": "Acute", "total_outstanding": -25.0, "notes": 0},
+    {"account_number": "ACC-5", "lob": "Acute", "total_outstanding": "", "notes": ""},
+]
+
+
+class TestRules:
+    """Test vectorized rule evaluation."""
+
+    def test_columns_mark_missing_fields(self):
+        columns = AccountColumns.from_records(RECORDS)
+        assert columns.note_count.tolist() == [1, 0, -1, 0, -1]
+        assert columns.total_outstanding[4] != columns.total_outstanding[4]  # NaN
+
+    def test_first_matching_rule_wins(self):
+        """Rules only act on fields a record carries; missing balance or notes never screen"""
+        rules = PrescreenRules(excluded_lobs=("Behavioral",))
+        assert evaluate(AccountColumns.from_records(RECORDS), rules).tolist() == [
+            "", "zero_balance", "lob_out_of_scope", "no_notes", "",
+        ]
+
+    def test_rules_can_be_relaxed(self):
+        rules = PrescreenRules(min_outstanding=0.0, screen_without_notes=False)
+        assert not evaluate(AccountColumns.from_records(RECORDS), rules).any()
+
+    def test_parse_rules(self):
+        assert parse_prescreen_rules("1") == PrescreenRules()
+        assert parse_prescreen_rules('{"excluded_lobs": ["Behavioral"]}').excluded_lobs == ("Behavioral",)
+        with pytest.raises(ValueError):
+            parse_prescreen_rules('{"min_outstanding": -1}')
+        with pytest.raises(ValueError, match="Unknown Pre-screen rules fields"):
+            parse_prescreen_rules('{"excluded_lob": ["Behavioral"]}')
+
+
+class TestReport:
+    """Test the LLM call savings estimate."""
+
+    def test_savings_use_observed_calls(self):
+        report = PrescreenReport()
+        report.record_screened(evaluate(AccountColumns.from_records(RECORDS), PrescreenRules()))
+        assert report.screened == 2
+        assert report.llm_calls_saved == 4  # nothing observed yet: research + triage, one call each
+
+        usage = {"nodes": {"account_research_agent": {"llm_calls": 2}, "triage_agent": {"llm_calls": 1}}}
+        report.observe({"usage": usage})
+        assert report.llm_calls_saved == 6
+
+
+class TestPredictBatch:
+    """Test pre-screening in predict_batch()."""
+
+    def test_screened_accounts_skip_the_workflow(self):
+        from ensemble_phase_2_poc.agents import AccountNoteAgent, AccountResearchAgent, ResolutionAgent, TriageAgent
+        from ensemble_phase_2_poc.workflow import BranchingAccountResolutionWorkflow
+
+        requests = [ResponsesAgentRequest(input=[], custom_inputs=record) for record in RECORDS[:2]]
+        with patch.object(AccountResearchAgent, "execute", lambda self, prompt, state: "summary"), \
+             patch.object(TriageAgent, "execute", lambda self, prompt, state: "human"), \
+             patch.object(ResolutionAgent, "execute", lambda self, prompt, state: "adjusted"), \
+             patch.object(AccountNoteAgent, "execute", lambda self, prompt, state: "noted"):
+            result = BranchingAccountResolutionWorkflow().predict_batch(requests, prescreen=PrescreenRules())
+
+        assert [r.custom_outputs["account_number"] for r in result.responses] == ["ACC-1", "ACC-2"]
+        assert result.responses[0].custom_outputs["execution_path"] == ["account_research_agent", "triage_agent"]
+        assert result.responses[1].custom_outputs["execution_path"] == ["prescreen"]
+        assert result.responses[1].custom_outputs["node_outputs"] == {"prescreen": "human"}
+        assert result.prescreen["screened_by_rule"] == {"zero_balance": 1}
@@ -1,9 +1,17 @@
 """Tests for ensemble_phase_2_poc.tools module."""
 
+import asyncio
+import json
+import time
+
 import pytest
 from unittest.mock import patch, mock_open
 from ensemble_phase_2_poc.tools import GetAccountData, PostAccountNote, PostContractualAdjustment
-from ensemble_phase_2_poc.tools.base_tool import Tool
+from ensemble_phase_2_poc.tools.base_tool import (
+    Tool,
+    load_tool_descriptions,
+    validate_tool_descriptions,
+)
 
 
 MOCK_DESCRIPTIONS_YAML = """
@@ -29,6 +37,32 @@ class TestToolBase:
             Tool.get_tool_description("unknown_tool")
 
 
+    def test_alternate_descriptions_file(self, tmp_path):
+        """Alternate description files are parsed once and served read-only"""
+        path = tmp_path / "descriptions.yaml"
+        path.write_text(MOCK_DESCRIPTIONS_YAML.replace("Post an adjustment", "Post a contractual adjustment"))
+
+        assert Tool.get_tool_description("post_contractual_adjustment", path) == "Post a contractual adjustment"
+        with patch("builtins.open") as mocked_open:
+            Tool.get_tool_description("post_account_note", path)
+            mocked_open.assert_not_called()
+
+        with pytest.raises(TypeError):
+            load_tool_descriptions(path)["get_account_data"] = "changed"
+
+    def test_registered_tools_match_descriptions(self):
+        """Every shipped tool is registered and described"""
+        assert {"get_account_data", "post_contractual_adjustment", "post_account_note"} <= set(Tool.registered_tools)
+        validate_tool_descriptions(["get_account_data", "post_contractual_adjustment", "post_account_note"])
+
+    def test_validate_reports_drift(self, tmp_path):
+        """Missing and stale descriptions are both reported"""
+        path = tmp_path / "descriptions.yaml"
+        path.write_text('get_account_data: "Get data"\nretired_tool: "Old tool"\n')
+        with pytest.raises(ValueError, match=r"without a description: \['post_account_note'\].*without a tool: \['retired_tool'\]"):
+            validate_tool_descriptions(["get_account_data", "post_account_note"], path)
+
+
 class TestGetAccountData:
     """Test GetAccountData tool."""
 
@@ -158,4 +192,169 @@ class TestPostContractualAdjustment:
         assert len(result) == 1
         assert result[0]["status"] == "success"
         assert result[0]["account_number"] == "ACC-789"
-        assert result[0]["transaction_id"] == "TXN-100"
\ No newline at end of file
+        assert result[0]["transaction_id"] == "TXN-100"
+
+    def test_arun_matches_run(self):
+        """_arun delegates to the same tool logic as _run"""
+        tool = PostContractualAdjustment(
+            account_number="ACC-789",
+            client_name="Client",
+            facility_prefix="FAC",
+            lob="Acute",
+        )
+        result = asyncio.run(tool._arun(transaction_id="TXN-100"))
+        assert result == tool._run(transaction_id="TXN-100")
+
+class TestSpeculationGate:
+    """Test that side-effecting tools wait for speculative runs to be decided."""
+
+    def tool(self):
+        return PostContractualAdjustment(
+            account_number="ACC-789", client_name="Client", facility_prefix="FAC", lob="Acute"
+        )
+
+    def test_only_side_effecting_tools_are_held(self):
+        assert PostContractualAdjustment.has_side_effects and PostAccountNote.has_side_effects
+        assert not GetAccountData.has_side_effects
+
+    def test_held_until_confirmed(self):
+        """Under a speculation the tool doesn't run until confirm()"""
+        from ensemble_phase_2_poc.speculation import Speculation
+
+        tool = self.tool()
+        with patch.object(PostContractualAdjustment, "_execute", return_value=[]) as execute:
+            speculation = Speculation("resolution_agent").start(lambda _: tool._run(transaction_id="TXN-1"), None)
+            time.sleep(0.05)
+            execute.assert_not_called()
+            assert speculation.confirm() == []
+        execute.assert_called_once_with(transaction_id="TXN-1")
+        assert speculation.summary()["outcome"] == "hit"
+
+    def test_rejected_aborts(self):
+        """A discarded speculation raises SpeculationAborted instead of running the tool"""
+        from ensemble_phase_2_poc.speculation import Speculation, SpeculationAborted
+
+        tool = self.tool()
+        with patch.object(PostContractualAdjustment, "_execute") as execute:
+            speculation = Speculation("resolution_agent").start(lambda _: tool._run(transaction_id="TXN-1"), None)
+            time.sleep(0.05)
+            speculation.discard()
+            assert isinstance(speculation._future.exception(timeout=5), SpeculationAborted)
+        execute.assert_not_called()
+
+        async def arun():
+            speculation = Speculation("resolution_agent").astart(lambda _: tool._arun(transaction_id="TXN-1"), None)
+            await asyncio.sleep(0)
+            speculation.discard()
+            with pytest.raises(asyncio.CancelledError):
+                await speculation._task
+
+        asyncio.run(arun())
+
+    def test_queued_run_discarded_before_it_starts(self, monkeypatch):
+        """A sync run still waiting for a speculation thread never starts once discarded"""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from ensemble_phase_2_poc import speculation as module
+
+        monkeypatch.setattr(module, "_EXECUTOR", ThreadPoolExecutor(max_workers=1))
+        release, ran = threading.Event(), []
+        busy = module.Speculation("resolution_agent").start(lambda _: release.wait(), None)
+        queued = module.Speculation("resolution_agent").start(ran.append, "state")
+        queued.discard()
+        release.set()
+        busy.confirm()
+
+        assert queued._future.cancelled()
+        assert ran == []
+
+
+class TestOutputEncoding:
+    """Compact encoding of tool outputs for the consuming node"""
+
+    @pytest.fixture
+    def account(self):
+        return GetAccountData()._execute()
+
+    def test_fields_are_projected_through_lists(self, account):
+        from ensemble_phase_2_poc.tools.encoding import OutputEncoding, encode_tool_output
+
+        encoding = OutputEncoding(fields=("claims.claim_id", "claims.procedure_codes.cpt"), tabular=False)
+        assert json.loads(encode_tool_output(account, encoding)) == [
+            {
+                "claims": [
+                    {"claim_id": "CLM-2025-098765", "procedure_codes": [{"cpt": "99214"}, {"cpt": "36415"}, {"cpt": "80053"}]}
+                ]
+            }
+        ]
+
+    def test_records_are_tabulated_and_empty_values_dropped(self, account):
+        from ensemble_phase_2_poc.tools.encoding import OutputEncoding, encode_tool_output
+
+        encoded = encode_tool_output(account, OutputEncoding())
+        data = json.loads(encoded)[0]
+        assert "secondary" not in data["insurance"]
+        codes = data["claims"][0]["procedure_codes"]
+        assert codes["columns"] == ["cpt", "description", "units", "charge"]
+        assert codes["rows"][0] == ["99214", "Office visit, established patient", 1, 185.0]
+        assert encoded == json.dumps(json.loads(encoded), ensure_ascii=False, separators=(",", ":"))
+        assert len(encoded) < len(json.dumps(account))
+
+    def test_budget_drops_list_items_then_shortens_strings(self, account):
+        from ensemble_phase_2_poc.tools.encoding import OutputEncoding, encode_tool_output, estimate_tokens
+
+        encoding = OutputEncoding(fields=("claims.procedure_codes", "notes.text"), max_tokens=75)
+        encoded = encode_tool_output(account, encoding)
+        assert estimate_tokens(encoded) <= 75
+        body, trailer = encoded.split("\n")
+        assert json.loads(body) == [
+            {
+                "claims": [{"procedure_codes": [{"cpt": "99214", "description": "Office visit, established patient", "units": 1, "charge": 185.0}]}],
+                "notes": [{"text": "Need to post a contractual adjustment at tr…"}],
+            }
+        ]
+        assert "claims.procedure_codes items: 2" in trailer
+        assert "truncated strings: 1" in trailer
+
+    def test_unreachable_budget_is_best_effort(self, account):
+        from ensemble_phase_2_poc.tools.encoding import OutputEncoding, encode_tool_output
+
+        encoded = encode_tool_output(account, OutputEncoding(fields=("account_number",), max_tokens=1))
+        assert json.loads(encoded) == [{"account_number": "ACC-12345"}]
+
+    def test_parse_encodings(self, tmp_path):
+        from ensemble_phase_2_poc.tools.encoding import (
+            DEFAULT_OUTPUT_ENCODINGS,
+            OutputEncoding,
+            parse_output_encodings,
+        )
+
+        assert parse_output_encodings("1") == DEFAULT_OUTPUT_ENCODINGS
+        config = {"account_research_agent": {"get_account_data": {"fields": ["balance"], "max_tokens": 100}}}
+        path = tmp_path / "encodings.json"
+        path.write_text(json.dumps(config))
+        encodings = parse_output_encodings(str(path))
+        assert encodings[("account_research_agent", "get_account_data")] == OutputEncoding(fields=("balance",), max_tokens=100)
+        with pytest.raises(ValueError):
+            parse_output_encodings('{"account_research_agent": []}')
+        with pytest.raises(ValueError):
+            parse_output_encodings('{"a": {"b": {"max_tokens": 0}}}')
+        with pytest.raises(ValueError, match="Unknown Output encoding for a/b fields"):
+            parse_output_encodings('{"a": {"b": {"budget": 100}}}')
+
+    def test_run_encodes_for_the_calling_node(self, account, monkeypatch):
+        from ensemble_phase_2_poc.telemetry import track_node_usage
+
+        monkeypatch.setenv("ENSEMBLE_TOOL_OUTPUT_ENCODING", "1")
+        tool = GetAccountData()
+        assert tool._run() == account
+        with track_node_usage("resolution_agent"):
+            assert tool._run() == account
+        with track_node_usage("account_research_agent") as usage:
+            encoded = tool._run()
+        assert isinstance(encoded, str)
+        assert "Maria" not in encoded and "512-555-0147" not in encoded
+        metadata = usage.as_metadata()
+        assert metadata["tool_output_tokens"] == -(-len(encoded) // 4)
+        assert metadata["tool_output_tokens_saved"] == -(-len(json.dumps(account)) // 4) - metadata["tool_output_tokens"]
+        assert metadata["tool_output_tokens_saved"] > 0
@@ -0,0 +1,548 @@
+"""Tests for ensemble_phase_2_poc.workflow module."""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from unittest.mock import patch
+from mlflow.types.responses import ResponsesAgentRequest
+
+from ensemble_phase_2_poc.agents import (
+    AccountResearchAgent,
+    AccountNoteAgent,
+    ResolutionAgent,
+    TriageAgent,
+)
+from ensemble_phase_2_poc.agents.base_agent import BaseAgent
+from ensemble_phase_2_poc.state import NodeExecution, WorkflowState
+from ensemble_phase_2_poc.workflow import (
+    BatchResult,
+    LangGraphResponsesAgent,
+    BranchingAccountResolutionWorkflow,
+    Route,
+    SequentialAccountResolutionWorkflow,
+    build_dag,
+)
+
+
+def make_request(account_number: str) -> ResponsesAgentRequest:
+    return ResponsesAgentRequest(
+        input=[],
+        custom_inputs={
+            "account_number": account_number,
+            "client_name": "Acme Healthcare",
+            "facility_prefix": "FAC",
+            "lob": "Acute",
+        },
+    )
+
+
+@pytest.fixture
+def offline_agents():
+    """Replace every agent's LLM call with a canned answer"""
+
+    def research(self, prompt, state):
+        if state["account_number"] == "ACC-BAD":
+            raise RuntimeError("account lookup failed")
+        return f"summary for {state['account_number']}"
+
+    with patch.object(AccountResearchAgent, "execute", research), \
+         patch.object(TriageAgent, "execute", lambda self, prompt, state: "agent"), \
+         patch.object(ResolutionAgent, "execute", lambda self, prompt, state: "adjusted"), \
+         patch.object(AccountNoteAgent, "execute", lambda self, prompt, state: "noted"):
+        yield
+
+
+@pytest.fixture
+def offline_async_agents():
+    """Async counterpart of offline_agents, patching aexecute"""
+
+    async def research(self, prompt, state):
+        if state["account_number"] == "ACC-BAD":
+            raise RuntimeError("account lookup failed")
+        return f"summary for {state['account_number']}"
+
+    async def answer(value):
+        return value
+
+    with patch.object(AccountResearchAgent, "aexecute", research), \
+         patch.object(TriageAgent, "aexecute", lambda self, prompt, state: answer("human")), \
+         patch.object(ResolutionAgent, "aexecute", lambda self, prompt, state: answer("adjusted")), \
+         patch.object(AccountNoteAgent, "aexecute", lambda self, prompt, state: answer("noted")):
+        yield
+
+
+class TestPredictBatch:
+    """Test LangGraphResponsesAgent.predict_batch."""
+
+    @pytest.mark.parametrize(
+        "workflow_cls",
+        [SequentialAccountResolutionWorkflow, BranchingAccountResolutionWorkflow],
+    )
+    def test_results_keep_input_order(self, offline_agents, workflow_cls):
+        """Responses line up with the input requests regardless of completion order"""
+        requests = [make_request(f"ACC-{i}") for i in range(10)]
+        result = workflow_cls().predict_batch(requests, max_concurrency=4)
+
+        assert isinstance(result, BatchResult)
+        assert [r.custom_outputs["account_number"] for r in result.responses] == [
+            f"ACC-{i}" for i in range(10)
+        ]
+        assert result.num_failed == 0
+        assert result.throughput > 0
+
+    def test_failures_are_isolated(self, offline_agents):
+        """A failing request becomes an error record and does not abort the batch"""
+        requests = [make_request("ACC-1"), make_request("ACC-BAD"), make_request("ACC-2")]
+        result = BranchingAccountResolutionWorkflow().predict_batch(requests, max_concurrency=2)
+
+        assert result.num_succeeded == 2
+        assert result.num_failed == 1
+        failed = result.responses[1]
+        assert failed.error.code == "RuntimeError"
+        assert "account lookup failed" in failed.error.message
+        assert failed.custom_outputs["account_number"] == "ACC-BAD"
+        assert result.responses[2].custom_outputs["execution_path"][-1] == "account_note_agent"
+
+    @pytest.mark.parametrize("use_async", [False, True])
+    def test_adaptive_runs_each_request_in_a_slot(self, offline_agents, offline_async_agents, use_async):
+        """With `adaptive`, every request runs under the AIMD limit and reports its feedback"""
+        from ensemble_phase_2_poc.concurrency import AIMDController, AIMDPolicy
+
+        requests = [make_request(f"ACC-{i}") for i in range(6)]
+        workflow = SequentialAccountResolutionWorkflow()
+        with patch.object(AIMDController, "on_result", autospec=True) as on_result:
+            if use_async:
+                result = asyncio.run(workflow.apredict_batch(requests, max_concurrency=2, adaptive=AIMDPolicy()))
+            else:
+                result = workflow.predict_batch(requests, max_concurrency=2, adaptive=AIMDPolicy())
+
+        assert result.num_succeeded == 6
+        assert on_result.call_count == 6
+        assert on_result.call_args.args[0].policy.max_limit == 2
+
+    def test_invalid_concurrency(self):
+        """max_concurrency must be positive"""
+        with pytest.raises(ValueError):
+            SequentialAccountResolutionWorkflow().predict_batch([], max_concurrency=0)
+
+
+class TestAsyncPredict:
+    """Test the ainvoke-based execution path."""
+
+    def test_apredict_uses_async_nodes(self, offline_async_agents):
+        """apredict routes through each agent's aexecute"""
+        response = asyncio.run(BranchingAccountResolutionWorkflow().apredict(make_request("ACC-1")))
+        assert response.custom_outputs["execution_path"] == ["account_research_agent", "triage_agent"]
+        assert response.custom_outputs["node_outputs"]["account_research_agent"] == "summary for ACC-1"
+
+    def test_apredict_batch_isolates_failures(self, offline_async_agents):
+        """apredict_batch keeps input order and turns exceptions into error records"""
+        requests = [make_request("ACC-1"), make_request("ACC-BAD"), make_request("ACC-2")]
+        result = asyncio.run(
+            SequentialAccountResolutionWorkflow().apredict_batch(requests, max_concurrency=2)
+        )
+        assert [r.custom_outputs["account_number"] for r in result.responses] == [
+            "ACC-1", "ACC-BAD", "ACC-2"
+        ]
+        assert result.num_failed == 1
+        assert result.responses[1].error.code == "RuntimeError"
+
+    def test_default_aexecute_falls_back_to_execute(self):
+        """Agents without a native async implementation still work through __acall__"""
+
+        class SyncOnlyAgent(BaseAgent):
+            node_id = "sync_only_agent"
+
+            def render_prompt(self, state):
+                return f"prompt for {state['account_number']}"
+
+            def build_executor(self):
+                return self.build_agent()
+
+            def execute(self, prompt, state):
+                return prompt.upper()
+
+        state = WorkflowState(
+            node_outputs={},
+            execution_path=[],
+            account_number="ACC-3",
+            client_name="",
+            facility_prefix="",
+            lob="",
+        )
+        update = asyncio.run(SyncOnlyAgent().__acall__(state))
+        assert update["node_outputs"]["sync_only_agent"]["output"] == "PROMPT FOR ACC-3"
+        assert update["execution_path"] == ["sync_only_agent"]
+
+
+class StubNode:
+    """Minimal WorkflowNode: records which outputs it could see, after an optional delay"""
+
+    def __init__(self, node_id: str, depends_on: tuple[str, ...] = (), delay: float = 0.0):
+        self.node_id = node_id
+        self.depends_on = list(depends_on)
+        self.delay = delay
+
+    def __call__(self, state: WorkflowState) -> dict:
+        time.sleep(self.delay)
+        seen = ",".join(sorted(state["node_outputs"]))
+        return {
+            "node_outputs": {self.node_id: NodeExecution(node_id=self.node_id, input="", output=seen, metadata={})},
+            "execution_path": [self.node_id],
+        }
+
+    def as_node(self):
+        from langchain_core.runnables import RunnableLambda
+
+        return (self.node_id, RunnableLambda(self, name=self.node_id))
+
+
+def run_dag(nodes, routes=()) -> WorkflowState:
+    state = {
+        "node_outputs": {}, "execution_path": [],
+        "account_number": "ACC-1", "client_name": "", "facility_prefix": "", "lob": "",
+    }
+    return build_dag(nodes, routes).compile().invoke(state)
+
+
+class TestBuildDag:
+    """Test graphs derived from depends_on."""
+
+    def test_independent_nodes_run_in_parallel(self):
+        """Siblings share a step, their outputs are merged, and a join waits for both"""
+        start = time.perf_counter()
+        state = run_dag([
+            StubNode("join", ("left", "right")),
+            StubNode("left", ("root",), delay=0.3),
+            StubNode("right", ("root",), delay=0.3),
+            StubNode("root"),
+        ])
+
+        assert time.perf_counter() - start < 0.55
+        assert set(state["node_outputs"]) == {"root", "left", "right", "join"}
+        assert state["node_outputs"]["join"]["output"] == "left,right,root"
+        assert state["execution_path"][0] == "root" and state["execution_path"][-1] == "join"
+        assert len(state["execution_path"]) == 4
+
+    def test_route_gates_its_targets(self):
+        nodes = [StubNode("triage"), StubNode("act", ("triage",)), StubNode("follow_up", ("act",))]
+        for decision, path in [("go", ["triage", "act", "follow_up"]), ("stop", ["triage"])]:
+            route = Route("triage", lambda state, decision=decision: decision, {"go": ("act",), "stop": ()})
+            assert run_dag(nodes, [route])["execution_path"] == path
+
+    @pytest.mark.parametrize(
+        "nodes, routes, message",
+        [
+            ([StubNode("a", ("b",)), StubNode("b", ("a",))], (), "cycle"),
+            ([StubNode("a", ("missing",))], (), "not in the workflow"),
+            ([StubNode("a"), StubNode("a")], (), "Duplicate"),
+            ([StubNode("a"), StubNode("b")], [Route("a", lambda state: "x", {"x": ("c",)})], "not in the workflow"),
+            (
+                # b would be triggered by the route before c is guaranteed to have run
+                [StubNode("a"), StubNode("c"), StubNode("b", ("c",))],
+                [Route("a", lambda state: "x", {"x": ("b",)})],
+                "may not have run",
+            ),
+        ],
+    )
+    def test_invalid_graphs_fail_at_build_time(self, nodes, routes, message):
+        with pytest.raises(ValueError, match=message):
+            build_dag(nodes, routes)
+
+    def test_unknown_route_key(self):
+        route = Route("a", lambda state: "maybe", {"yes": ("b",)})
+        with pytest.raises(ValueError, match="unknown key"):
+            run_dag([StubNode("a"), StubNode("b", ("a",))], [route])
+
+    def test_nodes_are_required(self):
+        """A DAGWorkflow without nodes() can't be instantiated"""
+        from ensemble_phase_2_poc.workflow import DAGWorkflow
+
+        class EmptyWorkflow(DAGWorkflow):
+            pass
+
+        with pytest.raises(TypeError, match="nodes"):
+            EmptyWorkflow()
+
+
+class TestPredictStream:
+    """Test per-node streaming."""
+
+    def test_one_event_per_node_then_completed(self, offline_agents):
+        """Each node emits an output_item.done event in execution order, followed by response.completed"""
+        events = list(SequentialAccountResolutionWorkflow().predict_stream(make_request("ACC-1")))
+
+        node_events = [e for e in events if e.type == "response.output_item.done"]
+        assert [e.custom_outputs["node_id"] for e in node_events] == [
+            "account_research_agent", "resolution_agent", "account_note_agent"
+        ]
+        assert node_events[0].item["id"] == "account_research_agent"
+        assert node_events[0].item["content"][0]["text"] == "summary for ACC-1"
+        assert events[-1].type == "response.completed"
+        assert events[-1].custom_outputs["execution_path"] == [
+            "account_research_agent", "resolution_agent", "account_note_agent"
+        ]
+
+    def test_triage_decision_streamed(self, offline_agents):
+        """The branching workflow surfaces the triage decision on the triage node's event"""
+        events = BranchingAccountResolutionWorkflow().predict_stream(make_request("ACC-1"))
+        for event in events:
+            if event.custom_outputs.get("node_id") == "triage_agent":
+                assert event.custom_outputs["triage_decision"] == "agent"
+                break
+        else:
+            pytest.fail("no triage event streamed")
+
+    def test_closing_stream_stops_remaining_nodes(self, offline_agents):
+        """Abandoning the generator after triage means later nodes never execute"""
+        with patch.object(ResolutionAgent, "execute") as resolution_execute:
+            events = BranchingAccountResolutionWorkflow().predict_stream(make_request("ACC-1"))
+            for event in events:
+                if event.custom_outputs.get("triage_decision"):
+                    events.close()
+                    break
+            resolution_execute.assert_not_called()
+
+    def test_stream_records_workflow_metrics(self, offline_agents):
+        """Streamed runs count toward workflow latency; closing early is not a failure"""
+        from ensemble_phase_2_poc.metrics import WORKFLOW_DURATION, WORKFLOW_FAILURES, WORKFLOWS_IN_FLIGHT
+
+        name = "SequentialAccountResolutionWorkflow"
+        runs, failures = sum(WORKFLOW_DURATION.labels(name).counts), WORKFLOW_FAILURES.labels(name).value
+        list(SequentialAccountResolutionWorkflow().predict_stream(make_request("ACC-1")))
+        events = SequentialAccountResolutionWorkflow().predict_stream(make_request("ACC-2"))
+        next(events)
+        assert WORKFLOWS_IN_FLIGHT.labels(name).value == 1
+        events.close()
+
+        assert sum(WORKFLOW_DURATION.labels(name).counts) == runs + 2
+        assert WORKFLOW_FAILURES.labels(name).value == failures
+        assert WORKFLOWS_IN_FLIGHT.labels(name).value == 0
+
+
+class TestCompiledGraphCache:
+    """Test the process-wide compiled graph cache."""
+
+    def test_instances_share_compiled_graph(self):
+        """Two instances of the same workflow class reuse one compiled graph"""
+        assert SequentialAccountResolutionWorkflow().agent is SequentialAccountResolutionWorkflow().agent
+        assert SequentialAccountResolutionWorkflow().agent is not BranchingAccountResolutionWorkflow().agent
+
+    def test_compiles_exactly_once_under_contention(self):
+        """Concurrent first access builds the graph once"""
+
+        class CountingWorkflow(SequentialAccountResolutionWorkflow):
+            builds = 0
+
+            def build_workflow(self):
+                type(self).builds += 1
+                return super().build_workflow()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            graphs = list(executor.map(lambda _: CountingWorkflow().agent, range(32)))
+
+        assert CountingWorkflow.builds == 1
+        assert all(graph is graphs[0] for graph in graphs)
+
+    def test_cache_key_separates_configurations(self):
+        """Instances with a different graph_cache_key() get their own graph"""
+
+        class ConfiguredWorkflow(SequentialAccountResolutionWorkflow):
+            def __init__(self, variant: str):
+                self.variant = variant
+
+            def graph_cache_key(self):
+                return (self.variant,)
+
+        assert ConfiguredWorkflow("a").agent is ConfiguredWorkflow("a").agent
+        assert ConfiguredWorkflow("a").agent is not ConfiguredWorkflow("b").agent
+
+    def test_clear_graph_cache(self):
+        """clear_graph_cache() forces the next access to recompile"""
+        before = SequentialAccountResolutionWorkflow().agent
+        SequentialAccountResolutionWorkflow.clear_graph_cache()
+        assert SequentialAccountResolutionWorkflow().agent is not before
+        LangGraphResponsesAgent.clear_graph_cache()
+
+
+class TestUsageSummary:
+    """Test the aggregated latency and token breakdown in custom_outputs."""
+
+    def test_usage_covers_every_node(self, offline_agents):
+        """Totals are sums over the per-node entries, one per executed node"""
+        response = BranchingAccountResolutionWorkflow().predict(make_request("ACC-1"))
+        usage = response.custom_outputs["usage"]
+
+        assert list(usage["nodes"]) == response.custom_outputs["execution_path"]
+        assert usage["llm_calls"] == 0
+        assert usage["wall_time_seconds"] == pytest.approx(
+            sum(node["wall_time_seconds"] for node in usage["nodes"].values())
+        )
+
+
+class TestSpeculativeResolution:
+    """Test resolution running speculatively alongside triage."""
+
+    @pytest.fixture
+    def simulated_model(self, monkeypatch):
+        from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+
+        monkeypatch.setenv("COHERE_API_KEY", "test-key")
+        model = SimulatedChatModel(
+            model="command-a-03-2025", latency_distribution="fixed", latency_mean_ms=0, seed=0
+        )
+        with patch("ensemble_phase_2_poc.agents.base_agent.ChatFactory.get_model", return_value=model):
+            yield model
+
+    def test_hit_keeps_resolution(self, offline_agents):
+        """On "agent", resolution's output is kept and the note follows it"""
+        workflow = BranchingAccountResolutionWorkflow(speculative=True)
+        response = workflow.predict(make_request("ACC-1"))
+
+        assert workflow.agent is not BranchingAccountResolutionWorkflow(speculative=False).agent
+        assert response.custom_outputs["execution_path"] == [
+            "account_research_agent", "triage_agent", "resolution_agent", "account_note_agent"
+        ]
+        assert response.custom_outputs["node_outputs"]["resolution_agent"] == "adjusted"
+        assert response.custom_outputs["speculation"]["outcome"] == "hit"
+        assert response.custom_outputs["speculation"]["wasted_llm_calls"] == 0
+
+    def test_env_var_enables_speculation(self, monkeypatch):
+        monkeypatch.setenv("ENSEMBLE_SPECULATIVE_RESOLUTION", "1")
+        assert BranchingAccountResolutionWorkflow().speculative
+        assert not BranchingAccountResolutionWorkflow(speculative=False).speculative
+
+    def test_miss_never_posts_adjustment(self, simulated_model):
+        """On "human", the held adjustment is aborted and the spent LLM call is reported as waste"""
+        from ensemble_phase_2_poc.speculation import SPECULATION_HELD_TOOLS, Speculation, SpeculationAborted
+        from ensemble_phase_2_poc.tools import PostContractualAdjustment
+
+        held = SPECULATION_HELD_TOOLS.labels("post_contractual_adjustment")
+        held_before = held.value
+        discarded = []
+        original_discard = Speculation.discard
+
+        def triage(self, prompt, state):
+            # Decide only once resolution is waiting on its adjustment
+            while held.value == held_before:
+                time.sleep(0.01)
+            return "human"
+
+        def discard(self):
+            discarded.append(self)
+            original_discard(self)
+
+        with patch.object(AccountResearchAgent, "execute", lambda self, prompt, state: "summary"), \
+             patch.object(TriageAgent, "execute", triage), \
+             patch.object(Speculation, "discard", discard), \
+             patch.object(PostContractualAdjustment, "_execute") as post:
+            response = BranchingAccountResolutionWorkflow(speculative=True).predict(make_request("ACC-1"))
+            assert isinstance(discarded[0]._future.exception(timeout=5), SpeculationAborted)
+
+        post.assert_not_called()
+        assert response.custom_outputs["execution_path"] == ["account_research_agent", "triage_agent"]
+        speculation = response.custom_outputs["speculation"]
+        assert speculation["outcome"] == "miss"
+        assert speculation["wasted_llm_calls"] == 1
+        assert speculation["wasted_cost"] > 0
+
+    def test_miss_counts_call_in_flight(self, monkeypatch):
+        """A resolution call still running when triage says "human" is reported as waste once it returns"""
+        from ensemble_phase_2_poc.inference.simulated import SimulatedChatModel
+        from ensemble_phase_2_poc.speculation import SPECULATION_WASTED_TOKENS, Speculation
+
+        monkeypatch.setenv("COHERE_API_KEY", "test-key")
+        model = SimulatedChatModel(model="command-a-03-2025", latency_distribution="fixed", latency_mean_ms=300)
+        wasted_tokens = SPECULATION_WASTED_TOKENS.labels("resolution_agent", "input")
+        wasted_before = wasted_tokens.value
+        started = []
+        original_start = Speculation.start
+
+        def start(self, node, state):
+            started.append(self)
+            return original_start(self, node, state)
+
+        def triage(self, prompt, state):
+            # Decide while resolution's first LLM call is in flight
+            while not started or started[0].usage.llm_calls == 0:
+                time.sleep(0.01)
+            return "human"
+
+        with patch("ensemble_phase_2_poc.agents.base_agent.ChatFactory.get_model", return_value=model), \
+             patch.object(AccountResearchAgent, "execute", lambda self, prompt, state: "summary"), \
+             patch.object(TriageAgent, "execute", triage), \
+             patch.object(Speculation, "start", start):
+            response = BranchingAccountResolutionWorkflow(speculative=True).predict(make_request("ACC-1"))
+
+        speculation = response.custom_outputs["speculation"]
+        assert speculation["outcome"] == "miss"
+        assert speculation["wasted_llm_calls"] == 1
+        assert speculation["wasted_input_tokens"] > 0 and speculation["wasted_cost"] > 0
+        assert wasted_tokens.value == wasted_before + speculation["wasted_input_tokens"]
+
+    def test_triage_error_is_not_a_miss(self, offline_agents):
+        """A failed triage discards the speculation under its own outcome, without counting waste"""
+        from ensemble_phase_2_poc.speculation import SPECULATIONS, SPECULATION_WASTED_CALLS
+
+        outcomes = {outcome: SPECULATIONS.labels("resolution_agent", outcome) for outcome in ("miss", "error")}
+        before = {outcome: counter.value for outcome, counter in outcomes.items()}
+        wasted = SPECULATION_WASTED_CALLS.labels("resolution_agent").value
+
+        def triage(self, prompt, state):
+            raise RuntimeError("triage failed")
+
+        with patch.object(TriageAgent, "execute", triage):
+            response = BranchingAccountResolutionWorkflow(speculative=True)._predict_or_error(make_request("ACC-1"))
+
+        assert response.error.code == "RuntimeError"
+        assert outcomes["error"].value == before["error"] + 1
+        assert outcomes["miss"].value == before["miss"]
+        assert SPECULATION_WASTED_CALLS.labels("resolution_agent").value == wasted
+
+    def test_async_miss_cancels_resolution(self, offline_async_agents):
+        """Under apredict the speculative resolution task is cancelled on "human\""""
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def resolution(self, prompt, state):
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def triage(self, prompt, state):
+            await started.wait()
+            return "human"
+
+        async def run():
+            response = await BranchingAccountResolutionWorkflow(speculative=True).apredict(make_request("ACC-1"))
+            await asyncio.wait_for(cancelled.wait(), timeout=5)
+            return response
+
+        with patch.object(ResolutionAgent, "aexecute", resolution), patch.object(TriageAgent, "aexecute", triage):
+            response = asyncio.run(run())
+
+        assert response.custom_outputs["execution_path"] == ["account_research_agent", "triage_agent"]
+        assert response.custom_outputs["speculation"]["outcome"] == "miss"
+
+    def test_report_aggregates_outcomes(self):
+        from ensemble_phase_2_poc.speculation import SpeculationReport
+
+        report = SpeculationReport()
+        report.observe({"speculation": {
+            "outcome": "hit", "wasted_llm_calls": 0, "wasted_input_tokens": 0,
+            "wasted_output_tokens": 0, "wasted_cost": 0.0,
+        }})
+        report.observe({"speculation": {
+            "outcome": "miss", "wasted_llm_calls": 1, "wasted_input_tokens": 100,
+            "wasted_output_tokens": 20, "wasted_cost": 0.001,
+        }})
+        report.observe({"execution_path": []})
+
+        assert report.as_dict() == {
+            "speculated": 2, "hits": 1, "misses": 1, "hit_rate": 0.5,
+            "wasted_llm_calls": 1, "wasted_input_tokens": 100, "wasted_output_tokens": 20, "wasted_cost": 0.001,
+        }